@@ -0,0 +1,12 @@
+"""
+Asynchronous Server Gateway Interface (ASGI) entry point
+
+Run with an ASGI server, for example:
+    SERVER_MODE=asgi gunicorn asgi:app
+which runs it on uvicorn workers, see gunicorn.conf.py
+"""
+
+from service import create_app
+from service.asgi import AsyncInventoryApp
+
+app = AsyncInventoryApp(create_app())
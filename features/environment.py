@@ -13,6 +13,7 @@ from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.firefox import GeckoDriverManager
 from wsgi import app
 from service.models import db, Inventory
+from service.common.cache import cache
 from tests.factories import InventoryFactory
 
 # Database URI for testing
@@ -74,6 +75,7 @@ def before_scenario(context, scenario):
     # Clean up the database
     db.session.query(Inventory).delete()
     db.session.commit()
+    cache.clear()
 
     # Create a test product for testing
     test_product = InventoryFactory(
@@ -90,6 +92,7 @@ def after_scenario(context, scenario):
     # Clean up the database
     db.session.query(Inventory).delete()
     db.session.commit()
+    cache.clear()
 
 
 def after_all(context):
@@ -0,0 +1,196 @@
+"""
+Gunicorn Configuration
+
+gunicorn reads this file from the working directory, so both serving modes
+use it:
+
+    gunicorn wsgi:app                  # sync Flask app on gthread workers
+    SERVER_MODE=asgi gunicorn asgi:app # ASGI app on uvicorn workers
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so they share its memory copy-on-write and start without
+importing Flask and SQLAlchemy again. The worker count is derived from the
+container's CPU quota rather than the host's CPU count.
+
+Every setting can be overridden with the environment variables below or on
+the command line.
+"""
+
+import gc
+import os
+import math
+import tempfile
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Where the workers share their metrics when METRICS_DIR isn't set, on tmpfs
+# so the snapshot every worker writes each second never touches the disk
+METRICS_TMPFS = "/dev/shm/inventory-metrics"
+
+
+def cpu_limit(cgroup_root: str = CGROUP_ROOT) -> float:
+    """Returns the CPUs this process may use, from its cgroup quota if it has one"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open(os.path.join(cgroup_root, "cpu.max"), encoding="utf-8") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: a quota of -1 means unlimited
+        with open(
+            os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us"), encoding="utf-8"
+        ) as file:
+            quota = int(file.read())
+        with open(
+            os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us"), encoding="utf-8"
+        ) as file:
+            period = int(file.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return float(len(os.sched_getaffinity(0)))
+
+
+def default_workers(cpus: float) -> int:
+    """Returns the usual 2 x CPUs + 1 workers, but only 1 below a whole CPU"""
+    return max(1, math.floor(2 * cpus + 1)) if cpus >= 1 else 1
+
+
+######################################################################
+# Settings
+######################################################################
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+workers = int(
+    os.getenv("GUNICORN_WORKERS")
+    or os.getenv("WEB_CONCURRENCY")
+    or default_workers(cpu_limit())
+)
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+if os.getenv("SERVER_MODE") == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    worker_class = "gthread" if threads > 1 else "sync"
+
+# Recycle workers now and then so slow leaks can't build up, with jitter so
+# they don't all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Heartbeat files on tmpfs, a slow disk can make gunicorn kill idle workers
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+######################################################################
+# Server hooks
+######################################################################
+def default_metrics_dir() -> str:
+    """Returns METRICS_TMPFS, or a directory under /tmp without /dev/shm"""
+    if os.path.isdir(os.path.dirname(METRICS_TMPFS)):
+        return METRICS_TMPFS
+    return os.path.join(tempfile.gettempdir(), "inventory-metrics")
+
+
+def on_starting(server):
+    """Picks METRICS_DIR and removes the metrics an earlier run left there
+
+    With more than one worker each has its own metrics, so without a shared
+    directory /metrics would only show the worker that answered. The master
+    sets METRICS_DIR before any worker starts, and sets the registry too in
+    case it has already preloaded the app. The pids of an earlier run are
+    gone, so nothing would ever drop their gauges.
+    """
+    # pylint: disable=import-outside-toplevel
+    from service.common.metrics import registry
+
+    directory = registry.directory or os.getenv("METRICS_DIR")
+    if not directory and server.cfg.workers > 1:
+        directory = default_metrics_dir()
+    if not directory:
+        return
+    os.environ["METRICS_DIR"] = directory
+    os.makedirs(directory, exist_ok=True)
+    # Only the workers serve requests, a preloaded master stops writing
+    registry.directory = directory
+    registry.stop()
+    registry.clear()
+
+
+def flask_app(server):
+    """Returns the Flask app that the master preloaded, or None"""
+    if not server.cfg.preload_app:
+        return None
+    app = server.app.wsgi()
+    # asgi:app wraps the Flask app
+    return getattr(app, "flask_app", app)
+
+
+def pre_fork(server, worker):  # pylint: disable=unused-argument
+    """Moves everything the master allocated out of the garbage collector's reach
+
+    Collections write to every object they visit, which would copy the
+    shared pages into each worker.
+    """
+    gc.freeze()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Drops the pooled connections inherited from the master
+
+    Two processes must never use the same connection. close=False leaves
+    the sockets to the master and just gives this worker fresh pools. The
+    metrics thread isn't inherited either, so the worker starts its own.
+    """
+    # pylint: disable=import-outside-toplevel
+    from service.common.metrics import registry
+
+    registry.start()
+    app = flask_app(server)
+    if app is None:
+        return
+    # pylint: disable=import-outside-toplevel
+    from service.models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    if "replicas" in app.extensions:
+        app.extensions["replicas"].dispose()
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """Lets the background tasks of a worker that is shutting down finish
+
+    The memory backend loses the tasks still queued when the process exits,
+    so they get up to TASK_STOP_TIMEOUT seconds to run. Then the worker
+    writes its metrics a last time, or the counts since its last snapshot
+    would be lost when max_requests recycles it.
+    """
+    # pylint: disable=import-outside-toplevel
+    from service.common.metrics import registry
+
+    app = getattr(worker, "wsgi", None)
+    app = getattr(app, "flask_app", app)
+    if app is not None and "tasks" in getattr(app, "extensions", {}):
+        app.extensions["tasks"].stop(app.config["TASK_STOP_TIMEOUT"])
+    registry.flush(force=True)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the gauges of a worker that exited from the shared metrics"""
+    # pylint: disable=import-outside-toplevel
+    from service.common.metrics import registry
+
+    registry.directory = registry.directory or os.getenv("METRICS_DIR")
+    registry.mark_process_dead(worker.pid)
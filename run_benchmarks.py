@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+REST API Benchmark Runner
+
+This script seeds the database with InventoryFactory rows and measures the
+throughput and p50/p99 latency of the main Inventory endpoints. Results are
+written as JSON and can be compared against a stored baseline so that
+performance regressions fail the run.
+
+Seeding recreates every table, so local runs use their own
+database, BENCHMARK_DATABASE_URI (default: sqlite:///benchmark.db), and
+refuse one that doesn't look like a scratch database.
+
+Examples:
+    python run_benchmarks.py --rows 100000 --requests 500
+    python run_benchmarks.py --compare benchmarks/baseline.json
+    python run_benchmarks.py --output benchmarks/baseline.json
+    python run_benchmarks.py --url http://localhost:8080 --concurrency 32
+    python run_benchmarks.py --startup 10 --benchmark startup
+    python run_benchmarks.py --serialize 20 --benchmark serialize_rows --benchmark serialize_jsonify
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SEED_BATCH_SIZE = 10000
+
+# Results can only be compared with a baseline that was run with the same
+CONFIG_KEYS = ("database", "url", "concurrency", "rows", "requests", "warmup")
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Run the Inventory REST API benchmarks"
+    )
+
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=10000,
+        help="Number of Inventory rows to seed (default: 10000)",
+    )
+
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=200,
+        help="Number of requests per benchmark (default: 200)",
+    )
+
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=20,
+        help="Number of unmeasured requests before each benchmark (default: 20)",
+    )
+
+    parser.add_argument(
+        "--benchmark",
+        action="append",
+        default=None,
+        help="Only run the named benchmark, may be repeated (default: all)",
+    )
+
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Write the JSON results to this file (default: stdout)",
+    )
+
+    parser.add_argument(
+        "--compare",
+        default=None,
+        help="Baseline JSON file to compare the results against",
+    )
+
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed fractional slowdown of p50 and throughput (default: 0.25)",
+    )
+
+    parser.add_argument(
+        "--p99-tolerance",
+        type=float,
+        default=1.0,
+        help="Allowed fractional slowdown of the noisier p99 (default: 1.0)",
+    )
+
+    parser.add_argument(
+        "--url",
+        default=None,
+        help="Benchmark a running server at this URL instead of the test client",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of concurrent clients when using --url (default: 1)",
+    )
+
+    parser.add_argument(
+        "--startup",
+        type=int,
+        default=0,
+        help="Number of cold starts of the app to time (default: 0)",
+    )
+
+    parser.add_argument(
+        "--serialize",
+        type=int,
+        default=0,
+        help="Number of times to encode every seeded row as JSON (default: 0)",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="Random seed so runs pick the same ids (default: 42)",
+    )
+
+    return parser.parse_args(argv)
+
+
+######################################################################
+# Statistics
+######################################################################
+def percentile(samples: list, fraction: float) -> float:
+    """Returns the value below which fraction of the sorted samples fall"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    """Returns throughput and latency percentiles in milliseconds"""
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, p99_tolerance: float
+) -> list:
+    """Returns a message for every benchmark that regressed against the baseline
+
+    Raises:
+        ValueError: if the baseline was run with a different configuration
+    """
+    mismatched = [
+        f"{key}={baseline.get(key)!r} (results: {results.get(key)!r})"
+        for key in CONFIG_KEYS
+        if results.get(key) != baseline.get(key)
+    ]
+    if mismatched:
+        raise ValueError(
+            "The baseline was run with a different configuration: "
+            + ", ".join(mismatched)
+        )
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        expected = baseline.get("benchmarks", {}).get(name)
+        if not expected:
+            continue
+        if result["p50_ms"] > expected["p50_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 {result['p50_ms']}ms > baseline {expected['p50_ms']}ms"
+            )
+        if result["p99_ms"] > expected["p99_ms"] * (1 + p99_tolerance):
+            regressions.append(
+                f"{name}: p99 {result['p99_ms']}ms > baseline {expected['p99_ms']}ms"
+            )
+        if result["throughput_rps"] < expected["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['throughput_rps']} req/s < baseline {expected['throughput_rps']} req/s"
+            )
+    return regressions
+
+
+######################################################################
+# Benchmarks
+######################################################################
+def benchmark_database_uri() -> str:
+    """Returns the database that local runs seed"""
+    return os.getenv("BENCHMARK_DATABASE_URI", "sqlite:///benchmark.db")
+
+
+def is_scratch_database(uri: str) -> bool:
+    """Returns True for SQLite and for databases with bench or test in their name"""
+    if uri.startswith("sqlite"):
+        return True
+    name = urllib.parse.urlsplit(uri).path.rsplit("/", 1)[-1].lower()
+    return "bench" in name or "test" in name
+
+
+def seed(rows: int) -> list:
+    """Recreates the tables of the scratch database with rows factory built records"""
+    # pylint: disable=import-outside-toplevel
+    from service.models import db, Inventory
+    from tests.factories import InventoryFactory
+
+    # A scratch database may still have the tables of an older version
+    db.drop_all()
+    db.create_all()
+    ids = []
+    for start in range(0, rows, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, rows - start)
+        ids.extend(
+            Inventory.bulk_create(
+                [item.columns() for item in InventoryFactory.build_batch(count)]
+            )
+        )
+    return ids
+
+
+def build_requests(ids: list, rng: random.Random) -> dict:
+    """Returns a function per benchmark that builds its next (method, url, body)"""
+    # pylint: disable=import-outside-toplevel
+    from tests.factories import InventoryFactory
+
+    return {
+        "list_inventory": lambda: (
+            "GET",
+            f"/inventory?limit=100&after={rng.choice(ids)}",
+            None,
+        ),
+        "get_inventory": lambda: ("GET", f"/inventory/{rng.choice(ids)}", None),
+        "create_inventory": lambda: (
+            "POST",
+            "/inventory",
+            InventoryFactory.build().serialize(),
+        ),
+        "update_stock": lambda: (
+            "PUT",
+            f"/inventory/{rng.choice(ids)}/restock_check",
+            {"quantity": rng.randint(0, 100)},
+        ),
+        "get_low_stock_alerts": lambda: ("GET", "/inventory/low-stock?limit=100", None),
+    }
+
+
+class HttpClient:  # pylint: disable=too-few-public-methods
+    """Minimal stand-in for the Flask test client that talks to a live server"""
+
+    class Response:  # pylint: disable=too-few-public-methods
+        """The parts of a response that the benchmarks look at"""
+
+        def __init__(self, status_code: int, body: bytes):
+            self.status_code = status_code
+            self.body = body
+
+        def get_json(self):
+            """Returns the decoded JSON body"""
+            return json.loads(self.body)
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def open(self, url: str, method: str = "GET", **kwargs):
+        """Sends one request with an optional json= body and returns its Response"""
+        body = kwargs.get("json")
+        data = None if body is None else json.dumps(body).encode()
+        req = urllib.request.Request(
+            self.base_url + url,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req) as response:
+                return self.Response(response.status, response.read())
+        except urllib.error.HTTPError as error:
+            return self.Response(error.code, error.read())
+
+
+def seed_over_http(client: HttpClient, rows: int) -> list:
+    """Seeds a running server through the bulk endpoint and returns the new ids"""
+    # pylint: disable=import-outside-toplevel
+    from tests.factories import InventoryFactory
+
+    ids = []
+    for start in range(0, rows, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, rows - start)
+        response = client.open(
+            "/inventory/bulk",
+            method="POST",
+            json=[item.serialize() for item in InventoryFactory.build_batch(count)],
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"Seeding returned {response.status_code}")
+        ids.extend(result["id"] for result in response.get_json() if "id" in result)
+    return ids
+
+
+def run_concurrent_benchmark(
+    client, next_request, count: int, warmup: int = 0, concurrency: int = 1
+) -> dict:
+    """Issues count requests spread over concurrency threads and summarizes them"""
+
+    def timed(request):
+        method, url, body = request
+        began = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+        return time.perf_counter() - began
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed, [next_request() for _ in range(warmup)]))
+        requests = [next_request() for _ in range(count)]
+        start = time.perf_counter()
+        latencies = list(executor.map(timed, requests))
+        return summarize(latencies, time.perf_counter() - start)
+
+
+def run_benchmark(client, next_request, count: int, warmup: int = 0) -> dict:
+    """Issues count requests after warmup unmeasured ones and summarizes their latencies"""
+    for _ in range(warmup):
+        method, url, body = next_request()
+        client.open(url, method=method, json=body)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        method, url, body = next_request()
+        began = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        latencies.append(time.perf_counter() - began)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_startup_benchmark(count: int, create_all: bool) -> dict:
+    """Times count cold starts of the WSGI app, each in a fresh interpreter"""
+    env = dict(
+        os.environ,
+        DB_CREATE_ALL=str(create_all).lower(),
+        DATABASE_URI=benchmark_database_uri(),
+    )
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        began = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import wsgi"], env=env, check=True)
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_serialize_benchmark(count: int, encode) -> dict:
+    """Times count calls of encode, which returns a JSON array of every row"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        began = time.perf_counter()
+        encode()
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main_serialize(args, results: dict):
+    """Adds the JSON encoding benchmarks of the seeded rows to results
+
+    serialize_rows encodes plain rows with the row serializer the list
+    endpoint uses, serialize_jsonify the ORM objects through serialize()
+    and jsonify the way the endpoint used to.
+    """
+    # pylint: disable=import-outside-toplevel
+    from flask import jsonify
+    from service.models import Inventory
+
+    columns, serializer = Inventory.projection()
+    rows = Inventory.query.with_entities(*columns).all()
+    items = Inventory.query.all()
+    encoders = {
+        "serialize_rows": lambda: serializer.many(rows),
+        "serialize_jsonify": lambda: jsonify([item.serialize() for item in items]),
+    }
+    for name, encode in encoders.items():
+        if args.benchmark and name not in args.benchmark:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results["benchmarks"][name] = run_serialize_benchmark(args.serialize, encode)
+    if {"serialize_rows", "serialize_jsonify"} <= results["benchmarks"].keys():
+        speedup = (
+            results["benchmarks"]["serialize_jsonify"]["p50_ms"]
+            / results["benchmarks"]["serialize_rows"]["p50_ms"]
+        )
+        encoder = "orjson" if serializer.use_orjson else "the template"
+        print(
+            f"Rows encode {speedup:.1f}x faster than jsonify with {encoder}",
+            file=sys.stderr,
+        )
+
+
+def main_startup(args, results: dict):
+    """Adds the cold start benchmarks to results"""
+    for name, create_all in (("startup", False), ("startup_create_all", True)):
+        if args.benchmark and name not in args.benchmark:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results["benchmarks"][name] = run_startup_benchmark(args.startup, create_all)
+
+
+def main_http(args, rng: random.Random) -> dict:
+    """Seeds and benchmarks the server at args.url with concurrent clients"""
+    client = HttpClient(args.url)
+    print(f"Seeding {args.rows} rows through {args.url}...", file=sys.stderr)
+    ids = seed_over_http(client, args.rows)
+    results = {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "rows": args.rows,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "benchmarks": {},
+    }
+    for name, next_request in build_requests(ids, rng).items():
+        if args.benchmark and name not in args.benchmark:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results["benchmarks"][name] = run_concurrent_benchmark(
+            client, next_request, args.requests, args.warmup, args.concurrency
+        )
+    return results
+
+
+def main_local(args, rng: random.Random) -> dict:
+    """Seeds the database and benchmarks the app with the Flask test client"""
+    uri = benchmark_database_uri()
+    if not is_scratch_database(uri):
+        raise SystemExit(
+            f"Refusing to seed {uri}, seeding drops every table. Point "
+            "BENCHMARK_DATABASE_URI at SQLite or a database named *bench* or *test*"
+        )
+    # Replaces DATABASE_URI, which may well point at a database worth keeping
+    os.environ["DATABASE_URI"] = uri
+    # pylint: disable=import-outside-toplevel
+    import logging
+    from wsgi import app
+
+    app.logger.setLevel(logging.CRITICAL)
+    with app.app_context():
+        print(f"Seeding {args.rows} rows...", file=sys.stderr)
+        ids = seed(args.rows)
+        client = app.test_client()
+        benchmarks = build_requests(ids, rng)
+        results = {
+            "database": app.config["SQLALCHEMY_DATABASE_URI"].split(":", 1)[0],
+            "rows": args.rows,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "benchmarks": {},
+        }
+        for name, next_request in benchmarks.items():
+            if args.benchmark and name not in args.benchmark:
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            results["benchmarks"][name] = run_benchmark(
+                client, next_request, args.requests, args.warmup
+            )
+        if args.serialize:
+            main_serialize(args, results)
+    return results
+
+
+def main(argv=None):
+    """Seeds the database, runs the benchmarks and reports the results"""
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    results = main_http(args, rng) if args.url else main_local(args, rng)
+    if args.startup:
+        main_startup(args, results)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        try:
+            regressions = compare(results, baseline, args.tolerance, args.p99_tolerance)
+        except ValueError as error:
+            print(f"ERROR {error}", file=sys.stderr)
+            return 2
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,7 +21,6 @@ and SQL database
 import sys
 from flask import Flask
 from service import config
-from service.common import log_handlers
 
 
 ############################################################
@@ -33,10 +32,23 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(config)
 
-    # Initialize Plugins
+    # Initialize Plugins, imported here so "import service" stays cheap
     # pylint: disable=import-outside-toplevel
+    from service.common import log_handlers, instrumentation, compression
     from service.models import db
+    from service.common.cache import cache
+    from service.common.db_pool import engine_options
+    from service.common.tasks import tasks
+    from service.common.health import health
+    from service.common.replicas import replicas
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
     db.init_app(app)
+    replicas.init_app(app)
+    cache.init_app(app)
+    tasks.init_app(app)
+    health.init_app(app)
+    instrumentation.init_instrumentation(app)
+    compression.init_compression(app)
 
     with app.app_context():
         # Dependencies require we import the routes AFTER the Flask app is created
@@ -44,12 +56,15 @@ def create_app():
         from service import routes, models  # noqa: F401 E402
         from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
-        try:
-            db.create_all()
-        except Exception as error:  # pylint: disable=broad-except
-            app.logger.critical("%s: Cannot continue", error)
-            # gunicorn requires exit code 4 to stop spawning workers when they die
-            sys.exit(4)
+        # In production the schema is created once by "flask db-migrate", so
+        # a booting worker doesn't wait on DDL round trips
+        if app.config["DB_CREATE_ALL"]:
+            try:
+                db.create_all()
+            except Exception as error:  # pylint: disable=broad-except
+                app.logger.critical("%s: Cannot continue", error)
+                # gunicorn requires exit code 4 to stop spawning workers when they die
+                sys.exit(4)
 
         # Set up logging for production
         log_handlers.init_logging(app, "gunicorn.error")
@@ -0,0 +1,477 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+ASGI Application
+
+Serves the Inventory API on an asyncio event loop. The hot read endpoints
+are answered with an async SQLAlchemy engine, so one worker keeps many
+database round trips in flight at once. Every other request is handed to
+the Flask application on a thread pool, so both serving modes expose the
+same API.
+
+The async engine is pooled by the same DB_* settings as the Flask engine
+and the async reads record the same request metrics and are compressed
+the same way. It only connects to the primary, so when DB_REPLICA_URIS is
+set the reads are left to Flask, which sends them to the replicas. They
+don't count towards query budgets or the slow and repeated query logs,
+which need a Flask request.
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from werkzeug.http import parse_accept_header
+from service.common import status
+from service.common.cache import cache
+from service.common.compression import COMPRESSED_RESPONSES
+from service.common.db_pool import async_engine_options
+from service.common.events import AsyncSubscriber, broker
+from service.common.instrumentation import (
+    REQUEST_SECONDS,
+    REQUESTS_IN_FLIGHT,
+    REQUESTS_TOTAL,
+)
+from service.models import db, Inventory, STOCK_JSON
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+    "postgresql+asyncpg": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url):
+    """Returns the SQLAlchemy URL with its driver swapped for an async one"""
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+class AsyncInventoryApp:
+    """ASGI application that serves the hot reads asynchronously
+
+    Args:
+        flask_app (Flask): the application from create_app() that serves the
+            rest of the API and provides the configuration
+        max_threads (int): threads available to run Flask requests
+    """
+
+    def __init__(self, flask_app, max_threads: int = None):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(
+            max_threads or flask_app.config.get("ASGI_MAX_THREADS", 8)
+        )
+        self.engine = None
+        # (path, handler, the endpoint of the Flask view it stands in for)
+        self.routes = [
+            (re.compile(r"^/inventory/events$"), self.stream_events, "inventory_events")
+        ]
+        if not flask_app.config.get("DB_REPLICA_URIS"):
+            self.routes += [
+                (
+                    re.compile(r"^/inventory/(\d+)$"),
+                    self.get_inventory,
+                    "get_inventory",
+                ),
+                (
+                    re.compile(r"^/inventory/stock$"),
+                    self.get_stock_levels,
+                    "get_stock_levels",
+                ),
+                (
+                    re.compile(r"^/inventory/low-stock$"),
+                    self.get_low_stock_alerts,
+                    "get_low_stock_alerts",
+                ),
+            ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if scope["method"] == "GET" and not scope.get("query_string"):
+            for pattern, handler, endpoint in self.routes:
+                match = pattern.match(scope["path"])
+                if match:
+                    await self.observe(
+                        endpoint, handler, scope, receive, send, *match.groups()
+                    )
+                    return
+        await self.call_flask(scope, receive, send)
+
+    async def observe(
+        self, endpoint, handler, scope, receive, send, *args
+    ):  # pylint: disable=too-many-arguments
+        """Runs handler and records the request metrics Flask records for endpoint"""
+        response = {"status": status.HTTP_500_INTERNAL_SERVER_ERROR}
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await handler(scope, receive, send_and_record, *args)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, method="GET", endpoint=endpoint
+            )
+            REQUESTS_TOTAL.inc(
+                method="GET", endpoint=endpoint, status=response["status"]
+            )
+
+    def encode(self, scope, body: bytes, headers=(), strong_etag: bool = False):
+        """Compresses body like the Flask responses are, returns (body, headers)
+
+        Args:
+            strong_etag (bool): keep the ETag strong, like the views marked
+                with compression.strong_etag
+        """
+        headers = list(headers)
+        compressor = self.flask_app.extensions.get("compression")
+        if compressor is None:
+            return body, headers
+        headers.append((b"vary", b"Accept-Encoding"))
+        accept = dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1")
+        encoding = parse_accept_header(accept).best_match(compressor.encodings)
+        if encoding is None or len(body) < compressor.min_size:
+            return body, headers
+        COMPRESSED_RESPONSES.inc(encoding=encoding, cache="none")
+        if not strong_etag:
+            headers = [
+                (name, b"W/" + value if name == b"etag" else value)
+                for name, value in headers
+            ]
+        headers.append((b"content-encoding", encoding.encode()))
+        return compressor.compress(body, encoding), headers
+
+    ######################################################################
+    # Lifespan
+    ######################################################################
+    async def startup(self):
+        """Creates the async engine that mirrors the Flask engine"""
+        # pylint: disable=import-outside-toplevel
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        uri = self.flask_app.config.get("ASYNC_DATABASE_URI")
+        if not uri:
+            with self.flask_app.app_context():
+                uri = async_database_url(db.engine.url)
+        self.engine = create_async_engine(
+            uri, **async_engine_options(self.flask_app.config, uri)
+        )
+
+    async def shutdown(self):
+        """Closes every pooled connection"""
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+        self.executor.shutdown(wait=False)
+
+    async def lifespan(self, receive, send):
+        """Handles the ASGI lifespan protocol"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    ######################################################################
+    # Async endpoints
+    ######################################################################
+    async def fetch(self, statement):
+        """Runs a statement on the async engine and returns every row"""
+        if self.engine is None:
+            await self.startup()
+        async with self.engine.connect() as conn:
+            return (await conn.execute(statement)).all()
+
+    async def get_inventory(
+        self, scope, receive, send, inventory_id
+    ):  # pylint: disable=unused-argument
+        """Returns a single Inventory, reading through the cache if it is shared
+
+        Like the Flask endpoint, the ETag is the revision of the Inventory,
+        and it stays strong when the body is compressed.
+        """
+        inventory_id = int(inventory_id)
+        data = cache.get(inventory_id) if cache.shared else None
+        if data is None:
+            table = Inventory.__table__
+            rows = await self.fetch(select(table).where(table.c.id == inventory_id))
+            if not rows:
+                message = (
+                    f"404 Not Found: Inventory with id '{inventory_id}' was not found."
+                )
+                await send_json(
+                    send,
+                    {
+                        "status": status.HTTP_404_NOT_FOUND,
+                        "error": "Not Found",
+                        "message": message,
+                    },
+                    status.HTTP_404_NOT_FOUND,
+                )
+                return
+            data = Inventory(**rows[0]._asdict()).serialize()
+            if cache.shared:
+                cache.set(inventory_id, data)
+        headers = [(b"etag", f'"{data["revision"]}"'.encode())]
+        if not_modified(scope, str(data["revision"])):
+            await send_not_modified(send, headers)
+            return
+        body, headers = self.encode(
+            scope, json.dumps(data).encode(), headers, strong_etag=True
+        )
+        await send_bytes(send, body, headers=headers)
+
+    async def get_stock_levels(
+        self, scope, receive, send
+    ):  # pylint: disable=unused-argument
+        """Returns the stock level of every Inventory, honoring If-None-Match"""
+        etag = str((await self.fetch(Inventory.latest_revision_query()))[0][0])
+        headers = [(b"etag", f'"{etag}"'.encode())]
+        if not_modified(scope, etag):
+            await send_not_modified(send, headers)
+            return
+        rows = await self.fetch(Inventory.stock_levels_query())
+        body, headers = self.encode(scope, STOCK_JSON.many(rows), headers)
+        await send_bytes(send, body, headers=headers)
+
+    async def get_low_stock_alerts(
+        self, scope, receive, send
+    ):  # pylint: disable=unused-argument
+        """Returns every Inventory below its restock level"""
+        statement = (
+            select(Inventory.id, Inventory.quantity, Inventory.restock_level)
+            .where(Inventory.quantity < Inventory.restock_level)
+            .order_by(Inventory.id)
+        )
+        alerts = [
+            {
+                "product_id": row.id,
+                "quantity": row.quantity,
+                "restock_level": row.restock_level,
+                "alert_status": "Alert! Product is Low Stock",
+            }
+            for row in await self.fetch(statement)
+        ]
+        body, headers = self.encode(scope, json.dumps(alerts).encode())
+        await send_bytes(send, body, headers=headers)
+
+    async def stream_events(self, scope, receive, send):
+        """Streams the event broker as Server-Sent Events on the event loop
+
+        Unlike the Flask endpoint, a connected client costs no thread here,
+        so only EVENTS_MAX_SUBSCRIBERS limits them.
+        """
+        last_event_id = dict(scope["headers"]).get(b"last-event-id", b"")
+        subscriber = broker.subscribe(
+            int(last_event_id) if last_event_id.isdigit() else None,
+            AsyncSubscriber,
+            self.flask_app.config.get("EVENTS_MAX_SUBSCRIBERS", 100),
+        )
+        if subscriber is None:
+            body = json.dumps(
+                {
+                    "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "error": "Service Unavailable",
+                    "message": "Too many event subscribers, try again later",
+                }
+            ).encode()
+            await send_bytes(
+                send,
+                body,
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                [(b"retry-after", b"30")],
+            )
+            return
+        keepalive = self.flask_app.config.get("EVENTS_KEEPALIVE", 15)
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            subscriber.closed = True
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": status.HTTP_200_OK,
+                    "headers": [
+                        (b"content-type", b"text/event-stream; charset=utf-8"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no"),
+                    ],
+                }
+            )
+            frame = "retry: 3000\n\n"
+            while not subscriber.closed:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": frame.encode(),
+                        "more_body": True,
+                    }
+                )
+                frame = await subscriber.get(keepalive) or ": keepalive\n\n"
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            broker.unsubscribe(subscriber)
+
+    ######################################################################
+    # Flask bridge
+    ######################################################################
+    async def call_flask(self, scope, receive, send):
+        """Runs a request through the Flask application on the thread pool"""
+        body = bytearray()
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.extend(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        loop = asyncio.get_running_loop()
+        response = {}
+
+        def start_response(
+            status_line, headers, exc_info=None
+        ):  # pylint: disable=unused-argument
+            response["status"] = int(status_line.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        def run():
+            return iter(
+                self.flask_app(wsgi_environ(scope, bytes(body)), start_response)
+            )
+
+        # Flask keeps the request context in context variables, so every step
+        # of the response has to run in the same context on the thread pool
+        context = contextvars.copy_context()
+        chunks = await loop.run_in_executor(self.executor, context.run, run)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response["status"],
+                "headers": response["headers"],
+            }
+        )
+        try:
+            # Pull one chunk at a time so streamed responses stay streamed
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, context.run, next, chunks, None
+                )
+                if chunk is None:
+                    break
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(chunks, "close"):
+                await loop.run_in_executor(self.executor, context.run, chunks.close)
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """Builds a PEP 3333 environ from an ASGI http scope"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def not_modified(scope, etag: str) -> bool:
+    """Returns True if the If-None-Match header of the request has etag"""
+    if_none_match = dict(scope["headers"]).get(b"if-none-match", b"").decode()
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return f'"{etag}"' in tags or "*" in tags
+
+
+async def send_not_modified(send, headers=()):
+    """Sends an empty 304 response"""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status.HTTP_304_NOT_MODIFIED,
+            "headers": list(headers),
+        }
+    )
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def send_bytes(send, body: bytes, code: int = status.HTTP_200_OK, headers=()):
+    """Sends a complete JSON response"""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, data, code: int = status.HTTP_200_OK):
+    """Encodes data and sends it as a JSON response"""
+    await send_bytes(send, json.dumps(data).encode(), code)
@@ -0,0 +1,178 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Read-through Cache
+
+This module contains a small cache with pluggable backends. The default
+backend is an in-process LRU with a TTL. A shared backend can be used
+instead by pointing CACHE_REDIS_URL at any client with the redis get,
+setex and delete calls.
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUBackend:
+    """In-process least recently used store whose entries expire after ttl seconds"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Stores value under key, evicting the least recently used entry"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Removes key if it is present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Removes every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedBackend:
+    """Store shared by every worker, backed by a redis style client"""
+
+    def __init__(self, client, ttl: float = 30.0, prefix: str = "inventory:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        """Returns the value for key, or None if it is missing or expired"""
+        value = self.client.get(self.prefix + str(key))
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        """Stores value under key for ttl seconds"""
+        self.client.setex(
+            self.prefix + str(key), max(int(self.ttl), 1), json.dumps(value)
+        )
+
+    def delete(self, key):
+        """Removes key if it is present"""
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        """Removes every entry with our prefix"""
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + "*"))
+
+
+class Cache:
+    """Read-through cache that counts its hits and misses"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or LRUBackend()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app, client=None):
+        """Selects the backend from the application configuration
+
+        Args:
+            app (Flask): the application to read CACHE_* settings from
+            client: an optional redis style client to use as the shared backend
+        """
+        ttl = app.config.get("CACHE_TTL", 30)
+        url = app.config.get("CACHE_REDIS_URL")
+        if client is None and url:
+            # pylint: disable=import-outside-toplevel
+            import redis  # optional dependency, only needed for a shared cache
+
+            client = redis.Redis.from_url(url)
+        if client is not None:
+            self.backend = SharedBackend(client, ttl)
+        else:
+            self.backend = LRUBackend(app.config.get("CACHE_MAX_SIZE", 10000), ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self) -> bool:
+        """Whether every worker reads the same entries, so a write clears them all
+
+        A write only clears the in-process LRU of the worker that made it,
+        the others serve their copy until it expires.
+        """
+        return isinstance(self.backend, SharedBackend)
+
+    def get(self, key):
+        """Returns the cached value for key and records a hit or a miss"""
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Caches value under key"""
+        self.backend.set(key, value)
+
+    def delete(self, key):
+        """Invalidates key"""
+        self.backend.delete(key)
+
+    def clear(self):
+        """Invalidates everything"""
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters"""
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.backend),
+        }
+
+
+# The cache used by the models, configured in create_app()
+cache = Cache()
@@ -16,8 +16,12 @@
 """
 Flask CLI Command Extensions
 """
+
+from datetime import datetime, timedelta
+import click
 from flask import current_app as app  # Import Flask application
-from service.models import db
+from service.models import db, Alert
+from service.common.migrations import upgrade
 
 
 ######################################################################
@@ -34,3 +38,42 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to bring the schema up to date without dropping anything
+# Usage:
+#   flask db-migrate
+######################################################################
+@app.cli.command("db-migrate")
+def db_migrate():
+    """
+    Adds the missing columns, tables and indexes, see
+    service/common/migrations.py. It never drops anything, so run it once
+    before every deployment.
+    """
+    changes = upgrade()
+    for change in changes:
+        click.echo(f"Added {change}")
+    click.echo("Database schema is up to date")
+
+
+######################################################################
+# Command to purge old resolved alerts
+# Usage:
+#   flask alerts-purge [--days 30] [--batch-size 1000]
+######################################################################
+@app.cli.command("alerts-purge")
+@click.option("--days", type=int, default=None, help="Retention in days")
+@click.option("--batch-size", type=int, default=None, help="Alerts per transaction")
+def alerts_purge(days, batch_size):
+    """
+    Deletes resolved alerts created more than ALERT_RETENTION_DAYS ago, in
+    batches of ALERT_PURGE_BATCH so it can run against a live database.
+    Open alerts are never deleted.
+    """
+    days = app.config["ALERT_RETENTION_DAYS"] if days is None else days
+    batch_size = batch_size or app.config["ALERT_PURGE_BATCH"]
+    before = datetime.utcnow() - timedelta(days=days)
+    deleted = Alert.purge(before, batch_size)
+    click.echo(f"Purged {deleted} alerts created before {before.isoformat()}")
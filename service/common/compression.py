@@ -0,0 +1,195 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Response Compression
+
+This module compresses JSON and text responses with the best encoding the
+client accepts: brotli when the brotli package is installed, otherwise
+gzip. Bodies smaller than COMPRESSION_MIN_SIZE are sent as is, because
+the headers would cost more than compression saves.
+
+Streamed responses are compressed chunk by chunk as they are sent. The
+compressed body of a response with an ETag is kept in a small LRU keyed by
+its URL, ETag and encoding, so an unchanged list is only compressed once.
+A compressed response's ETag is made weak: its bytes differ from the
+uncompressed body, which a strong ETag would promise to be identical.
+Views decorated with strong_etag keep theirs strong, because clients send
+it back in If-Match, which only uses the strong comparison. Their ETag is
+the revision of a resource and names its data in any content coding.
+"""
+
+import zlib
+from flask import current_app, request
+from service.common.cache import LRUBackend
+from service.common.metrics import registry
+
+try:
+    import brotli  # optional dependency, only needed for Content-Encoding: br
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "text/")
+# Server-Sent Events must reach the client frame by frame
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+COMPRESSED_RESPONSES = registry.counter(
+    "http_compressed_responses_total",
+    "Responses sent compressed, by encoding and compressed body cache result",
+    ["encoding", "cache"],
+)
+COMPRESSION_BYTES = registry.counter(
+    "http_compression_bytes_total",
+    "Bytes of buffered bodies before and after compression",
+    ["stage"],
+)
+
+
+class Compressor:
+    """Compresses responses with gzip or brotli
+
+    Args:
+        min_size (int): smallest buffered body worth compressing, in bytes
+        gzip_level (int): zlib compression level from 1 to 9
+        brotli_quality (int): brotli quality from 0 to 11
+        cache_size (int): compressed bodies to keep, 0 disables the cache
+    """
+
+    def __init__(
+        self,
+        min_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        cache_size: int = 64,
+    ):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        self.cache = LRUBackend(cache_size, float("inf")) if cache_size else None
+
+    def compressobj(self, encoding: str):
+        """Returns a streaming compressor with compress() and flush()"""
+        if encoding == "br":
+            return BrotliStream(self.brotli_quality)
+        # wbits 16 + MAX_WBITS writes the gzip header and trailer
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """Compresses a complete body"""
+        stream = self.compressobj(encoding)
+        return stream.compress(data) + stream.flush()
+
+    def stream(self, chunks, encoding: str):
+        """Yields the compressed form of a streamed body as it is produced"""
+        stream = self.compressobj(encoding)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            compressed = stream.compress(chunk)
+            if compressed:
+                yield compressed
+        yield stream.flush()
+
+    def after_request(self, response):
+        """Compresses response if the client accepts one of the encodings"""
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)
+            or response.mimetype in UNCOMPRESSED_TYPES
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+            COMPRESSED_RESPONSES.inc(encoding=encoding, cache="stream")
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(self.cached_compress(response, data, encoding))
+            COMPRESSION_BYTES.inc(len(data), stage="in")
+            COMPRESSION_BYTES.inc(response.content_length, stage="out")
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak and self.weakens_etag():
+            response.set_etag(etag, weak=True)
+        return response
+
+    def weakens_etag(self) -> bool:
+        """Whether the ETag of the current request's response is made weak"""
+        view = current_app.view_functions.get(request.endpoint)
+        return not getattr(view, "strong_etag", False)
+
+    def cached_compress(self, response, data: bytes, encoding: str) -> bytes:
+        """Compresses data, reusing the last result for the same URL and ETag"""
+        etag, _ = response.get_etag()
+        if etag is None or self.cache is None or response.status_code != 200:
+            COMPRESSED_RESPONSES.inc(encoding=encoding, cache="none")
+            return self.compress(data, encoding)
+        key = (request.full_path, etag, encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            COMPRESSED_RESPONSES.inc(encoding=encoding, cache="miss")
+            compressed = self.compress(data, encoding)
+            self.cache.set(key, compressed)
+        else:
+            COMPRESSED_RESPONSES.inc(encoding=encoding, cache="hit")
+        return compressed
+
+
+class BrotliStream:
+    """Gives a brotli Compressor the compress() and flush() calls of zlib"""
+
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compresses more of the body"""
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        """Finishes the body"""
+        return self.compressor.finish()
+
+
+def init_compression(app):
+    """Compresses the responses of app as configured by its COMPRESSION_* settings"""
+    if not app.config.get("COMPRESSION_ENABLED", True):
+        return None
+    compressor = Compressor(
+        min_size=app.config.get("COMPRESSION_MIN_SIZE", 1024),
+        gzip_level=app.config.get("COMPRESSION_GZIP_LEVEL", 6),
+        brotli_quality=app.config.get("COMPRESSION_BROTLI_QUALITY", 4),
+        cache_size=app.config.get("COMPRESSION_CACHE_SIZE", 64),
+    )
+    app.after_request(compressor.after_request)
+    app.extensions["compression"] = compressor
+    return compressor
+
+
+def strong_etag(view):
+    """Marks a view whose ETag stays strong when its response is compressed"""
+    view.strong_etag = True
+    return view
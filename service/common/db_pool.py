@@ -0,0 +1,113 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Database Connection Pool
+
+This module builds the SQLAlchemy engine options from the DB_* settings,
+for the sync engine of Flask and the async engine of the ASGI app, and
+times how long requests wait to check out a pooled connection
+"""
+
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from service.common.metrics import registry
+
+POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting to check out a database connection",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+class TimedPoolMixin:  # pylint: disable=too-few-public-methods
+    """Records the time spent in connect() as the pool checkout wait"""
+
+    def connect(self):
+        """Checks out a connection and records how long it took"""
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    """QueuePool that records checkout wait time"""
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    """NullPool that records connect time, for use behind an external pooler"""
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    """QueuePool for async engines that records checkout wait time"""
+
+
+def engine_options(config, uri=None) -> dict:
+    """Returns SQLALCHEMY_ENGINE_OPTIONS for the configured database
+
+    SQLite keeps its default pool. Other databases get a timed QueuePool
+    sized by DB_POOL_SIZE and DB_MAX_OVERFLOW, or a NullPool when
+    DB_EXTERNAL_POOLER is set so that PgBouncer does all of the pooling.
+
+    Args:
+        config (dict): the Flask application configuration
+        uri (str): the database the options are for, SQLALCHEMY_DATABASE_URI
+            by default
+    """
+    uri = uri or config["SQLALCHEMY_DATABASE_URI"]
+    options = {"pool_pre_ping": config["DB_POOL_PRE_PING"]}
+    if uri.startswith("sqlite"):
+        return options
+
+    if config["DB_EXTERNAL_POOLER"]:
+        options["poolclass"] = TimedNullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+            pool_recycle=config["DB_POOL_RECYCLE"],
+        )
+
+    if config["DB_STATEMENT_TIMEOUT"]:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        }
+    return options
+
+
+def async_engine_options(config, uri) -> dict:
+    """Returns the options of an async engine for uri, from the same DB_* settings
+
+    The pool is sized and timed like the one of engine_options(), with the
+    asyncio flavor of the QueuePool. asyncpg takes the statement timeout as
+    a server setting rather than libpq options.
+
+    Args:
+        config (dict): the Flask application configuration
+        uri (str or URL): the async database URL
+    """
+    url = make_url(uri)
+    options = engine_options(config, url.drivername)
+    if options.get("poolclass") is TimedQueuePool:
+        options["poolclass"] = TimedAsyncQueuePool
+    if "connect_args" in options and url.drivername.endswith("+asyncpg"):
+        timeout = str(config["DB_STATEMENT_TIMEOUT"])
+        options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+    return options
@@ -0,0 +1,181 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Event Broker
+
+This module fans out stock and alert events to the Server-Sent Events
+subscribers of GET /inventory/events. Every event is encoded into its SSE
+frame once when it is published and the same frame is handed to every
+subscriber, so the cost of a publish does not depend on what the
+subscribers do with it.
+
+The broker lives in the process, so a subscriber only sees the events of
+the writes made by the worker that serves it, in the WSGI and the ASGI
+mode alike. With several workers, or several replicas, a client misses
+the writes of the others, so treat the events as hints: a client that
+must see every change reads GET /inventory/changes?since=<revision>,
+which comes from the database. Only a single worker sees every event.
+"""
+
+import json
+import queue
+import asyncio
+import threading
+from collections import deque
+
+
+class Subscriber:
+    """Buffers the frames for one blocking subscriber
+
+    Args:
+        max_pending (int): frames to buffer before the subscriber is dropped
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self.frames = queue.Queue(max_pending)
+        self.closed = False
+
+    def put(self, frame: str) -> bool:
+        """Queues a frame, returns False if the subscriber fell too far behind"""
+        try:
+            self.frames.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+    def get(self, timeout: float = None):
+        """Returns the next frame, or None if none arrived within timeout"""
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscriber(Subscriber):
+    """Buffers the frames for one subscriber on an asyncio event loop"""
+
+    def __init__(
+        self, max_pending: int = 1000
+    ):  # pylint: disable=super-init-not-called
+        self.loop = asyncio.get_running_loop()
+        self.frames = asyncio.Queue(max_pending)
+        self.closed = False
+
+    def put(self, frame: str) -> bool:
+        if self.frames.qsize() >= self.frames.maxsize:
+            self.closed = True
+            return False
+        # publish() runs on a request thread, the queue belongs to the loop
+        self.loop.call_soon_threadsafe(self._put, frame)
+        return True
+
+    def _put(self, frame: str):
+        try:
+            self.frames.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.closed = True
+
+    async def get(self, timeout: float = None):
+        try:
+            return await asyncio.wait_for(self.frames.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """Publishes events to every subscriber in this process
+
+    Args:
+        history (int): recent frames kept so a reconnecting client can catch
+            up from its Last-Event-ID
+        max_pending (int): frames a subscriber may fall behind before it is
+            dropped, so a stalled client can't grow memory without bound
+    """
+
+    def __init__(self, history: int = 1000, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._subscribers = ()
+        self._history = deque(maxlen=history)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event: str, data) -> int:
+        """Encodes an event once and queues it for every subscriber
+
+        Returns:
+            int: the id of the event
+        """
+        with self._lock:
+            self._last_id += 1
+            event_id = self._last_id
+            frame = (
+                f"id: {event_id}\nevent: {event}\n"
+                f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+            )
+            self._history.append((event_id, frame))
+            # put() never blocks, so fan out under the lock and every
+            # subscriber sees the events in id order
+            alive = tuple(
+                subscriber for subscriber in self._subscribers if subscriber.put(frame)
+            )
+            if len(alive) != len(self._subscribers):
+                self._subscribers = alive
+        return event_id
+
+    def subscribe(
+        self, last_event_id: int = None, subscriber_class=Subscriber, limit: int = 0
+    ):
+        """Adds a subscriber, replaying the kept frames after last_event_id
+
+        Args:
+            last_event_id (int): the last event the client has seen
+            subscriber_class (type): Subscriber or AsyncSubscriber
+            limit (int): most subscribers of subscriber_class to allow, 0 for
+                no limit
+        Returns:
+            Subscriber: the new subscriber, or None if limit was reached
+        """
+        subscriber = subscriber_class(self.max_pending)
+        with self._lock:
+            if limit and (
+                sum(type(other) is subscriber_class for other in self._subscribers)
+                >= limit
+            ):
+                return None
+            if last_event_id is not None:
+                for event_id, frame in self._history:
+                    if event_id > last_event_id:
+                        subscriber.put(frame)
+            self._subscribers = self._subscribers + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Removes a subscriber"""
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers = tuple(
+                other for other in self._subscribers if other is not subscriber
+            )
+
+    @property
+    def subscriber_count(self) -> int:
+        """The number of connected subscribers"""
+        return len(self._subscribers)
+
+
+# The broker that GET /inventory/events subscribes to
+broker = EventBroker()
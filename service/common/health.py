@@ -0,0 +1,179 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Health Checks
+
+This module checks the dependencies behind GET /health/ready on a
+background thread every HEALTH_CHECK_INTERVAL seconds and keeps the last
+result, so a probe only reads it and never waits on the database.
+
+A result older than HEALTH_CHECK_STALE seconds counts as failing: if the
+database hangs, the check hangs with it and the pod is taken out of
+rotation instead of every probe queueing up behind it.
+
+HEALTH_CHECK_INTERVAL=0 runs the checks on every probe instead, which is
+what the tests use.
+"""
+
+import os
+import time
+import logging
+import threading
+from flask import current_app
+from service.common.metrics import registry
+from service.models import db, Inventory
+
+logger = logging.getLogger("flask.app")
+
+HEALTH_CHECK_OK = registry.gauge(
+    "health_check_ok",
+    "1 if the last run of a readiness check passed in every worker",
+    ["check"],
+    multiprocess_mode="min",
+)
+HEALTH_CHECK_SECONDS = registry.histogram(
+    "health_check_duration_seconds", "Time spent running a readiness check", ["check"]
+)
+
+
+class HealthChecker:
+    """Runs registered readiness checks in the background and caches the result"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.checks = {}
+        self.result = None
+        self.checked_at = None
+        self.thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Reads the HEALTH_* settings of app"""
+        self.app = app
+        self.result = None
+        self.checked_at = None
+        self._pid = None
+        app.extensions["health"] = self
+
+    def check(self, func):
+        """Decorator that registers func as a readiness check
+
+        A check returns a dict of details that has "ok" set to whether it
+        passed. Raising counts as failing.
+        """
+        self.checks[func.__name__] = func
+        return func
+
+    def refresh(self) -> dict:
+        """Runs every check now and caches the result"""
+        checks = {}
+        with self.app.app_context():
+            for name, func in self.checks.items():
+                start = time.perf_counter()
+                try:
+                    checks[name] = func()
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.warning("Readiness check %s failed: %s", name, error)
+                    checks[name] = {"ok": False, "error": str(error)}
+                finally:
+                    db.session.remove()
+                HEALTH_CHECK_SECONDS.observe(time.perf_counter() - start, check=name)
+                HEALTH_CHECK_OK.set(int(checks[name]["ok"]), check=name)
+        self.result = checks
+        self.checked_at = time.monotonic()
+        return checks
+
+    def report(self):
+        """Returns (ready, report) from the cached result"""
+        if self.app.config["HEALTH_CHECK_INTERVAL"] <= 0:
+            self.refresh()
+        else:
+            self.start()
+        result, checked_at = self.result, self.checked_at
+        if result is None:
+            return False, {"status": "NOT READY", "message": "Checks haven't run yet"}
+        age = time.monotonic() - checked_at
+        report = {"status": "READY", "age": round(age, 3), "checks": result}
+        if age > self.app.config["HEALTH_CHECK_STALE"]:
+            report.update(status="NOT READY", message="Checks are stale")
+            return False, report
+        if not all(check["ok"] for check in result.values()):
+            report["status"] = "NOT READY"
+            return False, report
+        return True, report
+
+    ######################################################################
+    # Checker thread
+    ######################################################################
+    def start(self):
+        """Starts the checker thread of this process if it isn't running"""
+        # A forked gunicorn worker inherits the attributes but not the thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name="health-checker", daemon=True
+            )
+            self.thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Stops the checker thread and waits for it"""
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+        self._pid = None
+        self._stop.clear()
+
+    def run(self):
+        """Refreshes the result every HEALTH_CHECK_INTERVAL seconds until stop()"""
+        self.refresh()
+        while not self._stop.wait(self.app.config["HEALTH_CHECK_INTERVAL"]):
+            self.refresh()
+
+
+# The checks behind GET /health/ready
+health = HealthChecker()
+
+
+@health.check
+def database():
+    """Reads the inventory tables, which needs a connection and the schema"""
+    db.session.execute(Inventory.latest_revision_query()).scalar_one()
+    return {"ok": True}
+
+
+@health.check
+def pool():
+    """Fails when the requests of this worker hold every pooled connection"""
+    engine_pool = db.engine.pool
+    if not hasattr(engine_pool, "checkedout") or not hasattr(engine_pool, "size"):
+        return {"ok": True}
+    # pylint: disable=protected-access
+    capacity = engine_pool.size() + max(getattr(engine_pool, "_max_overflow", 0), 0)
+    in_use = engine_pool.checkedout()
+    return {
+        "ok": in_use < capacity * current_app.config["HEALTH_POOL_MAX_USAGE"],
+        "in_use": in_use,
+        "capacity": capacity,
+    }
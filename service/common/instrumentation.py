@@ -0,0 +1,247 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Request Instrumentation
+
+This module hooks the Flask request cycle, the SQLAlchemy engine and the
+JSON provider so that every request records its latency, status, database
+work and serialization time in the metrics registry.
+
+The database hooks also:
+
+* log statements slower than DB_SLOW_QUERY_SECONDS, with the values of
+  their parameters redacted
+* log a request that runs the same statement DB_REPEATED_QUERY_THRESHOLD
+  times or more, which is usually an N+1 query
+* add a Server-Timing header with the request's database time when
+  SERVER_TIMING is set
+* fail a request that issues more statements than its query budget when
+  DB_QUERY_BUDGET_ENFORCE is set, which the tests turn on
+"""
+
+import time
+import logging
+from collections import Counter
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service.common.metrics import registry
+from service.common.serializers import JSONProvider
+
+logger = logging.getLogger("flask.app")
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request",
+    ["method", "endpoint"],
+)
+REQUESTS_TOTAL = registry.counter(
+    "http_requests_total",
+    "Requests handled, by status code",
+    ["method", "endpoint", "status"],
+)
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+)
+DB_QUERIES = registry.histogram(
+    "http_request_db_queries",
+    "Database statements issued per request",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_SECONDS = registry.histogram(
+    "http_request_db_seconds",
+    "Time spent in database statements per request",
+    ["endpoint"],
+)
+DB_SLOW_QUERIES = registry.counter(
+    "db_slow_queries_total",
+    "Statements slower than DB_SLOW_QUERY_SECONDS",
+    ["endpoint"],
+)
+SERIALIZATION_SECONDS = registry.histogram(
+    "json_serialization_seconds",
+    "Time spent encoding JSON bodies",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+
+
+class TimedJSONProvider(JSONProvider):
+    """JSON provider that records how long each body takes to encode"""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            SERIALIZATION_SECONDS.observe(time.perf_counter() - start)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request issues more statements than its query budget"""
+
+
+def query_budget(limit: int):
+    """Decorator that sets how many statements a view may issue
+
+    The budget is only checked when DB_QUERY_BUDGET_ENFORCE is set. Views
+    without one get DB_QUERY_BUDGET, where 0 means no budget.
+    """
+
+    def decorator(view):
+        view.query_budget = limit
+        return view
+
+    return decorator
+
+
+######################################################################
+# Flask request hooks
+######################################################################
+def before_request():
+    """Starts the timers for a request"""
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+    g.db_statements = Counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+def after_request(response):
+    """Records the latency, status and database work of a request"""
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    REQUESTS_IN_FLIGHT.dec()
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start, method=request.method, endpoint=endpoint
+    )
+    REQUESTS_TOTAL.inc(
+        method=request.method, endpoint=endpoint, status=response.status_code
+    )
+    queries, db_seconds = g.get("db_queries", 0), g.get("db_seconds", 0.0)
+    DB_QUERIES.observe(queries, endpoint=endpoint)
+    DB_SECONDS.observe(db_seconds, endpoint=endpoint)
+
+    config = current_app.config
+    if config.get("SERVER_TIMING"):
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={db_seconds * 1000:.1f};desc="{queries} queries"',
+        )
+        response.headers.add(
+            "Server-Timing", f"app;dur={(time.perf_counter() - start) * 1000:.1f}"
+        )
+    check_repeated_queries(endpoint, config.get("DB_REPEATED_QUERY_THRESHOLD", 0))
+    if config.get("DB_QUERY_BUDGET_ENFORCE"):
+        check_query_budget(endpoint, queries, config.get("DB_QUERY_BUDGET", 0))
+    return response
+
+
+def check_repeated_queries(endpoint: str, threshold: int):
+    """Logs the statements that the request ran threshold times or more"""
+    if threshold <= 0:
+        return
+    for statement, count in g.get("db_statements", Counter()).items():
+        if count >= threshold:
+            logger.warning(
+                "Possible N+1 query in %s, ran %d times: %s", endpoint, count, statement
+            )
+
+
+def check_query_budget(endpoint: str, queries: int, default: int):
+    """Raises QueryBudgetExceeded if the request went over its query budget"""
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, "query_budget", default)
+    if budget and queries > budget:
+        raise QueryBudgetExceeded(
+            f"{request.method} {request.path} ({endpoint}) issued {queries} "
+            f"statements, its query budget is {budget}"
+        )
+
+
+def teardown_request(error):  # pylint: disable=unused-argument
+    """Balances the in-flight gauge when a request failed before after_request"""
+    if g.pop("request_start", None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+
+
+######################################################################
+# SQLAlchemy engine hooks
+######################################################################
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):  # pylint: disable=too-many-arguments
+    """Remembers when a statement started"""
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):  # pylint: disable=too-many-arguments
+    """Adds a finished statement to the current request's totals"""
+    elapsed = time.perf_counter() - context.query_start
+    if not has_app_context():
+        return
+    if has_request_context() and "db_queries" in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+        g.db_statements[statement] += 1
+    threshold = current_app.config.get("DB_SLOW_QUERY_SECONDS", 0)
+    if 0 < threshold <= elapsed:
+        endpoint = (request.endpoint if has_request_context() else None) or "none"
+        DB_SLOW_QUERIES.inc(endpoint=endpoint)
+        logger.warning(
+            "Slow query in %s took %.3fs: %s parameters=%s",
+            endpoint,
+            elapsed,
+            statement,
+            redact(parameters, executemany),
+        )
+
+
+def redact(parameters, executemany=False):
+    """Returns the bound parameters of a statement with only their types
+
+    The values may be personal or secret, the types are enough to tell
+    which statement and code path it was.
+    """
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def observe_serialization(start: float):
+    """Records the time spent encoding a body that bypassed the JSON provider"""
+    SERIALIZATION_SECONDS.observe(time.perf_counter() - start)
+
+
+def init_instrumentation(app):
+    """Installs the request hooks and the timed JSON provider on app"""
+    registry.directory = app.config.get("METRICS_DIR")
+    registry.start()
+    app.json = TimedJSONProvider(app, app.config.get("JSON_ENCODER", "orjson"))
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
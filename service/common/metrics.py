@@ -0,0 +1,344 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Metrics
+
+This module contains counters, gauges and histograms that are rendered in
+the Prometheus text exposition format.
+
+Every gunicorn worker has its own copy of the metrics, so when a directory
+is configured each worker writes a snapshot of its values to a file there
+from a background thread every second, and once more as it exits, and
+/metrics combines all of the files. Counters and
+histograms are summed; gauges are combined by their multiprocess_mode.
+"""
+
+import os
+import json
+import time
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """Base class for a metric with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, **extra) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        """Returns a copy of the current values keyed by label values"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values=None) -> list:
+        """Returns the exposition lines for this metric"""
+        values = self.samples() if values is None else values
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{self._labels(key)} {value}")
+        return lines
+
+    def merge(self, values: dict, other: dict, pid: str = None):
+        """Adds the values of another process into values"""
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Adds amount to the counter"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that can go up and down
+
+    multiprocess_mode says how the values of the workers are combined:
+    "sum" for amounts that each worker holds a share of, such as requests
+    in flight, "max" or "min" for a value that every worker measures on its
+    own, and "all" to keep the value of every worker under a pid label.
+    """
+
+    kind = "gauge"
+    MULTIPROCESS_MODES = ("sum", "max", "min", "all")
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), multiprocess_mode="sum"
+    ):
+        if multiprocess_mode not in self.MULTIPROCESS_MODES:
+            raise ValueError(f"Invalid multiprocess_mode: {multiprocess_mode}")
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def _labels(self, key: tuple, **extra) -> str:
+        # keys merged in the "all" mode end with the pid of their worker
+        pairs = list(zip(self.labelnames + ("pid",), key)) + list(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def merge(self, values: dict, other: dict, pid: str = None):
+        if self.multiprocess_mode == "sum":
+            super().merge(values, other)
+            return
+        for key, value in other.items():
+            if self.multiprocess_mode == "all":
+                values[key + (pid,)] = value
+            elif key not in values:
+                values[key] = value
+            elif self.multiprocess_mode == "max":
+                values[key] = max(values[key], value)
+            else:
+                values[key] = min(values[key], value)
+
+    def inc(self, amount: float = 1, **labels):
+        """Adds amount to the gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        """Subtracts amount from the gauge"""
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        """Sets the gauge to value"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Counts observations in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        """Records one observation"""
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, then +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return {key: list(counts) for key, counts in self._values.items()}
+
+    def merge(self, values: dict, other: dict, pid: str = None):
+        for key, counts in other.items():
+            if key in values:
+                values[key] = [a + b for a, b in zip(values[key], counts)]
+            else:
+                values[key] = list(counts)
+
+    def render(self, values=None) -> list:
+        values = self.samples() if values is None else values
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, counts in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self._labels(key, le=bound)} {count}")
+            lines.append(
+                f'{self.name}_bucket{self._labels(key, le="+Inf")} {counts[-2]}'
+            )
+            lines.append(f"{self.name}_count{self._labels(key)} {counts[-2]}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """A collection of metrics that are rendered together"""
+
+    def __init__(self, directory: str = None, flush_interval: float = 1.0):
+        self.metrics = {}
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flushed = 0.0
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    def register(self, metric: Metric) -> Metric:
+        """Adds a metric, or returns the one already registered under its name"""
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        """Returns the Counter called name"""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames=(), multiprocess_mode="sum"
+    ) -> Gauge:
+        """Returns the Gauge called name"""
+        return self.register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Returns the Histogram called name"""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    ######################################################################
+    # Multi-process support
+    ######################################################################
+
+    def snapshot(self) -> dict:
+        """Returns the values of every metric in a JSON friendly form"""
+        return {
+            name: {json.dumps(key): value for key, value in metric.samples().items()}
+            for name, metric in self.metrics.items()
+        }
+
+    def flush(self, force: bool = False):
+        """Writes this process's snapshot to the directory at most once per interval"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed < self.flush_interval:
+            return
+        self._flushed = now
+        path = os.path.join(self.directory, f"metrics_{os.getpid()}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f"{path}.tmp", path)
+
+    def start(self):
+        """Flushes every flush_interval seconds on a background thread
+
+        Threads don't survive a fork, so every worker starts its own. Idle
+        workers keep their snapshot current too, e.g. the gauges the health
+        checks and background tasks set between requests.
+        """
+        if not self.directory:
+            return
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_forever, name="metrics-flush", daemon=True
+        )
+        self._flusher.start()
+
+    def stop(self):
+        """Stops the background thread and writes a last snapshot"""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush(force=True)
+
+    def _flush_forever(self):
+        """Writes the snapshot every flush_interval seconds until stopped"""
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush(force=True)
+            except OSError:
+                # e.g. the directory was removed, the next flush may succeed
+                pass
+
+    def clear(self):
+        """Removes every snapshot from the directory, e.g. those of an earlier run"""
+        if not self.directory:
+            return
+        for filename in os.listdir(self.directory):
+            if filename.startswith("metrics_") and ".json" in filename:
+                os.remove(os.path.join(self.directory, filename))
+
+    def mark_process_dead(self, pid: int):
+        """Drops the gauges of a worker that exited, keeping its counters"""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"metrics_{pid}.json")
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as file:
+            snapshot = json.load(file)
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Gauge):
+                snapshot.pop(name, None)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file)
+
+    def collect(self) -> dict:
+        """Returns the values of every metric combined over every process"""
+        if not self.directory:
+            return {name: metric.samples() for name, metric in self.metrics.items()}
+        self.flush(force=True)
+        collected = {name: {} for name in self.metrics}
+        for filename in sorted(os.listdir(self.directory)):
+            if not (filename.startswith("metrics_") and filename.endswith(".json")):
+                continue
+            with open(os.path.join(self.directory, filename), encoding="utf-8") as file:
+                snapshot = json.load(file)
+            pid = filename.removeprefix("metrics_").removesuffix(".json")
+            for name, values in snapshot.items():
+                if name in self.metrics:
+                    other = {
+                        tuple(json.loads(key)): value for key, value in values.items()
+                    }
+                    self.metrics[name].merge(collected[name], other, pid)
+        return collected
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.extend(metric.render(collected[name]))
+        return "\n".join(lines) + "\n"
+
+
+# The registry served at /metrics
+registry = Registry()
@@ -0,0 +1,127 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Schema Migrations
+
+db.create_all() only creates missing tables, so this module brings an
+existing database up to date with the models, for "flask db-migrate":
+
+1. adds the columns that were added to existing tables, backfills them and,
+   where the database can, makes them NOT NULL
+2. creates the missing tables, which also runs their after_create DDL
+3. resolves all but the latest open Alert of a product, older versions could
+   open more than one and the unique index of open Alerts would refuse them
+4. creates the indexes that are missing on tables that already existed
+
+Every step checks what is already there, so it is safe to run it on every
+deployment and against a database created by any earlier version.
+"""
+
+import logging
+import sqlalchemy as sa
+from service.models import db
+
+logger = logging.getLogger("flask.app")
+
+# Columns added to existing tables, in the order they were added, with the
+# SQL expression that fills them in for the rows that are already there
+ADDED_COLUMNS = (
+    ("alert", "occurrences", "1"),
+    ("alert", "last_seen_at", "created_at"),
+    ("alert", "resolved_at", None),
+    ("inventory", "updated_at", "CURRENT_TIMESTAMP"),
+    ("inventory", "revision", "1"),
+)
+
+
+def add_columns(connection) -> list:
+    """Adds the columns in ADDED_COLUMNS that an existing table lacks"""
+    inspector = sa.inspect(connection)
+    tables = set(inspector.get_table_names())
+    added = []
+    for table_name, column_name, backfill in ADDED_COLUMNS:
+        if table_name not in tables:
+            continue  # create_all() creates it with every column
+        columns = {column["name"] for column in inspector.get_columns(table_name)}
+        if column_name in columns:
+            continue
+        column = db.metadata.tables[table_name].c[column_name]
+        definition = f"{column_name} {column.type.compile(dialect=connection.dialect)}"
+        if column.server_default is not None:
+            definition += f" DEFAULT {column.server_default.arg}"
+        connection.execute(sa.text(f"ALTER TABLE {table_name} ADD COLUMN {definition}"))
+        if backfill is not None:
+            connection.execute(
+                sa.text(f"UPDATE {table_name} SET {column_name} = {backfill}")
+            )
+        # SQLite can't add NOT NULL to an existing column, the models fill it in
+        if not column.nullable and connection.dialect.name != "sqlite":
+            connection.execute(
+                sa.text(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL"
+                )
+            )
+        logger.info("Added column %s.%s", table_name, column_name)
+        added.append(f"{table_name}.{column_name}")
+    return added
+
+
+def resolve_duplicate_alerts(connection) -> list:
+    """Resolves every open Alert of a product except its latest one"""
+    alert = db.metadata.tables["alert"]
+    latest = (
+        sa.select(sa.func.max(alert.c.id))
+        .where(alert.c.resolved_at.is_(None))
+        .group_by(alert.c.product_id)
+    )
+    resolved = connection.execute(
+        sa.update(alert)
+        .where(alert.c.resolved_at.is_(None), alert.c.id.not_in(latest))
+        .values(resolved_at=alert.c.last_seen_at)
+    ).rowcount
+    if not resolved:
+        return []
+    logger.info("Resolved %d duplicate open alerts", resolved)
+    return [f"resolved {resolved} duplicate open alerts"]
+
+
+def create_indexes(connection) -> list:
+    """Creates the indexes of the models that the database doesn't have"""
+    inspector = sa.inspect(connection)
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                logger.info("Created index %s", index.name)
+                created.append(index.name)
+    return created
+
+
+def upgrade() -> list:
+    """Brings the database of the current app up to date with the models
+
+    Returns:
+        list: the columns and indexes that were added
+    """
+    with db.engine.begin() as connection:
+        changes = add_columns(connection)
+    db.create_all()
+    with db.engine.begin() as connection:
+        changes += resolve_duplicate_alerts(connection)
+        changes += create_indexes(connection)
+    return changes
@@ -0,0 +1,240 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Read Replicas
+
+This module sends the reads of GET and HEAD requests to the read replicas
+in DB_REPLICA_URIS. Everything else goes to the primary:
+
+* writes, and every read of a request after its first write, so a request
+  always reads what it wrote
+* reads outside of a request, e.g. the CLI, background tasks and the
+  health checks
+* SELECT ... FOR UPDATE and raw SQL
+* reads inside read_primary(), e.g. the ones that fill a cache, which has
+  to hold what the primary has since its entries outlive the replica lag
+
+The lag of every replica is measured every DB_REPLICA_LAG_INTERVAL seconds
+on a background thread. A replica is only used while its last measured lag
+plus the age of that measurement is at most DB_REPLICA_MAX_LAG seconds, so
+reads go back to the primary when the replicas fall behind or can't be
+measured.
+"""
+
+import os
+import time
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+import sqlalchemy as sa
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from service.common.db_pool import engine_options
+from service.common.metrics import registry
+
+logger = logging.getLogger("flask.app")
+
+READ_METHODS = ("GET", "HEAD")
+
+# Seconds since a standby replayed its last transaction, 0 once it has
+# replayed everything it received and NULL when it isn't a standby
+POSTGRESQL_LAG = sa.text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+ROUTED_READS = registry.counter(
+    "db_routed_reads_total",
+    "Reads of GET requests by where they were sent: replica, primary after a "
+    "write, or fallback when no replica was close enough",
+    ["target"],
+)
+REPLICA_LAG = registry.gauge(
+    "db_replica_lag_seconds",
+    "Last measured replication lag, the largest any worker measured",
+    ["replica"],
+    multiprocess_mode="max",
+)
+
+
+def create_engines(config) -> dict:
+    """Returns an engine per replica in DB_REPLICA_URIS, by replica name
+
+    These aren't Flask-SQLAlchemy binds, which would also make db.create_all()
+    run DDL on the replicas.
+    """
+    return {
+        f"replica_{number}": sa.create_engine(uri, **engine_options(config, uri))
+        for number, uri in enumerate(config["DB_REPLICA_URIS"])
+    }
+
+
+def measure_lag(engine) -> float:
+    """Returns how many seconds the replica behind engine is behind"""
+    if engine.dialect.name != "postgresql":
+        # Only PostgreSQL replicates, e.g. a SQLite copy has nothing to catch up
+        return 0.0
+    with engine.connect() as connection:
+        return float(connection.execute(POSTGRESQL_LAG).scalar() or 0)
+
+
+def is_read(clause) -> bool:
+    """Returns True if clause is a plain SELECT that a replica can run"""
+    # pylint: disable=protected-access
+    return isinstance(clause, sa.Select) and clause._for_update_arg is None
+
+
+@contextmanager
+def read_primary(session):
+    """Sends the reads of session to the primary inside the with block"""
+    previous = session.info.get("primary", False)
+    session.info["primary"] = True
+    try:
+        yield session
+    finally:
+        session.info["primary"] = previous
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of GET requests to a read replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Returns the replica for a read the replicas can serve, else the primary"""
+        if bind is None:
+            if not is_read(clause):
+                # flushes and DML, reads after this must see them
+                self.info["wrote"] = True
+            elif has_request_context() and request.method in READ_METHODS:
+                router = current_app.extensions.get("replicas")
+                if router is not None and router.keys:
+                    engine = router.engine_for(self)
+                    if engine is not None:
+                        return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Picks the replica for the reads of a request and tracks replica lag"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.keys = ()
+        self.engines = {}
+        self.lags = {}
+        self.thread = None
+        self._pid = None
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Creates the engines of the replicas of app"""
+        self.app = app
+        self.engines = create_engines(app.config)
+        self.keys = tuple(self.engines)
+        self.lags = {}
+        self._pid = None
+        app.extensions["replicas"] = self
+
+    def engine_for(self, session):
+        """Returns the replica engine for a read by session, None for the primary
+
+        A request reads from one replica only, picked round robin among
+        those that are close enough, so it doesn't see them disagree.
+        """
+        if session.info.get("wrote") or session.info.get("primary"):
+            ROUTED_READS.inc(target="primary")
+            return None
+        if "replica" not in session.info:
+            replicas = self.available()
+            session.info["replica"] = (
+                replicas[next(self._turn) % len(replicas)] if replicas else None
+            )
+        key = session.info["replica"]
+        if key is None:
+            ROUTED_READS.inc(target="fallback")
+            return None
+        ROUTED_READS.inc(target="replica")
+        return self.engines[key]
+
+    def available(self) -> list:
+        """Returns the replicas that are at most DB_REPLICA_MAX_LAG behind"""
+        if self.app.config["DB_REPLICA_LAG_INTERVAL"] <= 0:
+            self.refresh()
+        else:
+            self.start()
+        now = time.monotonic()
+        max_lag = self.app.config["DB_REPLICA_MAX_LAG"]
+        return [
+            key
+            for key, (lag, measured_at) in list(self.lags.items())
+            if lag + now - measured_at <= max_lag
+        ]
+
+    def refresh(self):
+        """Measures the lag of every replica now"""
+        for key, engine in self.engines.items():
+            try:
+                lag = measure_lag(engine)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.warning("Cannot measure the lag of %s: %s", key, error)
+                lag = float("inf")
+            self.lags[key] = (lag, time.monotonic())
+            REPLICA_LAG.set(lag, replica=key)
+
+    ######################################################################
+    # Lag monitor thread
+    ######################################################################
+    def start(self):
+        """Starts the lag monitor of this process if it isn't running"""
+        # A forked gunicorn worker inherits the attributes but not the thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name="replica-lag", daemon=True
+            )
+            self.thread.start()
+            self._pid = os.getpid()
+
+    def dispose(self):
+        """Drops the pooled replica connections, e.g. the ones inherited by a fork"""
+        for engine in self.engines.values():
+            engine.dispose(close=False)
+
+    def stop(self):
+        """Stops the lag monitor and waits for it"""
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+        self._pid = None
+        self._stop.clear()
+
+    def run(self):
+        """Measures the lags every DB_REPLICA_LAG_INTERVAL seconds until stop()"""
+        self.refresh()
+        while not self._stop.wait(self.app.config["DB_REPLICA_LAG_INTERVAL"]):
+            self.refresh()
+
+
+# Routes the reads of every app, see init_app()
+replicas = ReplicaRouter()
@@ -0,0 +1,215 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+JSON Serializers
+
+This module contains the Flask JSON provider and the row serializers used
+to encode response bodies. orjson is used when it is installed and
+JSON_ENCODER is "orjson"; otherwise everything falls back to the standard
+library json module, which produces equivalent JSON.
+
+A RowSerializer is built once per model from its columns and encodes
+model instances or result Rows as JSON. With orjson it hands orjson a dict
+of column values per row, which is about twice as fast as filling the
+template it otherwise builds from the column types for the stdlib path.
+"""
+
+import json
+from datetime import date, datetime
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # optional dependency, only needed for the fast encoder
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSON_ENCODERS = ("orjson", "stdlib")
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is available
+
+    Keys are not sorted, which is the main cost of the default provider on
+    large bodies. Dates and objects that orjson can't encode natively go
+    through the default provider's conversions so both encoders agree.
+    """
+
+    sort_keys = False
+    compact = True
+
+    def __init__(self, app, encoder: str = "orjson"):
+        super().__init__(app)
+        if encoder not in JSON_ENCODERS:
+            raise ValueError(
+                f"JSON_ENCODER must be one of {JSON_ENCODERS}, not {encoder}"
+            )
+        self.use_orjson = encoder == "orjson" and orjson is not None
+
+    def dumps(self, obj, **kwargs):
+        # jsonify() passes compact separators, or indent=2 in debug mode
+        indent = kwargs.get("indent")
+        if (
+            self.use_orjson
+            and set(kwargs) <= {"separators", "indent"}
+            and indent in (None, 2)
+        ):
+            option = (
+                orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS
+            )
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        kwargs.setdefault("separators", (",", ":"))
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+
+######################################################################
+# Row serializers
+######################################################################
+def encode_int(value) -> str:
+    """Encodes an integer column value"""
+    return "null" if value is None else "%d" % value
+
+
+def encode_str(value) -> str:
+    """Encodes a string column value"""
+    return "null" if value is None else encode_basestring_ascii(value)
+
+
+def encode_bool(value) -> str:
+    """Encodes a boolean column value"""
+    return "null" if value is None else ("true" if value else "false")
+
+
+def encode_datetime(value) -> str:
+    """Encodes a date or datetime column value as ISO 8601"""
+    return "null" if value is None else f'"{value.isoformat()}"'
+
+
+def encode_any(value) -> str:
+    """Encodes a value of any other type"""
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+ENCODERS_BY_TYPE = (
+    (bool, encode_bool),
+    (int, encode_int),
+    (str, encode_str),
+    (datetime, encode_datetime),
+    (date, encode_datetime),
+)
+
+
+def encoder_for(column):
+    """Returns the encoder for the Python type of a column"""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return encode_any
+    for kind, encoder in ENCODERS_BY_TYPE:
+        if issubclass(python_type, kind):
+            return encoder
+    return encode_any
+
+
+class RowSerializer:
+    """Encodes model instances or Rows with a fixed set of columns as JSON
+
+    Args:
+        columns (list): the SQLAlchemy columns to encode, in output order
+        use_orjson (bool): encode arrays with orjson, defaults to whether it
+            is installed
+    """
+
+    def __init__(self, columns, use_orjson: bool = None):
+        self.use_orjson = orjson is not None if use_orjson is None else use_orjson
+        # orjson only takes exact str keys, not quoted_name
+        self.names = tuple(str(column.name) for column in columns)
+        self.getter = attrgetter(*self.names)
+        self.encoders = tuple(encoder_for(column) for column in columns)
+        # '{"id":%s,"name":%s,...}' with every % escaped in the key names
+        self.template = (
+            "{"
+            + ",".join(
+                f"{encode_basestring_ascii(name).replace('%', '%%')}:%s"
+                for name in self.names
+            )
+            + "}"
+        )
+
+    def __call__(self, row) -> str:
+        """Returns the JSON object for one row"""
+        values = self.getter(row)
+        if len(self.names) == 1:
+            values = (values,)
+        return self.template % tuple(
+            encode(value) for encode, value in zip(self.encoders, values)
+        )
+
+    def values(self, row) -> dict:
+        """Returns the column values of one row by name"""
+        if getattr(row, "_fields", None) == self.names:
+            return dict(zip(self.names, row))
+        values = self.getter(row)
+        if len(self.names) == 1:
+            values = (values,)
+        return dict(zip(self.names, values))
+
+    def many(self, rows) -> bytes:
+        """Returns the JSON array for every row"""
+        if not self.use_orjson:
+            return ("[" + ",".join(map(self, rows)) + "]").encode()
+        rows = list(rows)
+        names = self.names
+        if rows and getattr(rows[0], "_fields", None) == names:
+            # Rows of exactly these columns are tuples, zip is the fast path
+            objects = [dict(zip(names, row)) for row in rows]
+        else:
+            objects = list(map(self.values, rows))
+        return orjson.dumps(objects, default=str)
+
+    @staticmethod
+    def mixed(pairs) -> bytes:
+        """Returns the JSON array of (serializer, row) pairs, e.g. rows and tombstones"""
+        pairs = list(pairs)
+        if all(serializer.use_orjson for serializer, _ in pairs):
+            return orjson.dumps(
+                [serializer.values(row) for serializer, row in pairs], default=str
+            )
+        return (
+            "[" + ",".join(serializer(row) for serializer, row in pairs) + "]"
+        ).encode()
+
+    @classmethod
+    def for_model(cls, model, exclude=(), use_orjson: bool = None):
+        """Builds the serializer for every column of a model"""
+        return cls(
+            [
+                column
+                for column in model.__table__.columns
+                if column.name not in exclude
+            ],
+            use_orjson,
+        )
@@ -0,0 +1,379 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Background Tasks
+
+This module runs work that doesn't have to finish before a response is
+sent, such as recording alerts, on a small pool of worker threads.
+
+A task is enqueued before the change it depends on is committed and is
+only handed to the workers once db.session commits, a rollback drops it.
+
+With TASK_BACKEND=memory (the default outside the container image) tasks
+wait in a bounded in-process queue. When it is full, enqueue() blocks for up to TASK_ENQUEUE_TIMEOUT
+seconds and then runs the task in the caller, so a backlog slows requests
+down instead of dropping work. Tasks that are still queued when a process
+dies are lost, and gunicorn's worker_exit hook gives them TASK_STOP_TIMEOUT
+seconds to finish when a worker shuts down.
+
+With TASK_BACKEND=database, the default of the container image, every task is a row in the task_queue table.
+The row is written by the commit of the change itself (a transactional
+outbox), so a request pays for no extra round trip and a change is never
+stored without its task. The commit wakes the workers of the process up.
+Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+of processes can share the table, and a task survives a crash: it's
+retried after TASK_LEASE seconds, up to TASK_MAX_ATTEMPTS times. One
+worker per process also polls the table every TASK_POLL_INTERVAL seconds
+for those retries, the others sleep until they are woken up.
+
+TASK_EAGER (or TASK_WORKERS=0 with the memory backend) runs every task in
+the caller right away, which is what the tests use.
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+from sqlalchemy.orm import Session
+from service.common.metrics import registry
+from service.models import db
+
+logger = logging.getLogger("flask.app")
+
+TASKS_ENQUEUED = registry.counter(
+    "tasks_enqueued_total", "Tasks handed to the task queue", ["task"]
+)
+TASKS_FINISHED = registry.counter(
+    "tasks_finished_total",
+    "Tasks that finished running, by outcome",
+    ["task", "status"],
+)
+TASKS_INLINE = registry.counter(
+    "tasks_inline_total",
+    "Tasks run by the caller because the queue stayed full",
+    ["task"],
+)
+TASK_QUEUE_DEPTH = registry.gauge(
+    "task_queue_depth", "Tasks waiting in the in-process queue"
+)
+TASK_SECONDS = registry.histogram(
+    "task_duration_seconds", "Time spent running a task", ["task"]
+)
+
+
+class QueuedTask(db.Model):
+    """
+    Class that represents a task waiting in the database backed queue
+    """
+
+    __tablename__ = "task_queue"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(63), nullable=False)
+    args = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_task_queue_status_run_after", "status", "run_after"),
+    )
+
+
+class TaskQueue:
+    """Runs registered tasks on background worker threads"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self.queue = None
+        self.threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Reads the TASK_* settings of app"""
+        self.app = app
+        self.queue = queue.Queue(app.config["TASK_QUEUE_SIZE"])
+        self.threads = []
+        self._pid = None
+        app.extensions["tasks"] = self
+
+    @property
+    def durable(self) -> bool:
+        """True when tasks are kept in the database"""
+        return self.app.config["TASK_BACKEND"] == "database"
+
+    @property
+    def eager(self) -> bool:
+        """True when tasks run in the caller right away"""
+        return self.app.config["TASK_EAGER"] or (
+            not self.durable and not self.app.config["TASK_WORKERS"]
+        )
+
+    def task(self, func):
+        """Decorator that registers func so it can be enqueued"""
+        self.handlers[func.__name__] = func
+        return func
+
+    def enqueue(self, func, *args):
+        """Schedules func(*args) to run in the background
+
+        Call it before committing the change that the task depends on, the
+        task runs once db.session commits. Outside of an app context of its
+        app it is committed right away. The arguments must be JSON serializable.
+        """
+        name = func.__name__
+        if name not in self.handlers:
+            raise KeyError(f"{name} is not a registered task")
+        TASKS_ENQUEUED.inc(task=name)
+        if not has_app_context() or current_app.extensions.get("tasks") is not self:
+            with self.app.app_context():
+                self.stage(name, args)
+                db.session.commit()
+            return
+        self.stage(name, args)
+
+    def stage(self, name: str, args):
+        """Adds a task to db.session, to be dispatched when it commits"""
+        session = db.session()
+        if not session.in_transaction():
+            session.begin()  # so that a rollback before any query drops it
+        if self.durable and not self.eager:
+            session.add(QueuedTask(name=name, args=json.dumps(args)))
+        session.info.setdefault("tasks", []).append((self, name, args))
+
+    def dispatch(self, name: str, args):
+        """Hands a committed task to the workers"""
+        if self.eager:
+            self.run(name, args)
+            return
+        self.start()
+        if self.durable:
+            # Wake a worker up, the row is picked up by polling if this is full
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+            return
+        try:
+            self.queue.put(
+                (name, args), timeout=self.app.config["TASK_ENQUEUE_TIMEOUT"]
+            )
+            TASK_QUEUE_DEPTH.set(self.queue.qsize())
+        except queue.Full:
+            logger.warning("Task queue is full, running %s in the request", name)
+            TASKS_INLINE.inc(task=name)
+            self.run(name, args)
+
+    def run(self, name: str, args) -> bool:
+        """Runs one task in an application context, returns False if it failed"""
+        start = time.perf_counter()
+        try:
+            with self.app.app_context():
+                try:
+                    self.handlers[name](*args)
+                except Exception:
+                    db.session.rollback()
+                    raise
+            TASKS_FINISHED.inc(task=name, status="ok")
+            return True
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Task %s%s failed", name, tuple(args))
+            TASKS_FINISHED.inc(task=name, status="error")
+            return False
+        finally:
+            TASK_SECONDS.observe(time.perf_counter() - start, task=name)
+
+    ######################################################################
+    # Worker threads
+    ######################################################################
+    def start(self):
+        """Starts the worker threads of this process if they aren't running"""
+        # A forked gunicorn worker inherits the list but not the threads
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.app.config["TASK_QUEUE_SIZE"])
+            self.threads = [
+                threading.Thread(
+                    target=self.work,
+                    args=(n == 0,),
+                    name=f"task-worker-{n}",
+                    daemon=True,
+                )
+                for n in range(self.app.config["TASK_WORKERS"])
+            ]
+            for thread in self.threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout: float = None) -> bool:
+        """Asks the worker threads to exit once the queue is empty and waits
+
+        Args:
+            timeout (float): most seconds to wait, None to wait until they exit
+        Returns:
+            bool: False if a worker was still running when the time ran out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+        try:
+            for _ in self.threads:
+                self.queue.put(StopIteration, timeout=remaining())
+        except queue.Full:
+            pass  # the workers are busy with a full queue, join() times out
+        for thread in self.threads:
+            thread.join(remaining())
+        running = [thread.name for thread in self.threads if thread.is_alive()]
+        if running:
+            logger.warning(
+                "Stopped waiting for %s with about %d tasks queued",
+                ", ".join(running),
+                self.queue.qsize(),
+            )
+        self.threads = []
+        self._pid = None
+        return not running
+
+    def join(self):
+        """Blocks until every queued task has run"""
+        self.queue.join()
+        if self.durable:
+            self.drain()
+
+    def work(self, poll: bool = False):
+        """Runs tasks until stop() is called
+
+        Args:
+            poll (bool): also drain the table every TASK_POLL_INTERVAL seconds
+        """
+        timeout = self.app.config["TASK_POLL_INTERVAL"] if poll else None
+        while True:
+            try:
+                item = self.queue.get(timeout=timeout if self.durable else None)
+            except queue.Empty:
+                # Retries and tasks of workers that died wake nobody up
+                self.drain()
+                continue
+            try:
+                if item is StopIteration:
+                    return
+                if self.durable:
+                    self.drain()
+                else:
+                    self.run(*item)
+            finally:
+                self.queue.task_done()
+                TASK_QUEUE_DEPTH.set(self.queue.qsize())
+
+    def drain(self):
+        """Runs database tasks until none are due"""
+        while self.claim_and_run():
+            pass
+
+    def claim_and_run(self) -> bool:
+        """Claims the next due task from the database and runs it
+
+        Returns:
+            bool: False if there was nothing to claim
+        """
+        with self.app.app_context():
+            claimed = self.claim()
+        if claimed is None:
+            return False
+        task_id, name, args = claimed
+        ok = self.run(name, args)
+        with self.app.app_context():
+            self.finish(task_id, ok)
+        return True
+
+    def claim(self):
+        """Marks the next due task as running and returns (id, name, args)"""
+        now = datetime.utcnow()
+        lease = now - timedelta(seconds=self.app.config["TASK_LEASE"])
+        due = (
+            db.select(QueuedTask.id)
+            .where(
+                db.or_(
+                    db.and_(
+                        QueuedTask.status == "pending", QueuedTask.run_after <= now
+                    ),
+                    # a worker that died mid task leaves it running
+                    db.and_(
+                        QueuedTask.status == "running", QueuedTask.started_at < lease
+                    ),
+                )
+            )
+            .order_by(QueuedTask.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        row = db.session.execute(
+            db.update(QueuedTask)
+            .where(QueuedTask.id == due.scalar_subquery())
+            .values(status="running", started_at=now, attempts=QueuedTask.attempts + 1)
+            .returning(QueuedTask.id, QueuedTask.name, QueuedTask.args)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        if row is None:
+            return None
+        return row.id, row.name, json.loads(row.args)
+
+    def finish(self, task_id: int, ok: bool):
+        """Deletes a finished task, or schedules a retry of a failed one"""
+        task = db.session.get(QueuedTask, task_id)
+        if ok:
+            db.session.delete(task)
+        elif task.attempts >= self.app.config["TASK_MAX_ATTEMPTS"]:
+            # keep it for inspection
+            task.status = "failed"
+        else:
+            task.status = "pending"
+            task.run_after = datetime.utcnow() + timedelta(seconds=2**task.attempts)
+        db.session.commit()
+
+
+@sa.event.listens_for(Session, "after_commit")
+def dispatch_tasks(session):
+    """Hands the tasks staged in session to their queues once it committed"""
+    for task_queue, name, args in session.info.pop("tasks", ()):
+        task_queue.dispatch(name, args)
+
+
+@sa.event.listens_for(Session, "after_soft_rollback")
+def drop_tasks(session, previous_transaction):
+    """Drops the tasks staged in session when its transaction rolls back"""
+    if previous_transaction.parent is None:
+        session.info.pop("tasks", None)
+
+
+# The task queue used by the service
+tasks = TaskQueue()
@@ -13,7 +13,116 @@ DATABASE_URI = os.getenv(
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_POOL_SIZE = 2
+
+# Configure the connection pool (see service/common/db_pool.py)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Statement timeout in milliseconds, 0 leaves the server default
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+# Set when connecting through PgBouncer so we don't pool on both sides
+DB_EXTERNAL_POOLER = os.getenv("DB_EXTERNAL_POOLER", "false").lower() == "true"
+
+# Read replicas for the reads of GET requests (see service/common/replicas.py),
+# a comma separated list of URIs. A replica more than DB_REPLICA_MAX_LAG
+# seconds behind is skipped, its lag is measured every DB_REPLICA_LAG_INTERVAL
+# seconds (0 measures it on every request)
+DB_REPLICA_URIS = [
+    uri.strip()
+    for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",")
+    if uri.strip()
+]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_LAG_INTERVAL = float(os.getenv("DB_REPLICA_LAG_INTERVAL", "1"))
+
+# Create missing tables when a worker boots, turn it off in production and
+# run "flask db-migrate" once per deployment instead
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "true").lower() == "true"
+
+# GET /health/ready serves the result of checks that run every
+# HEALTH_CHECK_INTERVAL seconds (0 runs them on every probe) and fails once
+# it is older than HEALTH_CHECK_STALE seconds or the pooled connections in
+# use reach HEALTH_POOL_MAX_USAGE of the pool size plus overflow
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_STALE = float(os.getenv("HEALTH_CHECK_STALE", "15"))
+HEALTH_POOL_MAX_USAGE = float(os.getenv("HEALTH_POOL_MAX_USAGE", "1.0"))
+
+# ASGI serving mode (see asgi.py), the async URI defaults to DATABASE_URI
+# with an async driver swapped in
+ASYNC_DATABASE_URI = os.getenv("ASYNC_DATABASE_URI")
+ASGI_MAX_THREADS = int(os.getenv("ASGI_MAX_THREADS", "8"))
+
+# JSON encoder for response bodies, "orjson" falls back to "stdlib" when
+# orjson isn't installed
+JSON_ENCODER = os.getenv("JSON_ENCODER", "orjson")
+
+# Resolved alerts older than this are purged by "flask alerts-purge"
+ALERT_RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", "30"))
+ALERT_PURGE_BATCH = int(os.getenv("ALERT_PURGE_BATCH", "1000"))
+
+# Background tasks, see service/common/tasks.py
+TASK_BACKEND = os.getenv("TASK_BACKEND", "memory")  # memory or database
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "2"))
+TASK_QUEUE_SIZE = int(os.getenv("TASK_QUEUE_SIZE", "1000"))
+TASK_ENQUEUE_TIMEOUT = float(os.getenv("TASK_ENQUEUE_TIMEOUT", "0.1"))
+# Commits wake the workers up, polling only finds retries and lost tasks
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "30"))
+TASK_LEASE = int(os.getenv("TASK_LEASE", "300"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "5"))
+TASK_EAGER = os.getenv("TASK_EAGER", "false").lower() == "true"
+# Seconds a gunicorn worker that is shutting down waits for its tasks
+TASK_STOP_TIMEOUT = float(os.getenv("TASK_STOP_TIMEOUT", "10"))
+
+# Response compression, brotli is used when the brotli package is installed
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "64"))
+
+# Seconds between keepalive comments on GET /inventory/events, and how many
+# subscribers one process serves
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "100"))
+# A subscriber of the Flask endpoint holds a thread while connected, so it
+# may use all but one of the worker's GUNICORN_THREADS by default
+EVENTS_MAX_THREADS = int(
+    os.getenv("EVENTS_MAX_THREADS")
+    or max(1, int(os.getenv("GUNICORN_THREADS", "4")) - 1)
+)
+# Bulk requests that change more Inventory send one reload event instead
+EVENTS_BULK_MAX = int(os.getenv("EVENTS_BULK_MAX", "100"))
+
+# Pagination and streaming of inventory lists
+INVENTORY_PAGE_MAX = int(os.getenv("INVENTORY_PAGE_MAX", "1000"))
+INVENTORY_STREAM_BATCH = int(os.getenv("INVENTORY_STREAM_BATCH", "500"))
+
+# Maximum number of items accepted by the bulk endpoints
+INVENTORY_BULK_MAX = int(os.getenv("INVENTORY_BULK_MAX", "50000"))
+
+# Read-through cache for single Inventory lookups
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+# Database instrumentation (see service/common/instrumentation.py): log
+# statements slower than DB_SLOW_QUERY_SECONDS (0 turns it off) and requests
+# that run one statement DB_REPEATED_QUERY_THRESHOLD times or more, and add
+# a Server-Timing header with the database time of each request
+DB_SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_SECONDS", "0.5"))
+DB_REPEATED_QUERY_THRESHOLD = int(os.getenv("DB_REPEATED_QUERY_THRESHOLD", "10"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+# Fail requests that issue more statements than their query budget, meant for
+# the tests. DB_QUERY_BUDGET is the budget of views without their own, 0 for none
+DB_QUERY_BUDGET_ENFORCE = (
+    os.getenv("DB_QUERY_BUDGET_ENFORCE", "false").lower() == "true"
+)
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", "0"))
+
+# Directory shared by gunicorn workers for multi-process metrics
+METRICS_DIR = os.getenv("METRICS_DIR")
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
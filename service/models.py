@@ -4,28 +4,292 @@ Models for Inventory
 All of the models are stored in this module
 """
 
+# pylint: disable=too-many-lines
+
 import logging
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from functools import lru_cache
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from service.common.cache import cache
+from service.common.replicas import RoutingSession, read_primary
+from service.common.serializers import RowSerializer
 
 logger = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+# Create the SQLAlchemy object to be initialized later in init_db(), its
+# sessions send the reads of GET requests to the read replicas if there are any
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+class next_revision(FunctionElement):  # pylint: disable=invalid-name,too-many-ancestors
+    """SQL expression for the next revision of the change feed
+
+    Revisions must be handed out in commit order: a reader that has seen
+    revision N must never later find a row committed with a revision below
+    N, or GET /inventory/changes?since=N skips it and the ETags built on the
+    highest revision stay the same although the data changed.
+
+    PostgreSQL takes it from next_inventory_revision(), which increments the
+    single row of RevisionCounter. The row lock is held until the transaction
+    ends, so writers take their revisions one transaction at a time. Other
+    databases use one more than the highest revision handed out so far,
+    which is safe because SQLite only has one writer, but gives every row
+    written by one statement the same revision.
+    """
+
+    type = db.BigInteger()
+    inherit_cache = True
+
+
+@compiles(next_revision)
+def compile_next_revision(
+    element, compiler, **kwargs
+):  # pylint: disable=unused-argument
+    """Compiles next_revision() as the highest revision plus one
+
+    Each max() is a scalar subquery of its own, like those of
+    latest_revision_query(), so both are read from the end of a revision
+    index. The two argument max() is SQLite's greatest(). correlate(None)
+    keeps the FROM inventory of the first one inside an UPDATE of inventory.
+    """
+    highest = (
+        db.select(db.func.max(column)).correlate(None).scalar_subquery()
+        for column in (Inventory.revision, InventoryTombstone.revision)
+    )
+    latest = db.func.max(*(db.func.coalesce(revision, 0) for revision in highest))
+    return compiler.process(latest + 1, **kwargs)
+
+
+@compiles(next_revision, "postgresql")
+def compile_next_revision_postgresql(
+    element, compiler, **kwargs
+):  # pylint: disable=unused-argument
+    """Compiles next_revision() as a call of next_inventory_revision()"""
+    return compiler.process(db.func.next_inventory_revision(), **kwargs)
 
 
 class Alert(db.Model):
+    """
+    Class that represents a low stock Alert
+
+    A product has at most one open Alert. While it stays below its restock
+    level the open Alert is updated instead of inserting another one, and it
+    is resolved once the product is restocked.
+    """
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey("inventory.id"), nullable=False)
     message = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # How many times the low stock condition was seen while the Alert was open
+    occurrences = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_alert_product_created", "product_id", "created_at"),
+        # At most one open Alert per product, also the target of the upsert
+        db.Index(
+            "ix_alert_open_product",
+            "product_id",
+            unique=True,
+            postgresql_where=resolved_at.is_(None),
+            sqlite_where=resolved_at.is_(None),
+        ),
+    )
+
+    @classmethod
+    def for_low_stock(cls, product_id, name, quantity, restock_level):
+        """Returns a low stock Alert for an Inventory"""
+        return cls(
+            product_id=product_id,
+            message=cls.low_stock_message(name, quantity, restock_level),
+        )
+
+    @staticmethod
+    def low_stock_message(name, quantity, restock_level):
+        """Returns the message of a low stock Alert"""
+        return (
+            f"Low Stock Alert: Item '{name}' has quantity {quantity}, "
+            f"below restock level {restock_level}"
+        )
+
+    @classmethod
+    def record_low_stock(cls, product_id, name, quantity, restock_level):
+        """Inserts a low stock Alert unless one is already open
+
+        An open Alert is rolled up instead: its message, occurrences and
+        last_seen_at are updated. Both happen in one INSERT ... ON CONFLICT
+        on the unique index of open Alerts, so concurrent checks of the same
+        product can't open two. Nothing is committed, so the Alert is written
+        in the caller's transaction.
+
+        Returns:
+            bool: True if a new Alert was inserted
+        """
+        now = datetime.utcnow()
+        message = cls.low_stock_message(name, quantity, restock_level)
+        insert = (
+            postgresql.insert
+            if db.engine.dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        statement = insert(cls).values(
+            product_id=product_id,
+            message=message,
+            created_at=now,
+            last_seen_at=now,
+            occurrences=1,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[cls.product_id],
+            index_where=cls.resolved_at.is_(None),
+            set_={
+                "message": message,
+                "occurrences": cls.occurrences + 1,
+                "last_seen_at": now,
+            },
+        ).returning(cls.occurrences)
+        return db.session.execute(statement).scalar_one() == 1
+
+    @classmethod
+    def check_stock(cls, product_id):
+        """Records or resolves the low stock Alert of a product and commits
+
+        The current quantity is read here rather than passed in, so checks
+        that run late or out of order still leave the Alert matching the
+        latest stock level.
+
+        Returns:
+            Row: the product's id, name, quantity and restock_level if it is
+            low on stock, otherwise None
+        """
+        row = db.session.execute(
+            db.select(
+                Inventory.id,
+                Inventory.name,
+                Inventory.quantity,
+                Inventory.restock_level,
+            ).where(Inventory.id == product_id)
+        ).first()
+        low_stock = row is not None and row.quantity < row.restock_level
+        if low_stock:
+            cls.record_low_stock(row.id, row.name, row.quantity, row.restock_level)
+        else:
+            cls.resolve(product_id)
+        db.session.commit()
+        return row if low_stock else None
+
+    @classmethod
+    def resolve(cls, product_id):
+        """Resolves the open Alert of a product in the caller's transaction"""
+        db.session.execute(
+            db.update(cls)
+            .where(cls.product_id == product_id, cls.resolved_at.is_(None))
+            .values(resolved_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    def find_page(
+        cls,
+        *,
+        product_id=None,
+        since=None,
+        until=None,
+        is_open=None,
+        after=None,
+        limit=None,
+    ):  # pylint: disable=too-many-arguments
+        """Returns one keyset page of Alerts ordered by id
+
+        Args:
+            product_id (int): only return Alerts for this product
+            since (datetime): only return Alerts created at or after this time
+            until (datetime): only return Alerts created before this time
+            is_open (bool): only return open (True) or resolved (False) Alerts
+            after (int): only return Alerts with an id greater than this cursor
+            limit (int): the maximum number of Alerts to return
+        """
+        logger.info("Processing alert page query after %s limit %s ...", after, limit)
+        statement = db.select(*cls.__table__.columns)
+        if product_id is not None:
+            statement = statement.where(cls.product_id == product_id)
+        if since is not None:
+            statement = statement.where(cls.created_at >= since)
+        if until is not None:
+            statement = statement.where(cls.created_at < until)
+        if is_open is not None:
+            statement = statement.where(
+                cls.resolved_at.is_(None) if is_open else cls.resolved_at.is_not(None)
+            )
+        if after is not None:
+            statement = statement.where(cls.id > after)
+        return db.session.execute(statement.order_by(cls.id).limit(limit)).all()
+
+    @classmethod
+    def purge(cls, before, batch_size=1000):
+        """Deletes resolved Alerts created before a cutoff, a batch at a time
+
+        Every batch is its own short transaction so a large purge never holds
+        locks on the table for long. Open Alerts are always kept.
+
+        Args:
+            before (datetime): delete Alerts created before this time
+            batch_size (int): the number of Alerts to delete per transaction
+        Returns:
+            int: the number of Alerts deleted
+        """
+        logger.info("Purging resolved alerts created before %s ...", before)
+        deleted = 0
+        while True:
+            ids = db.session.scalars(
+                db.select(cls.id)
+                .where(cls.created_at < before, cls.resolved_at.is_not(None))
+                .order_by(cls.id)
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                return deleted
+            db.session.execute(
+                db.delete(cls)
+                .where(cls.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            deleted += len(ids)
+
+    def serialize(self):
+        """Serializes an Alert into a dictionary"""
+        return {
+            "id": self.id,
+            "product_id": self.product_id,
+            "message": self.message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "occurrences": self.occurrences,
+            "last_seen_at": (
+                self.last_seen_at.isoformat() if self.last_seen_at else None
+            ),
+            "resolved_at": self.resolved_at.isoformat() if self.resolved_at else None,
+        }
+
+
+class ConflictError(Exception):
+    """Used when a write conflicts with the current state of a resource"""
+
+
+class RevisionConflictError(ConflictError):
+    """Used when a conditional write finds a resource at another revision"""
 
 
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
-class Inventory(db.Model):
+class Inventory(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Inventory
     """
@@ -34,12 +298,34 @@ class Inventory(db.Model):
     # Table Schema
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(63))
+    name = db.Column(db.String(63), index=True)
     quantity = db.Column(db.Integer)
-    condition = db.Column(db.String(24))
+    condition = db.Column(db.String(24), index=True)
     restock_level = db.Column(db.Integer, nullable=False, default=0)
+    # Set on every insert and update, by ORM and bulk statements alike, so
+    # GET /inventory/changes can return the rows changed since a revision
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    revision = db.Column(
+        db.BigInteger, nullable=False, default=next_revision(), onupdate=next_revision()
+    )
 
-    # Todo: Place the rest of your schema here...
+    __table_args__ = (
+        db.Index("ix_inventory_revision", "revision", "id"),
+        # Partial index so low stock queries only touch the rows that match
+        db.Index(
+            "ix_inventory_low_stock",
+            "id",
+            postgresql_where=quantity < restock_level,
+            sqlite_where=quantity < restock_level,
+        ),
+    )
+
+    # Columns that the list endpoint may sort by
+    SORT_KEYS = ("id", "name", "quantity", "condition", "restock_level")
+    # Columns that the summary endpoint may group by
+    SUMMARY_GROUPS = ("condition",)
 
     def __repr__(self):
         return f"<Inventory {self.name} id=[{self.id}]>"
@@ -58,39 +344,67 @@ class Inventory(db.Model):
             logger.error("Error creating record: %s", self)
             raise DataValidationError(e) from e
 
-    def update(self):
+    def update(self, revision=None):
         """
         Updates a Inventory to the database
+
+        Args:
+            revision (int): only update if the Inventory is still at this
+                revision, checked in the UPDATE itself so a write that lands
+                in between is never overwritten, see update_columns()
+        Raises:
+            ConflictError: if the Inventory is no longer at revision
         """
         logger.info("Saving %s", self.name)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
+        if revision is not None:
+            values = self.columns()
+            # Drop the pending changes so they aren't flushed without the condition
+            db.session.expire(self)
+            if Inventory.update_columns(self.id, values, [revision]) is None:
+                raise ConflictError(f"Inventory with id '{self.id}' was deleted")
+            return
         try:
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             logger.error("Error updating record: %s", self)
             raise DataValidationError(e) from e
+        cache.delete(self.id)
 
     def delete(self):
         """Removes a Inventory from the data store"""
         logger.info("Deleting %s", self.name)
         try:
+            db.session.add(InventoryTombstone(inventory_id=self.id))
             db.session.delete(self)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             logger.error("Error deleting record: %s", self)
             raise DataValidationError(e) from e
+        cache.delete(self.id)
+
+    def columns(self):
+        """Returns the column values of a Inventory for bulk statements"""
+        return {
+            "name": self.name,
+            "quantity": self.quantity,
+            "condition": self.condition,
+            "restock_level": self.restock_level,
+        }
 
     def serialize(self):
         """Serializes a Inventory into a dictionary"""
         return {
             "id": self.id,
             "name": self.name,
-            "quantity": int(self.quantity),
+            "quantity": self.quantity,
             "condition": self.condition,
-            "restock_level": int(self.restock_level),
+            "restock_level": self.restock_level,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "revision": self.revision,
         }
 
     def deserialize(self, data):
@@ -111,7 +425,7 @@ class Inventory(db.Model):
             raise DataValidationError(
                 "Invalid Inventory: missing " + error.args[0]
             ) from error
-        except TypeError as error:
+        except (TypeError, ValueError) as error:
             raise DataValidationError(
                 "Invalid Inventory: body of request contained bad or no data "
                 + str(error)
@@ -129,10 +443,400 @@ class Inventory(db.Model):
         return cls.query.all()
 
     @classmethod
-    def find(cls, by_id):
-        """Finds a Inventory by it's ID"""
+    def bulk_create(cls, rows):
+        """Inserts many Inventory with one statement in one transaction
+
+        Args:
+            rows (list): dictionaries of column values, see columns()
+        Returns:
+            list: the new ids in the same order as rows
+        """
+        logger.info("Bulk creating %d Inventory", len(rows))
+        if not rows:
+            return []
+        statement = db.insert(cls).returning(cls.id, sort_by_parameter_order=True)
+        try:
+            ids = db.session.scalars(statement, rows).all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error bulk creating %d records", len(rows))
+            raise DataValidationError(e) from e
+        return ids
+
+    @classmethod
+    def bulk_update(cls, rows):
+        """Updates many Inventory by primary key in one transaction
+
+        Args:
+            rows (list): dictionaries of column values that include the id
+        Returns:
+            set: the ids that were found and updated
+        """
+        logger.info("Bulk updating %d Inventory", len(rows))
+        ids = [row["id"] for row in rows]
+        table = cls.__table__
+        statement = (
+            db.update(table)
+            .where(table.c.id == db.bindparam("_id"))
+            .values(
+                name=db.bindparam("name"),
+                quantity=db.bindparam("quantity"),
+                condition=db.bindparam("condition"),
+                restock_level=db.bindparam("restock_level"),
+            )
+        )
+        try:
+            found = set(db.session.scalars(db.select(cls.id).where(cls.id.in_(ids))))
+            params = [
+                {"_id": row["id"], **{k: v for k, v in row.items() if k != "id"}}
+                for row in rows
+                if row["id"] in found
+            ]
+            if params:
+                db.session.execute(statement, params)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error bulk updating %d records", len(rows))
+            raise DataValidationError(e) from e
+        for by_id in found:
+            cache.delete(by_id)
+        return found
+
+    @classmethod
+    def bulk_delete(cls, ids):
+        """Removes many Inventory with one statement in one transaction
+
+        Args:
+            ids (list): the ids of the Inventory to remove
+        Returns:
+            set: the ids that were found and removed
+        """
+        logger.info("Bulk deleting %d Inventory", len(ids))
+        tombstones = db.insert(InventoryTombstone).from_select(
+            ["inventory_id"], db.select(cls.id).where(cls.id.in_(ids))
+        )
+        statement = db.delete(cls).where(cls.id.in_(ids)).returning(cls.id)
+        try:
+            db.session.execute(tombstones)
+            found = set(db.session.scalars(statement))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error bulk deleting %d records", len(ids))
+            raise DataValidationError(e) from e
+        for by_id in found:
+            cache.delete(by_id)
+        return found
+
+    @classmethod
+    def adjust_quantity(cls, by_id, delta, revisions=None):
+        """Atomically adds delta to the quantity of an Inventory
+
+        The change is made by one UPDATE ... RETURNING so concurrent
+        adjustments never overwrite each other. The low stock Alert is left
+        to Alert.check_stock() so it can run after the commit.
+
+        Args:
+            by_id (int): the id of the Inventory to adjust
+            delta (int): the amount to add, negative to remove stock
+            revisions (list): only adjust if the Inventory is still at one of
+                these revisions, None for any
+        Returns:
+            Row: the adjusted columns, or None if the Inventory was not found
+        Raises:
+            RevisionConflictError: if the Inventory is at none of the revisions
+            ConflictError: if stock would go negative
+        """
+        logger.info("Adjusting quantity of id %s by %s ...", by_id, delta)
+        statement = (
+            db.update(cls)
+            .where(cls.id == by_id, cls.quantity + delta >= 0)
+            .values(quantity=cls.quantity + delta)
+            .returning(
+                cls.id,
+                cls.name,
+                cls.quantity,
+                cls.condition,
+                cls.restock_level,
+                cls.revision,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if revisions is not None:
+            statement = statement.where(cls.revision.in_(revisions))
+        try:
+            row = db.session.execute(statement).first()
+            if row is None:
+                # nothing changed, and whatever was staged with it is dropped
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error adjusting record: %s", by_id)
+            raise DataValidationError(e) from e
+        if row is not None:
+            cache.delete(by_id)
+            return row
+
+        # Only the failure path pays for a second query to explain itself
+        current = db.session.execute(
+            db.select(cls.quantity, cls.revision).where(cls.id == by_id)
+        ).first()
+        if current is None:
+            return None
+        if revisions is not None and current.revision not in revisions:
+            raise RevisionConflictError(
+                f"Inventory with id '{by_id}' is at revision {current.revision}."
+            )
+        raise ConflictError(
+            f"Inventory with id '{by_id}' has quantity {current.quantity}, cannot adjust by {delta}"
+        )
+
+    @classmethod
+    def update_columns(cls, by_id, values, revisions=None):
+        """Writes the columns of an Inventory with one UPDATE ... RETURNING
+
+        Nothing is read first: the UPDATE itself checks the revision, and
+        only when it changes no row does a second query tell a missing
+        Inventory from one at another revision.
+
+        Args:
+            by_id (int): the id of the Inventory to update
+            values (dict): the column values, see columns()
+            revisions (list): only update if the Inventory is still at one
+                of these revisions, None for any
+        Returns:
+            Row: every column after the update, or None if the Inventory
+                was not found
+        Raises:
+            RevisionConflictError: if the Inventory is at none of the revisions
+        """
+        logger.info("Updating id %s at revisions %s ...", by_id, revisions)
+        statement = (
+            db.update(cls)
+            .where(cls.id == by_id)
+            .values(**values)
+            .returning(*cls.__table__.columns)
+            .execution_options(synchronize_session=False)
+        )
+        if revisions is not None:
+            statement = statement.where(cls.revision.in_(revisions))
+        try:
+            row = db.session.execute(statement).first()
+            if row is None:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating record: %s", by_id)
+            raise DataValidationError(e) from e
+        if row is not None:
+            cache.delete(by_id)
+            return row
+        if revisions is None:
+            return None
+
+        revision = db.session.execute(
+            db.select(cls.revision).where(cls.id == by_id)
+        ).scalar()
+        if revision is None:
+            return None
+        raise RevisionConflictError(
+            f"Inventory with id '{by_id}' is at revision {revision}."
+        )
+
+    @classmethod
+    def find_low_stock(cls, after=None, limit=None):
+        """Returns the id, quantity and restock_level of low stock Inventory
+
+        The comparison is done by the database and only the three columns are
+        read, so no Inventory objects are created.
+
+        Args:
+            after (int): only return Inventory with an id greater than this cursor
+            limit (int): the maximum number of rows to return
+        """
+        logger.info("Processing low stock query after %s limit %s ...", after, limit)
+        statement = db.select(cls.id, cls.quantity, cls.restock_level).where(
+            cls.quantity < cls.restock_level
+        )
+        if after is not None:
+            statement = statement.where(cls.id > after)
+        statement = statement.order_by(cls.id).limit(limit)
+        return db.session.execute(statement).all()
+
+    @classmethod
+    def latest_revision_query(cls):
+        """Returns a query for the highest revision of any Inventory or tombstone
+
+        It changes whenever an Inventory is created, updated or deleted, so it
+        is a cheap validator for anything read from the table. Each max() is
+        read from the end of a revision index.
+        """
+        revisions = db.union_all(
+            db.select(db.func.max(cls.revision).label("revision")),
+            db.select(db.func.max(InventoryTombstone.revision)),
+        ).subquery()
+        return db.select(db.func.coalesce(db.func.max(revisions.c.revision), 0))
+
+    @classmethod
+    def latest_revision(cls) -> int:
+        """Returns the highest revision of any Inventory or tombstone"""
+        return db.session.execute(cls.latest_revision_query()).scalar_one()
+
+    @classmethod
+    def summarize(cls, group_by=None):
+        """Returns the count, quantity totals and low stock count of Inventory
+
+        Everything is computed by a single aggregate query, so no rows leave
+        the database.
+
+        Args:
+            group_by (string): a column in SUMMARY_GROUPS to summarize by
+        Returns:
+            list: one Row per group ordered by group, or a single Row
+        """
+        logger.info("Processing summary query by %s ...", group_by)
+        if group_by is not None and group_by not in cls.SUMMARY_GROUPS:
+            raise DataValidationError(f"Invalid group_by: {group_by}")
+        low_stock = db.case((cls.quantity < cls.restock_level, 1), else_=0)
+        aggregates = [
+            db.func.count(cls.id).label("count"),
+            db.func.coalesce(db.func.sum(cls.quantity), 0).label("total_quantity"),
+            db.func.min(cls.quantity).label("min_quantity"),
+            db.func.max(cls.quantity).label("max_quantity"),
+            db.func.coalesce(db.func.sum(low_stock), 0).label("low_stock_count"),
+        ]
+        if group_by is None:
+            return db.session.execute(db.select(*aggregates)).all()
+        column = getattr(cls, group_by)
+        statement = db.select(column, *aggregates).group_by(column).order_by(column)
+        return db.session.execute(statement).all()
+
+    @classmethod
+    def stock_levels_query(cls):
+        """Returns a query for the (product_id, quantity) of every Inventory by id"""
+        return db.select(cls.id.label("product_id"), cls.quantity).order_by(cls.id)
+
+    @classmethod
+    def find_stock_levels(cls):
+        """Returns the (product_id, quantity) Rows of every Inventory ordered by id"""
+        logger.info("Processing stock levels query ...")
+        return db.session.execute(cls.stock_levels_query()).all()
+
+    @classmethod
+    def find_page(cls, query=None, after=None, limit=None):
+        """Returns one keyset page of Inventory ordered by id
+
+        Args:
+            query (Query): an optional filtered query to page through
+            after (int): only return Inventory with an id greater than this cursor
+            limit (int): the maximum number of Inventory to return
+        """
+        logger.info("Processing page query after %s limit %s ...", after, limit)
+        query = cls.query if query is None else query
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def stream(cls, query=None, after=None, batch_size=500):
+        """Yields Inventory ordered by id, fetching batch_size rows at a time
+
+        Args:
+            query (Query): an optional filtered query to stream
+            after (int): only return Inventory with an id greater than this cursor
+            batch_size (int): the number of rows to buffer from the cursor
+        """
+        logger.info("Processing streaming query after %s ...", after)
+        query = cls.query if query is None else query
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).yield_per(batch_size)
+
+    @classmethod
+    def find_changes(cls, since=0, after=None, limit=None):
+        """Returns the Inventory and tombstones changed after a revision
+
+        Both are read in (revision, id) order from their revision index, so
+        the cost follows the number of changes rather than the catalog size.
+
+        Args:
+            since (int): only return changes after this revision
+            after (int): also return changes at revision since with an id
+                greater than this, to continue a page that ended inside a
+                revision written by one bulk statement
+            limit (int): the maximum number of changes to return
+        Returns:
+            list: (deleted, Row) tuples ordered by revision and id
+        """
+        logger.info("Processing changes since %s after %s ...", since, after)
+
+        def page(table, id_column, columns):
+            statement = db.select(*columns)
+            if after is None:
+                statement = statement.where(table.revision > since)
+            else:
+                statement = statement.where(
+                    db.or_(
+                        table.revision > since,
+                        db.and_(table.revision == since, id_column > after),
+                    )
+                )
+            statement = statement.order_by(table.revision, id_column).limit(limit)
+            return db.session.execute(statement).all()
+
+        changed = page(cls, cls.id, cls.__table__.columns)
+        deleted = page(
+            InventoryTombstone,
+            InventoryTombstone.inventory_id,
+            [
+                InventoryTombstone.inventory_id.label("id"),
+                InventoryTombstone.revision,
+                InventoryTombstone.deleted_at.label("updated_at"),
+                db.literal(True).label("deleted"),
+            ],
+        )
+        changes = sorted(
+            [(False, row) for row in changed] + [(True, row) for row in deleted],
+            key=lambda change: (change[1].revision, change[1].id),
+        )
+        return changes[:limit]
+
+    @classmethod
+    def find_by_ids(cls, ids):
+        """Returns the Inventory with the given ids ordered by id"""
+        logger.info("Processing lookup of %d ids ...", len(ids))
+        return cls.query.filter(cls.id.in_(ids)).order_by(cls.id).all()
+
+    @classmethod
+    def find(cls, by_id, use_cache=False):
+        """Finds a Inventory by it's ID
+
+        Args:
+            by_id (int): the id of the Inventory to find
+            use_cache (bool): read through the cache. A cached Inventory is not
+                attached to the session, so only use this for read only lookups.
+                A miss is read from the primary, a lagging replica could
+                otherwise cache a version older than the last write
+        """
         logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.session.get(cls, by_id)
+        if not use_cache:
+            return cls.query.session.get(cls, by_id)
+        data = cache.get(by_id)
+        if data is not None:
+            if data.get("updated_at"):
+                data = dict(data, updated_at=datetime.fromisoformat(data["updated_at"]))
+            return cls(**data)
+        with read_primary(db.session):
+            inventory = db.session.get(cls, by_id)
+        if inventory:
+            cache.set(by_id, inventory.serialize())
+        return inventory
 
     @classmethod
     def find_by_name(cls, name):
@@ -150,16 +854,169 @@ class Inventory(db.Model):
         logger.info("Processing condition query for %s ...", condition)
         return cls.query.filter(cls.condition == condition)
 
+    @classmethod
+    def find_by_filters(  # pylint: disable=too-many-arguments
+        cls,
+        *,
+        name=None,
+        condition=None,
+        category=None,
+        min_quantity=None,
+        max_quantity=None,
+        low_stock=False,
+        sort=None,
+    ):
+        """Returns all Inventory matching every given filter in one query
+
+        Args:
+            name (string): the name of the Inventory you want to match
+            condition (string): the condition of the Inventory you want to match
+            category (string): the category of the Inventory you want to match
+            min_quantity (int): the smallest quantity to include
+            max_quantity (int): the largest quantity to include
+            low_stock (bool): only include Inventory below its restock level
+            sort (string): a column in SORT_KEYS, prefixed with "-" for descending
+        """
+        logger.info("Processing filtered query ...")
+        query = cls.query
+        if name:
+            query = query.filter(cls.name == name)
+        if condition:
+            query = query.filter(cls.condition == condition)
+        if category:
+            query = query.filter(db.false())
+        if min_quantity is not None:
+            query = query.filter(cls.quantity >= min_quantity)
+        if max_quantity is not None:
+            query = query.filter(cls.quantity <= max_quantity)
+        if low_stock:
+            query = query.filter(cls.quantity < cls.restock_level)
+        if sort:
+            key = sort.lstrip("-")
+            if key not in cls.SORT_KEYS:
+                raise DataValidationError(f"Invalid sort key: {key}")
+            column = getattr(cls, key)
+            order = column.desc() if sort.startswith("-") else column.asc()
+            query = query.order_by(order, cls.id)
+        return query
+
+    @classmethod
+    def projection(cls, fields=None):
+        """Returns the columns to select and the serializer for a sparse fieldset
+
+        The id is always selected, since paging needs it, but only the
+        requested fields are encoded.
+
+        Args:
+            fields (list): names of the columns to return, None for all of them,
+                blank names are ignored, e.g. the trailing one of "id,"
+        Returns:
+            tuple: (columns, RowSerializer)
+        """
+        fields = [name.strip() for name in fields or () if name.strip()]
+        if not fields:
+            return tuple(cls.__table__.columns), INVENTORY_JSON
+        unknown = set(fields).difference(cls.__table__.columns.keys())
+        if unknown:
+            raise DataValidationError(f"Invalid fields: {', '.join(sorted(unknown))}")
+        # Table order, so every spelling of a fieldset shares one serializer
+        names = tuple(name for name in cls.__table__.columns.keys() if name in fields)
+        selected = names if "id" in names else ("id",) + names
+        return (
+            tuple(cls.__table__.c[name] for name in selected),
+            inventory_json(names),
+        )
+
     @classmethod
     def find_by_category(cls, category):
         """Returns all Inventory with the given category
 
         Note: This is a placeholder method since category is not currently
-        implemented in the model. Returns an empty list.
+        implemented in the model. Returns a query that matches nothing.
 
         Args:
             category (string): the category of the Inventory you want to match
         """
         logger.info("Processing category query for %s ...", category)
-        # Since category is not implemented, return an empty list
-        return []
+        # Since category is not implemented, return an empty result
+        return cls.query.filter(db.false())
+
+
+class InventoryTombstone(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    Class that records a deleted Inventory for the change feed
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    revision = db.Column(db.BigInteger, nullable=False, default=next_revision())
+
+    __table_args__ = (
+        db.Index("ix_inventory_tombstone_revision", "revision", "inventory_id"),
+    )
+
+
+class RevisionCounter(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    Class that holds the last revision handed out on PostgreSQL
+
+    It has a single row, see next_revision()
+    """
+
+    __tablename__ = "inventory_revision_counter"
+
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.BigInteger, nullable=False)
+
+
+# Both are idempotent, so they also bring an existing database up to date.
+# The counter starts at the highest revision already written.
+NEXT_REVISION_FUNCTION = db.DDL("""
+    CREATE OR REPLACE FUNCTION next_inventory_revision() RETURNS bigint
+    LANGUAGE sql VOLATILE AS $$
+        UPDATE inventory_revision_counter SET revision = revision + 1 WHERE id = 1
+        RETURNING revision
+    $$
+    """)
+SEED_REVISION_COUNTER = db.DDL("""
+    INSERT INTO inventory_revision_counter (id, revision)
+    SELECT 1, COALESCE(GREATEST(
+        (SELECT max(revision) FROM inventory),
+        (SELECT max(revision) FROM inventory_tombstone)
+    ), 0)
+    ON CONFLICT (id) DO NOTHING
+    """)
+db.event.listen(
+    db.metadata,
+    "after_create",
+    SEED_REVISION_COUNTER.execute_if(dialect="postgresql"),
+)
+db.event.listen(
+    db.metadata,
+    "after_create",
+    NEXT_REVISION_FUNCTION.execute_if(dialect="postgresql"),
+)
+
+
+# Compiled JSON encoders that produce the same objects as serialize() for
+# list responses, without building a dict per row
+INVENTORY_JSON = RowSerializer.for_model(Inventory)
+ALERT_JSON = RowSerializer.for_model(Alert)
+TOMBSTONE_JSON = RowSerializer(
+    [
+        db.Column("id", db.Integer),
+        db.Column("revision", db.BigInteger),
+        db.Column("updated_at", db.DateTime),
+        db.Column("deleted", db.Boolean),
+    ]
+)
+STOCK_JSON = RowSerializer(
+    [db.Column("product_id", db.Integer), db.Column("quantity", db.Integer)]
+)
+
+
+@lru_cache(maxsize=128)
+def inventory_json(names: tuple) -> RowSerializer:
+    """Returns the serializer for a subset of the Inventory columns"""
+    return RowSerializer([Inventory.__table__.c[name] for name in names])
@@ -21,10 +21,41 @@ This service implements a REST API that allows you to Create, Read, Update
 and Delete Inventory
 """
 
-from flask import jsonify, request, url_for, abort, render_template
+import time
+from datetime import datetime
+from itertools import islice
+from flask import (
+    jsonify,
+    request,
+    url_for,
+    abort,
+    render_template,
+    Response,
+    stream_with_context,
+)
 from flask import current_app as app  # Import Flask application
-from service.models import Inventory, Alert, db
+from service.models import (
+    db,
+    Inventory,
+    Alert,
+    ConflictError,
+    DataValidationError,
+    RevisionConflictError,
+    ALERT_JSON,
+    INVENTORY_JSON,
+    STOCK_JSON,
+    TOMBSTONE_JSON,
+)
 from service.common import status  # HTTP Status Codes
+from service.common.cache import cache
+from service.common.compression import strong_etag
+from service.common.events import broker
+from service.common.tasks import tasks
+from service.common.health import health as readiness
+from service.common.instrumentation import observe_serialization, query_budget
+from service.common.replicas import read_primary
+from service.common.metrics import registry
+from service.common.serializers import RowSerializer
 
 
 ######################################################################
@@ -53,6 +84,7 @@ def index():
 # CREATE A NEW INVENTORY
 ######################################################################
 @app.route("/inventory", methods=["POST"])
+@query_budget(2)
 def create_inventory():
     """
     Create Inventory
@@ -70,6 +102,7 @@ def create_inventory():
     # Save the new Inventory to the database
     inventory.create()
     app.logger.info("Inventory with new id [%s] saved!", inventory.id)
+    publish_stock_event(inventory)
 
     # Return the location of the new Inventory
     # To Do: Uncomment this code when "get_inventory" is implemented
@@ -108,33 +141,40 @@ def check_content_type(content_type) -> None:
 # UPDATE AN EXISTING INVENTORY
 ######################################################################
 @app.route("/inventory/<int:inventory_id>", methods=["PUT"])
+@strong_etag
+@query_budget(2)
 def update_inventory(inventory_id):
     """
     Update a Inventory
 
-    This endpoint will update a Inventory based the body that is posted
+    This endpoint will update a Inventory based the body that is posted.
+    With If-Match it is only updated if its ETag still matches, otherwise
+    412 is returned so a concurrent update is never overwritten. The check
+    is made by the UPDATE itself, nothing is read before it.
     """
     app.logger.info("Request to Update a inventory with id [%s]", inventory_id)
     check_content_type("application/json")
 
-    # Attempt to find the Inventory and abort if not found
-    inventory = Inventory.find(inventory_id)
-    if not inventory:
+    data = request.get_json()
+    app.logger.info("Processing: %s", data)
+    values = Inventory().deserialize(data).columns()
+
+    try:
+        row = Inventory.update_columns(inventory_id, values, if_match_revisions())
+    except ConflictError as error:
+        abort(status.HTTP_412_PRECONDITION_FAILED, str(error))
+    if row is None:
         abort(
             status.HTTP_404_NOT_FOUND,
             f"Inventory with id '{inventory_id}' was not found.",
         )
-
-    # Update the Inventory with the new data
-    data = request.get_json()
-    app.logger.info("Processing: %s", data)
-    inventory.deserialize(data)
-
-    # Save the updates to the database
-    inventory.update()
+    inventory = Inventory(**row._asdict())
+    publish_stock_event(inventory)
 
     app.logger.info("Inventory with ID: %d updated.", inventory.id)
-    return jsonify(inventory.serialize()), status.HTTP_200_OK
+    response = jsonify(inventory.serialize())
+    response.set_etag(str(inventory.revision))
+    return response
 
 
 ######################################################################
@@ -143,30 +183,69 @@ def update_inventory(inventory_id):
 
 
 @app.route("/inventory/<int:inventory_id>", methods=["GET"])
+@strong_etag
+@query_budget(1)
 def get_inventory(inventory_id):
     """
     Retrieve a single Inventory
 
-    This endpoint will return a Inventory based on it's id
+    This endpoint will return a Inventory based on it's id. The ETag is its
+    revision and a matching If-None-Match returns 304 without a body. The
+    ETag is sent back in If-Match, so it is only read through the cache
+    when that is shared: another worker's write doesn't clear this
+    worker's in-process copy, which would keep serving the old revision.
     """
     app.logger.info("Request to Retrieve a inventory with id [%s]", inventory_id)
 
     # Attempt to find the Inventory and abort if not found
-    inventory = Inventory.find(inventory_id)
+    inventory = Inventory.find(inventory_id, use_cache=cache.shared)
     if not inventory:
         abort(
             status.HTTP_404_NOT_FOUND,
             f"Inventory with id '{inventory_id}' was not found.",
         )
 
+    etag = str(inventory.revision)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
     app.logger.info("Returning inventory: %s", inventory.name)
-    return jsonify(inventory.serialize()), status.HTTP_200_OK
+    response = jsonify(inventory.serialize())
+    response.set_etag(etag)
+    return response
+
+
+def if_match_revisions():
+    """Returns the revisions If-Match accepts, None without it or for *
+
+    If-Match only uses the strong comparison, so W/"N" matches nothing.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    return [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+
+
+def not_modified(etag: str):
+    """Returns a 304 response if If-None-Match has etag, otherwise None
+
+    Every ETag is a revision, see Inventory.latest_revision(), so it can be
+    checked before anything is read or serialized. If-None-Match uses the
+    weak comparison, so W/"N" from a proxy also matches, as in asgi.py.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    app.logger.info("Not modified since revision %s", etag)
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response.set_etag(etag)
+    return response
 
 
 ######################################################################
 # DELETE AN INVENTORY
 ######################################################################
 @app.route("/inventory/<int:inventory_id>", methods=["DELETE"])
+@query_budget(3)
 def delete_inventory(inventory_id):
     """
     Delete a Inventory
@@ -180,40 +259,307 @@ def delete_inventory(inventory_id):
     if inventory:
         app.logger.info("Inventory with ID: %d found.", inventory.id)
         inventory.delete()
+        broker.publish("deleted", {"id": inventory_id})
 
     app.logger.info("Inventory with ID: %d delete complete.", inventory_id)
     return {}, status.HTTP_204_NO_CONTENT
 
 
+######################################################################
+# BULK CREATE, UPDATE AND DELETE INVENTORY
+######################################################################
+@app.route("/inventory/bulk", methods=["POST"])
+def bulk_create_inventory():
+    """
+    Create a batch of Inventory
+
+    This endpoint validates every item in the posted array and inserts the
+    valid ones with a single statement and commit. It returns one result
+    per item in the order they were posted.
+    """
+    app.logger.info("Request to Bulk Create Inventory...")
+    check_content_type("application/json")
+    items = get_bulk_items()
+
+    results = [None] * len(items)
+    rows = []
+    for position, data in enumerate(items):
+        try:
+            rows.append((position, Inventory().deserialize(data).columns()))
+        except DataValidationError as error:
+            results[position] = bulk_result(
+                position, status.HTTP_400_BAD_REQUEST, error=str(error)
+            )
+
+    ids = Inventory.bulk_create([row for _, row in rows])
+    for (position, _), new_id in zip(rows, ids):
+        results[position] = bulk_result(position, status.HTTP_201_CREATED, id=new_id)
+
+    publish_bulk_events(changed=ids)
+    app.logger.info("Bulk created %d of %d inventory", len(ids), len(items))
+    return jsonify(results), status.HTTP_200_OK
+
+
+@app.route("/inventory/bulk", methods=["PATCH"])
+def bulk_update_inventory():
+    """
+    Update a batch of Inventory
+
+    Every item in the array must carry its id and a full Inventory body. All
+    of the valid items are updated in one transaction.
+    """
+    app.logger.info("Request to Bulk Update Inventory...")
+    check_content_type("application/json")
+    items = get_bulk_items()
+
+    results = [None] * len(items)
+    rows = []
+    for position, data in enumerate(items):
+        try:
+            if not isinstance(data, dict) or not isinstance(data.get("id"), int):
+                raise DataValidationError("Invalid Inventory: missing id")
+            row = Inventory().deserialize(data).columns()
+            row["id"] = data["id"]
+            rows.append((position, row))
+        except DataValidationError as error:
+            results[position] = bulk_result(
+                position, status.HTTP_400_BAD_REQUEST, error=str(error)
+            )
+
+    found = Inventory.bulk_update([row for _, row in rows])
+    for position, row in rows:
+        if row["id"] in found:
+            results[position] = bulk_result(position, status.HTTP_200_OK, id=row["id"])
+        else:
+            results[position] = bulk_result(
+                position,
+                status.HTTP_404_NOT_FOUND,
+                id=row["id"],
+                error=f"Inventory with id '{row['id']}' was not found.",
+            )
+
+    publish_bulk_events(changed=found)
+    app.logger.info("Bulk updated %d of %d inventory", len(found), len(items))
+    return jsonify(results), status.HTTP_200_OK
+
+
+@app.route("/inventory/bulk", methods=["DELETE"])
+def bulk_delete_inventory():
+    """
+    Delete a batch of Inventory
+
+    This endpoint takes an array of ids and removes them with one statement.
+    Like the single delete, ids that do not exist are not an error.
+    """
+    app.logger.info("Request to Bulk Delete Inventory...")
+    check_content_type("application/json")
+    ids = get_bulk_items()
+    if not all(isinstance(inventory_id, int) for inventory_id in ids):
+        abort(status.HTTP_400_BAD_REQUEST, "Bulk delete requires an array of ids")
+
+    found = Inventory.bulk_delete(ids)
+    results = [
+        bulk_result(
+            position,
+            (
+                status.HTTP_204_NO_CONTENT
+                if inventory_id in found
+                else status.HTTP_404_NOT_FOUND
+            ),
+            id=inventory_id,
+        )
+        for position, inventory_id in enumerate(ids)
+    ]
+
+    publish_bulk_events(deleted=found)
+    app.logger.info("Bulk deleted %d of %d inventory", len(found), len(ids))
+    return jsonify(results), status.HTTP_200_OK
+
+
+def get_bulk_items() -> list:
+    """Returns the JSON array posted to a bulk endpoint"""
+    items = request.get_json()
+    if not isinstance(items, list):
+        abort(status.HTTP_400_BAD_REQUEST, "Bulk requests must be a JSON array")
+    if len(items) > app.config["INVENTORY_BULK_MAX"]:
+        abort(
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            f"Bulk requests are limited to {app.config['INVENTORY_BULK_MAX']} items",
+        )
+    return items
+
+
+def bulk_result(position: int, code: int, **kwargs) -> dict:
+    """Builds the result of one item of a bulk request"""
+    return {"index": position, "status": code, **kwargs}
+
+
 ######################################################################
 # LIST ALL INVENTORY
 ######################################################################
 @app.route("/inventory", methods=["GET"])
+@query_budget(2)
 def list_inventory():
-    ...
-    condition = request.args.get("condition")
-    category = request.args.get("category")
-    name = request.args.get("name")
-
-    if condition:
-        app.logger.info("Find by condition: %s", condition)
-        inventory = Inventory.find_by_condition(condition)
-    elif category:
-        inventory = Inventory.find_by_category(category)
-    elif name:
-        inventory = Inventory.find_by_name(name)
-    else:
-        inventory = Inventory.all()
+    """
+    List Inventory
+
+    Returns all of the Inventory. The name, condition, category,
+    min_quantity, max_quantity and low_stock filters may be combined and are
+    applied in a single query, optionally ordered by ``sort``. Passing
+    ``limit`` (and ``after`` for subsequent pages) returns a single keyset
+    page ordered by id, with the next cursor in the ``Link`` and
+    ``X-Next-Cursor`` headers. Passing ``stream=true`` streams the JSON array
+    from a server-side cursor so memory stays bounded for large tables.
+    The ETag is the latest revision of the table, so a matching
+    If-None-Match returns 304 before the list is queried. ``fields`` takes a
+    comma separated list of columns and only those are selected and encoded.
+    """
+    app.logger.info("Request for Inventory list")
+    after = request.args.get("after", type=int)
+    limit = request.args.get("limit", type=int)
+    sort = request.args.get("sort")
+    if sort and (after is not None or limit is not None):
+        abort(
+            status.HTTP_400_BAD_REQUEST, "sort cannot be combined with after or limit"
+        )
 
-    results = [item.serialize() for item in inventory]
-    app.logger.info("Returning %d inventory", len(results))
-    return jsonify(results), status.HTTP_200_OK
+    etag = str(Inventory.latest_revision())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    query = Inventory.find_by_filters(
+        name=request.args.get("name"),
+        condition=request.args.get("condition"),
+        category=request.args.get("category"),
+        min_quantity=request.args.get("min_quantity", type=int),
+        max_quantity=request.args.get("max_quantity", type=int),
+        low_stock=request.args.get("low_stock", "").lower() == "true",
+        sort=sort,
+    )
+
+    fields = request.args.get("fields")
+    columns, serializer = Inventory.projection(fields.split(",") if fields else None)
+    # Plain rows are enough to encode, skip building an ORM object per row
+    query = query.with_entities(*columns)
+
+    if request.args.get("stream", "").lower() == "true":
+        rows = Inventory.stream(query, after, app.config["INVENTORY_STREAM_BATCH"])
+        return (
+            Response(
+                stream_with_context(stream_json_array(rows, serializer)),
+                mimetype="application/json",
+                headers={"ETag": f'"{etag}"'},
+            ),
+            status.HTTP_200_OK,
+        )
+
+    if limit is None and after is None:
+        results = query.all()
+        app.logger.info("Returning %d inventory", len(results))
+        return rows_response(serializer, results, {"ETag": f'"{etag}"'})
+
+    limit = get_page_limit(limit)
+
+    # Fetch one extra row so we know whether there is a next page
+    page = Inventory.find_page(query, after, limit + 1)
+    headers = {"ETag": f'"{etag}"'}
+    if len(page) > limit:
+        page = page[:limit]
+        headers.update(next_page_headers("list_inventory", page[-1].id, limit))
+
+    app.logger.info("Returning %d inventory", len(page))
+    return rows_response(serializer, page, headers)
+
+
+def rows_response(serializer, rows, headers=None) -> Response:
+    """Encodes rows as a JSON array with a row serializer"""
+    start = time.perf_counter()
+    body = serializer.many(rows)
+    observe_serialization(start)
+    return Response(
+        body, status.HTTP_200_OK, headers=headers, mimetype="application/json"
+    )
+
+
+def get_page_limit(limit) -> int:
+    """Validates a requested page size and clamps it to the configured maximum"""
+    if limit is not None and limit < 1:
+        abort(status.HTTP_400_BAD_REQUEST, "limit must be a positive integer")
+    return min(
+        limit or app.config["INVENTORY_PAGE_MAX"], app.config["INVENTORY_PAGE_MAX"]
+    )
+
+
+def next_page_headers(endpoint: str, next_cursor: int, limit: int, **extra) -> dict:
+    """Builds the Link and X-Next-Cursor headers that point at the next page"""
+    args = request.args.to_dict()
+    args.update(after=next_cursor, limit=limit, **extra)
+    next_url = url_for(endpoint, _external=True, **args)
+    return {
+        "Link": f'<{next_url}>; rel="next"',
+        "X-Next-Cursor": str(next_cursor),
+    }
+
+
+def stream_json_array(rows, serializer=INVENTORY_JSON, chunk_size: int = 100):
+    """Yields a JSON array of serialized rows a chunk at a time"""
+    yield b"["
+    separator = b""
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        # the elements of the chunk's own array, without its brackets
+        yield separator + serializer.many(chunk).removeprefix(b"[").removesuffix(b"]")
+        separator = b","
+    yield b"]"
+
+
+######################################################################
+# LIST INVENTORY CHANGES
+######################################################################
+@app.route("/inventory/changes", methods=["GET"])
+@query_budget(2)
+def list_inventory_changes():
+    """
+    List Inventory Changes
+
+    Returns the Inventory created or updated after revision ``since``, and
+    tombstones (``{"id", "revision", "updated_at", "deleted": true}``) for
+    the ones deleted, in revision order. When there are more changes than
+    ``limit`` the ``Link`` header points at the next page, otherwise the
+    ``X-Revision`` header holds the revision to pass as ``since`` on the
+    next poll.
+    """
+    app.logger.info("Request for Inventory changes")
+    since = request.args.get("since", 0, type=int)
+    after = request.args.get("after", type=int)
+    limit = get_page_limit(request.args.get("limit", type=int))
+
+    changes = Inventory.find_changes(since, after, limit + 1)
+    headers = {"X-Revision": str(changes[-1][1].revision if changes else since)}
+    if len(changes) > limit:
+        changes = changes[:limit]
+        last = changes[-1][1]
+        headers = next_page_headers(
+            "list_inventory_changes", last.id, limit, since=last.revision
+        )
+
+    start = time.perf_counter()
+    body = RowSerializer.mixed(
+        (TOMBSTONE_JSON if deleted else INVENTORY_JSON, row) for deleted, row in changes
+    )
+    observe_serialization(start)
+    app.logger.info("Returning %d inventory changes", len(changes))
+    return Response(
+        body, status.HTTP_200_OK, headers=headers, mimetype="application/json"
+    )
 
 
 ######################################################################
 # ACTION: MARK INVENTORY AS DAMAGED
 ######################################################################
 @app.route("/inventory/<int:inventory_id>/mark_damaged", methods=["PUT"])
+@query_budget(3)
 def mark_damaged(inventory_id):
     """
     Marks an Inventory as damaged
@@ -228,6 +574,7 @@ def mark_damaged(inventory_id):
 
     inventory.condition = "damaged"
     inventory.update()
+    publish_stock_event(inventory)
 
     app.logger.info("Inventory with ID: %d marked as damaged.", inventory.id)
     return jsonify(inventory.serialize()), status.HTTP_200_OK
@@ -248,17 +595,64 @@ def health():
     return jsonify(status="OK"), status.HTTP_200_OK
 
 
+@app.route("/health/live", methods=["GET"])
+def live():
+    """
+    Liveness Check endpoint
+
+    Only says that this process can answer requests, it never touches the
+    database so a slow database doesn't get pods restarted
+    """
+    return jsonify(status="OK"), status.HTTP_200_OK
+
+
+@app.route("/health/ready", methods=["GET"])
+def ready():
+    """
+    Readiness Check endpoint
+
+    Returns the cached result of the database and connection pool checks,
+    see service/common/health.py, with 503 while any of them is failing or
+    the result is stale
+    """
+    is_ready, report = readiness.report()
+    if not is_ready:
+        app.logger.warning("Not ready: %s", report)
+        return jsonify(report), status.HTTP_503_SERVICE_UNAVAILABLE
+    return jsonify(report), status.HTTP_200_OK
+
+
+######################################################################
+# METRICS
+######################################################################
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Returns the service metrics in the Prometheus text format"""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+######################################################################
+# CACHE STATISTICS
+######################################################################
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Returns the hit and miss counters of the Inventory cache"""
+    app.logger.info("Request for cache statistics")
+    return jsonify(cache.stats()), status.HTTP_200_OK
+
+
 # Trigger restock
 ######################################################################
 
 
 @app.route("/inventory/<int:inventory_id>/restock_check", methods=["PUT"])
+@query_budget(3)
 def update_stock(inventory_id):
     """
     Update inventory stock level and create alert if below restock level
 
-    This endpoint will update the quantity of an inventory item and create
-    an alert if the new quantity is below the restock level
+    This endpoint will update the quantity of an inventory item and queue a
+    task that creates an alert if the new quantity is below the restock level
     """
     app.logger.info("Request to update stock level for inventory id [%s]", inventory_id)
 
@@ -276,56 +670,311 @@ def update_stock(inventory_id):
     inventory.quantity = new_quantity
     app.logger.info("Updating quantity to %s", new_quantity)
 
-    # Check for low stock
-    if new_quantity < int(inventory.restock_level):
-        message = (
-            f"Low Stock Alert: Item '{inventory.name}' has quantity {new_quantity}, "
-            f"below restock level {inventory.restock_level}"
-        )
-        app.logger.info("Creating low stock alert: %s", message)
-        alert = Alert(product_id=inventory.id, message=message)
-        db.session.add(alert)
-
+    # The task is committed with the quantity and the alert is written off
+    # the request path once both are durable
+    tasks.enqueue(check_low_stock, inventory_id)
     inventory.update()
-    db.session.commit()
     app.logger.info("Stock level updated for inventory id [%s]", inventory_id)
+    publish_stock_event(inventory)
     return jsonify(inventory.serialize()), status.HTTP_200_OK
 
 
+######################################################################
+# ACTION: ATOMICALLY ADJUST STOCK
+######################################################################
+@app.route("/inventory/<int:inventory_id>/adjust", methods=["POST"])
+@strong_etag
+@query_budget(2)
+def adjust_stock(inventory_id):
+    """
+    Adjust the stock level of an Inventory by a delta
+
+    The body carries a ``delta`` to add to the quantity. With If-Match the
+    Inventory is only adjusted if its ETag still matches, like PUT, and 412
+    is returned otherwise. The adjustment is a single atomic UPDATE so
+    concurrent pickers never lose each other's changes. The low stock Alert
+    is left to a background task.
+    """
+    app.logger.info("Request to adjust stock level for inventory id [%s]", inventory_id)
+    check_content_type("application/json")
+
+    data = request.get_json()
+    delta = data.get("delta") if isinstance(data, dict) else None
+    # bool is a subclass of int, but true and false aren't quantities
+    if not isinstance(delta, int) or isinstance(delta, bool):
+        abort(status.HTTP_400_BAD_REQUEST, "delta must be an integer")
+    if "version" in data:
+        # ignoring it would turn a conditional adjustment into a blind one
+        abort(status.HTTP_400_BAD_REQUEST, "version is not supported, use If-Match")
+
+    # Committed together with the adjustment, dropped if it fails
+    tasks.enqueue(check_low_stock, inventory_id)
+    try:
+        row = Inventory.adjust_quantity(inventory_id, delta, if_match_revisions())
+    except RevisionConflictError as error:
+        abort(status.HTTP_412_PRECONDITION_FAILED, str(error))
+    if row is None:
+        abort(
+            status.HTTP_404_NOT_FOUND,
+            f"Inventory with id '{inventory_id}' was not found.",
+        )
+
+    app.logger.info(
+        "Stock level of inventory id [%s] adjusted by %s", inventory_id, delta
+    )
+    broker.publish("stock", row._asdict())
+    response = jsonify(row._asdict())
+    response.set_etag(str(row.revision))
+    return response
+
+
+######################################################################
+# SUMMARIZE INVENTORY
+######################################################################
+@app.route("/inventory/summary", methods=["GET"])
+@query_budget(2)
+def get_inventory_summary():
+    """
+    Summarize Inventory
+
+    Returns the number of Inventory, the total, smallest and largest
+    quantity and how many are below their restock level, computed in the
+    database. With ``group_by=condition`` a list with one summary per
+    condition is returned. Summaries are cached under the latest revision,
+    so any write invalidates them, and that revision is also the ETag. A
+    summary is computed on the primary before it is cached, so it is never
+    older than the revision it is cached under.
+    """
+    app.logger.info("Request for Inventory summary")
+    group_by = request.args.get("group_by")
+    if group_by is not None and group_by not in Inventory.SUMMARY_GROUPS:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid group_by: {group_by}")
+
+    etag = str(Inventory.latest_revision())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    key = f"summary:{group_by or ''}:{etag}"
+    data = cache.get(key)
+    if data is None:
+        with read_primary(db.session):
+            rows = Inventory.summarize(group_by)
+        data = [row._asdict() for row in rows] if group_by else rows[0]._asdict()
+        cache.set(key, data)
+    response = jsonify(data)
+    response.set_etag(etag)
+    return response
+
+
 # Endpoint for reading stock
 # I acknowledge it that the code would be much cleaner if the above function would refer to the below function.
 @app.route("/inventory/stock", methods=["GET"])
+@query_budget(2)
 def get_stock_levels():
     """
     Retrieve stock levels for all inventory items
+
+    Only the id and quantity columns are selected and the JSON body is
+    encoded straight from those rows. The ETag is the latest revision of
+    the table, so a client that sends it back in If-None-Match gets a 304
+    without the stock levels being read at all. The body is built whole
+    rather than streamed, so small ones are sent uncompressed and the
+    compressed form of an unchanged snapshot is reused.
     """
     app.logger.info("Request to retrieve inventory stock levels")
-    inventory_items = Inventory.all()
-    stock_levels = [
-        {"product_id": item.id, "quantity": item.quantity} for item in inventory_items
-    ]
-    return jsonify(stock_levels), status.HTTP_200_OK
+    etag = str(Inventory.latest_revision())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    rows = Inventory.find_stock_levels()
+    return rows_response(STOCK_JSON, rows, {"ETag": f'"{etag}"'})
 
 
 # Endpoint for Low Stock Alert
 @app.route("/inventory/low-stock", methods=["GET"])
+@query_budget(1)
 def get_low_stock_alerts():
     """
     Retrieve low-stock alerts for inventory items
+
+    The comparison runs in the database against the low stock index and only
+    the needed columns are read. Passing ``limit`` (and ``after``) returns a
+    keyset page with the next cursor in the ``Link`` header.
     """
     app.logger.info("Request to retrieve low-stock alerts")
-    inventory_items = Inventory.all()
+    after = request.args.get("after", type=int)
+    limit = request.args.get("limit", type=int)
+    headers = {}
+    if limit is None and after is None:
+        rows = Inventory.find_low_stock()
+    else:
+        limit = get_page_limit(limit)
+        rows = Inventory.find_low_stock(after, limit + 1)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers = next_page_headers("get_low_stock_alerts", rows[-1].id, limit)
+
     low_stock_items = [
         {
-            "product_id": item.id,
-            "quantity": item.quantity,
-            "restock_level": item.restock_level,
+            "product_id": row.id,
+            "quantity": row.quantity,
+            "restock_level": row.restock_level,
             "alert_status": "Alert! Product is Low Stock",
         }
-        for item in inventory_items
-        if int(item.quantity) < int(item.restock_level)
+        for row in rows
     ]
-    return jsonify(low_stock_items), status.HTTP_200_OK
+    return jsonify(low_stock_items), status.HTTP_200_OK, headers
+
+
+######################################################################
+# STREAM STOCK AND ALERT EVENTS
+######################################################################
+@app.route("/inventory/events", methods=["GET"])
+def inventory_events():
+    """
+    Stream stock and alert events as Server-Sent Events
+
+    Emits ``stock`` (the changed Inventory), ``deleted`` (its id) and
+    ``alert`` (a low stock Alert) events as they happen in this process,
+    and ``reload`` when a bulk request changed too many Inventory to send
+    one event each.
+    A reconnecting client sends ``Last-Event-ID`` and is replayed the
+    recent events it missed. A comment line is sent every EVENTS_KEEPALIVE
+    seconds so proxies keep the connection open.
+
+    Only the events of the writes made by this process are sent, see
+    service.common.events. Each subscriber holds a worker thread for as
+    long as it stays connected, so past EVENTS_MAX_SUBSCRIBERS or
+    EVENTS_MAX_THREADS per process this returns 503. The ASGI app serves
+    this stream on its event loop, where only EVENTS_MAX_SUBSCRIBERS applies.
+    """
+    app.logger.info("Request to stream inventory events")
+    subscriber = broker.subscribe(
+        request.headers.get("Last-Event-ID", type=int),
+        limit=min(
+            app.config["EVENTS_MAX_SUBSCRIBERS"], app.config["EVENTS_MAX_THREADS"]
+        ),
+    )
+    if subscriber is None:
+        app.logger.warning("Too many event subscribers")
+        response = jsonify(
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            error="Service Unavailable",
+            message="Too many event subscribers, try again later",
+        )
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = "30"
+        return response
+    keepalive = app.config["EVENTS_KEEPALIVE"]
+
+    # The generator only touches the subscriber, so the stream holds no
+    # request context or database connection while it waits for events
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscriber.closed:
+                frame = subscriber.get(keepalive)
+                yield ": keepalive\n\n" if frame is None else frame
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def publish_stock_event(inventory: Inventory):
+    """Pushes the state of a changed Inventory to the event subscribers"""
+    broker.publish("stock", inventory.serialize())
+
+
+def publish_bulk_events(changed=(), deleted=()):
+    """Pushes the Inventory changed by a bulk request to the event subscribers
+
+    Up to EVENTS_BULK_MAX changes are sent as the same stock and deleted
+    events as single writes. A larger batch sends one reload event instead,
+    so it can't overflow the buffers of the subscribers.
+    """
+    count = len(changed) + len(deleted)
+    if count > app.config["EVENTS_BULK_MAX"]:
+        broker.publish("reload", {"count": count})
+        return
+    if changed:
+        for inventory in Inventory.find_by_ids(list(changed)):
+            publish_stock_event(inventory)
+    for inventory_id in sorted(deleted):
+        broker.publish("deleted", {"id": inventory_id})
+
+
+@tasks.task
+def check_low_stock(inventory_id: int):
+    """Background task that records or resolves the low stock Alert of an Inventory"""
+    row = Alert.check_stock(inventory_id)
+    if row is not None:
+        publish_alert_event(row.id, row.name, row.quantity, row.restock_level)
+
+
+def publish_alert_event(product_id: int, name: str, quantity: int, restock_level: int):
+    """Pushes a low stock Alert to the event subscribers"""
+    broker.publish(
+        "alert",
+        {
+            "product_id": product_id,
+            "quantity": quantity,
+            "restock_level": restock_level,
+            "message": Alert.low_stock_message(name, quantity, restock_level),
+        },
+    )
+
+
+######################################################################
+# LIST ALERTS
+######################################################################
+@app.route("/alerts", methods=["GET"])
+@query_budget(1)
+def list_alerts():
+    """
+    List Alerts
+
+    Returns one keyset page of Alerts ordered by id, with the next cursor in
+    the ``Link`` and ``X-Next-Cursor`` headers. The ``product_id``, ``since``
+    and ``until`` (ISO 8601 created_at bounds) and ``open`` filters may be
+    combined.
+    """
+    app.logger.info("Request for Alert list")
+    is_open = request.args.get("open")
+    limit = get_page_limit(request.args.get("limit", type=int))
+    rows = Alert.find_page(
+        product_id=request.args.get("product_id", type=int),
+        since=get_datetime_arg("since"),
+        until=get_datetime_arg("until"),
+        is_open=None if is_open is None else is_open.lower() == "true",
+        after=request.args.get("after", type=int),
+        limit=limit + 1,
+    )
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers = next_page_headers("list_alerts", rows[-1].id, limit)
+
+    app.logger.info("Returning %d alerts", len(rows))
+    return rows_response(ALERT_JSON, rows, headers)
+
+
+def get_datetime_arg(name: str):
+    """Returns an ISO 8601 query argument as a datetime, or None if absent"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, f"{name} must be an ISO 8601 datetime")
+    return None  # pragma: no cover
 
 
 ######################################################################
@@ -18,28 +18,78 @@ document.addEventListener("DOMContentLoaded", () => {
         fetchAndRenderInventory(url);
     });
 
+    let listUrl = null;
+
     async function fetchAndRenderInventory(url) {
         try {
             const response = await fetch(url);
             if (!response.ok) throw new Error("Failed to fetch inventory");
             const data = await response.json();
             tbody.innerHTML = "";
-            data.forEach(item => {
-                const row = document.createElement("tr");
-                row.innerHTML = `
-                    <td>${item.id}</td>
-                    <td>${item.name}</td>
-                    <td>${item.quantity}</td>
-                    <td>${item.condition}</td>
-                `;
-                tbody.appendChild(row);
-            });
+            data.forEach(item => tbody.appendChild(renderInventoryRow(item)));
             table.classList.remove("hidden");
+            listUrl = url;
+            openEvents();
         } catch (err) {
             alert("Error: " + err.message);
         }
     }
 
+    function renderInventoryRow(item, row = document.createElement("tr")) {
+        row.dataset.id = item.id;
+        row.innerHTML = `
+            <td>${item.id}</td>
+            <td>${item.name}</td>
+            <td>${item.quantity}</td>
+            <td>${item.condition}</td>
+        `;
+        return row;
+    }
+
+    function removeInventoryRow(id) {
+        tbody?.querySelector(`tr[data-id="${id}"]`)?.remove();
+    }
+
+    // ===== LIVE UPDATES =====
+    // Patch the rendered rows from /inventory/events instead of refetching
+    // the whole list after every change. An open stream holds a server
+    // thread, so it is only opened once a list is shown and is closed while
+    // the tab is hidden.
+    let events = null;
+
+    function openEvents() {
+        if (!window.EventSource || events || document.hidden) return;
+        events = new EventSource("/inventory/events");
+        events.addEventListener("stock", event => {
+            const item = JSON.parse(event.data);
+            const row = tbody.querySelector(`tr[data-id="${item.id}"]`);
+            if (row) renderInventoryRow(item, row);
+        });
+        events.addEventListener("deleted", event => {
+            removeInventoryRow(JSON.parse(event.data).id);
+        });
+        // a bulk change too large to send row by row
+        events.addEventListener("reload", () => fetchAndRenderInventory(listUrl));
+        events.addEventListener("error", () => {
+            // a 503 from a busy server closes the stream for good
+            if (events?.readyState === EventSource.CLOSED) events = null;
+        });
+    }
+
+    function closeEvents() {
+        events?.close();
+        events = null;
+    }
+
+    document.addEventListener("visibilitychange", () => {
+        if (document.hidden) {
+            closeEvents();
+        } else if (listUrl) {
+            // catch up on what changed while the stream was closed
+            fetchAndRenderInventory(listUrl);
+        }
+    });
+
     // ===== SEARCH =====
     const searchBtn = document.getElementById('search-btn');
     const productIdInput = document.getElementById('product-id');
@@ -293,10 +343,8 @@ document.addEventListener("DOMContentLoaded", () => {
             // Clear the search input
             productIdInput.value = '';
             
-            // If the products table is visible, refresh it
-            if (!table.classList.contains('hidden')) {
-                fetchAndRenderInventory("/inventory");
-            }
+            // Drop the row instead of refetching the whole table
+            removeInventoryRow(productId);
         } catch (err) {
             alert("Error deleting product: " + err.message);
         }
@@ -23,6 +23,7 @@ import logging
 import unittest
 from unittest import TestCase
 from wsgi import app
+from service.common.cache import cache
 from service.models import db, Inventory, Alert
 from .factories import InventoryFactory
 
@@ -41,6 +42,7 @@ class TestAdminUI(TestCase):
     def setUpClass(cls):
         """Run once before all tests"""
         app.config["TESTING"] = True
+        app.config["TASK_EAGER"] = True
         app.config["DEBUG"] = False
         # Set up the test database
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
@@ -59,6 +61,7 @@ class TestAdminUI(TestCase):
         db.session.query(Alert).delete()  # clean up alerts first due to foreign key
         db.session.query(Inventory).delete()  # clean up the inventory
         db.session.commit()
+        cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -0,0 +1,333 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the ASGI Application
+"""
+
+import gzip
+import json
+import asyncio
+import logging
+import importlib.util
+from unittest import TestCase, skipIf
+from wsgi import app
+from service.asgi import AsyncInventoryApp, wsgi_environ
+from service.common import status
+from service.common.cache import cache
+from service.common.events import AsyncSubscriber, broker
+from service.common.instrumentation import REQUESTS_TOTAL
+from service.models import db, Inventory, Alert
+from .factories import InventoryFactory
+
+# The async engine needs aiosqlite when the tests run against SQLite
+NO_ASYNC_DRIVER = (
+    app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite")
+    and importlib.util.find_spec("aiosqlite") is None
+)
+
+
+def call(asgi_app, method, path, *, query=b"", headers=(), body=b""):  # pylint: disable=too-many-arguments
+    """Sends one request through asgi_app and returns (status, headers, body)"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": list(headers),
+        "server": ("localhost", 8080),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        await asgi_app(scope, receive, send)
+        # every asyncio.run() has its own loop, so don't keep connections
+        if asgi_app.engine is not None:
+            await asgi_app.engine.dispose()
+            asgi_app.engine = None
+
+    asyncio.run(run())
+    start = sent[0]
+    content = b"".join(message.get("body", b"") for message in sent[1:])
+    return start["status"], dict(start["headers"]), content
+
+
+######################################################################
+#  A S G I   T E S T   C A S E S
+######################################################################
+@skipIf(NO_ASYNC_DRIVER, "aiosqlite is not installed")
+class TestAsgi(TestCase):
+    """Test Cases for the ASGI Application"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.config["TASK_EAGER"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        app.app_context().push()
+        cls.asgi = AsyncInventoryApp(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Run once after all tests"""
+        cls.asgi.executor.shutdown()
+        db.session.close()
+
+    def setUp(self):
+        """Runs before each test"""
+        cache.clear()
+        db.session.query(Alert).delete()
+        db.session.query(Inventory).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        """This runs after each test"""
+        db.session.remove()
+
+    def test_get_inventory(self):
+        """It should read a single Inventory with the async engine"""
+        inventory = InventoryFactory()
+        inventory.create()
+        code, headers, body = call(self.asgi, "GET", f"/inventory/{inventory.id}")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(body)["name"], inventory.name)
+        etag = app.test_client().get(f"/inventory/{inventory.id}").headers["ETag"]
+        self.assertEqual(headers[b"etag"].decode(), etag)
+
+        code, _, body = call(
+            self.asgi,
+            "GET",
+            f"/inventory/{inventory.id}",
+            headers=[(b"if-none-match", etag.encode())],
+        )
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        # both paths compare If-None-Match weakly
+        weak = f"W/{etag}"
+        code, _, _ = call(self.asgi, "GET", f"/inventory/{inventory.id}", headers=[(b"if-none-match", weak.encode())])
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        response = app.test_client().get(f"/inventory/{inventory.id}", headers={"If-None-Match": weak})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # the ETag is sent back in If-Match, so compression leaves it strong
+        compressor = app.extensions["compression"]
+        min_size, compressor.min_size = compressor.min_size, 0
+        try:
+            _, headers, _ = call(self.asgi, "GET", f"/inventory/{inventory.id}", headers=[(b"accept-encoding", b"gzip")])
+        finally:
+            compressor.min_size = min_size
+        self.assertEqual(headers[b"content-encoding"], b"gzip")
+        self.assertEqual(headers[b"etag"].decode(), etag)
+
+        code, _, body = call(self.asgi, "GET", "/inventory/0")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("was not found", json.loads(body)["message"])
+
+    def test_get_stock_and_low_stock(self):
+        """It should read stock levels and low stock alerts asynchronously"""
+        low = InventoryFactory(quantity=1, restock_level=5)
+        low.create()
+        InventoryFactory(quantity=9, restock_level=5).create()
+
+        code, headers, body = call(self.asgi, "GET", "/inventory/stock")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(body)), 2)
+        # the ETag matches the one the Flask endpoint computes
+        flask_etag = app.test_client().get("/inventory/stock").headers["ETag"]
+        self.assertEqual(headers[b"etag"].decode(), flask_etag)
+
+        code, _, body = call(
+            self.asgi,
+            "GET",
+            "/inventory/stock",
+            headers=[(b"if-none-match", flask_etag.encode())],
+        )
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(body, b"")
+
+        code, _, body = call(self.asgi, "GET", "/inventory/low-stock")
+        self.assertEqual([item["product_id"] for item in json.loads(body)], [low.id])
+
+    def test_metrics_and_compression(self):
+        """It should record request metrics and compress like the Flask views"""
+        InventoryFactory(quantity=1, restock_level=5).create()
+        before = REQUESTS_TOTAL.samples().get(("GET", "get_stock_levels", "200"), 0)
+        _, headers, body = call(self.asgi, "GET", "/inventory/stock")
+        self.assertEqual(REQUESTS_TOTAL.samples()[("GET", "get_stock_levels", "200")], before + 1)
+        self.assertEqual(headers[b"vary"], b"Accept-Encoding")
+        self.assertNotIn(b"content-encoding", headers)
+
+        compressor = app.extensions["compression"]
+        min_size, compressor.min_size = compressor.min_size, 0
+        try:
+            _, headers, compressed = call(
+                self.asgi, "GET", "/inventory/low-stock", headers=[(b"accept-encoding", b"gzip")]
+            )
+            self.assertEqual(headers[b"content-encoding"], b"gzip")
+            self.assertEqual(len(json.loads(gzip.decompress(compressed))), 1)
+            _, headers, compressed = call(self.asgi, "GET", "/inventory/stock", headers=[(b"accept-encoding", b"gzip")])
+            self.assertEqual(headers[b"etag"], b"W/" + app.test_client().get("/inventory/stock").headers["ETag"].encode())
+            self.assertEqual(gzip.decompress(compressed), body)
+        finally:
+            compressor.min_size = min_size
+
+    def test_replicas_left_to_flask(self):
+        """It should leave the database reads to Flask when there are read replicas"""
+        replica_uris, app.config["DB_REPLICA_URIS"] = app.config["DB_REPLICA_URIS"], ["sqlite://"]
+        try:
+            asgi_app = AsyncInventoryApp(app, max_threads=1)
+        finally:
+            app.config["DB_REPLICA_URIS"] = replica_uris
+        self.assertEqual([endpoint for _, _, endpoint in asgi_app.routes], ["inventory_events"])
+        inventory = InventoryFactory()
+        inventory.create()
+        code, _, body = call(asgi_app, "GET", f"/inventory/{inventory.id}")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(body)["id"], inventory.id)
+        self.assertIsNone(asgi_app.engine)
+        asgi_app.executor.shutdown()
+
+    def test_flask_bridge(self):
+        """It should hand every other request to the Flask application"""
+        payload = json.dumps(InventoryFactory().serialize()).encode()
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode()),
+        ]
+        code, response_headers, body = call(
+            self.asgi, "POST", "/inventory", headers=headers, body=payload
+        )
+        self.assertEqual(code, status.HTTP_201_CREATED)
+        self.assertIn(b"location", response_headers)
+
+        code, _, body = call(self.asgi, "GET", "/inventory", query=b"stream=true")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(body)), 1)
+
+    def test_stream_events(self):
+        """It should stream events on the event loop until the client leaves"""
+        app.config["EVENTS_KEEPALIVE"] = 0.01
+        start = broker.publish("test", {})
+        broker.publish("stock", {"id": 1})
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/inventory/events",
+            "query_string": b"",
+            "headers": [(b"last-event-id", str(start).encode())],
+        }
+        sent = []
+
+        async def run():
+            left = asyncio.Event()
+
+            async def receive():
+                if not sent:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await left.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+                if len(sent) == 4:
+                    left.set()
+
+            await self.asgi(scope, receive, send)
+
+        asyncio.run(run())
+        app.config["EVENTS_KEEPALIVE"] = 15
+        self.assertEqual(sent[0]["status"], status.HTTP_200_OK)
+        bodies = [message["body"].decode() for message in sent[1:]]
+        self.assertEqual(bodies[0], "retry: 3000\n\n")
+        self.assertIn("event: stock\n", bodies[1])
+        self.assertEqual(bodies[-1], "")
+        self.assertEqual(broker.subscriber_count, 0)
+
+    def test_stream_events_limit(self):
+        """It should refuse event subscribers past EVENTS_MAX_SUBSCRIBERS"""
+        scope = {"type": "http", "method": "GET", "path": "/inventory/events", "query_string": b"", "headers": []}
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def run():
+            subscriber = broker.subscribe(subscriber_class=AsyncSubscriber)
+            try:
+                await self.asgi(scope, None, send)
+            finally:
+                broker.unsubscribe(subscriber)
+
+        limit = app.config["EVENTS_MAX_SUBSCRIBERS"]
+        app.config["EVENTS_MAX_SUBSCRIBERS"] = 1
+        try:
+            asyncio.run(run())
+        finally:
+            app.config["EVENTS_MAX_SUBSCRIBERS"] = limit
+        self.assertEqual(sent[0]["status"], status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn((b"retry-after", b"30"), sent[0]["headers"])
+        self.assertIn("Too many event subscribers", json.loads(sent[1]["body"])["message"])
+        self.assertEqual(broker.subscriber_count, 0)
+
+    def test_lifespan(self):
+        """It should create and dispose of the engine with the lifespan protocol"""
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asgi_app = AsyncInventoryApp(app, max_threads=1)
+        asyncio.run(asgi_app({"type": "lifespan"}, receive, send))
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        )
+        self.assertIsNone(asgi_app.engine)
+
+
+class TestWsgiEnviron(TestCase):
+    """Test Cases for the ASGI to WSGI environ"""
+
+    def test_environ(self):
+        """It should translate an ASGI scope into a WSGI environ"""
+        scope = {
+            "method": "PUT",
+            "path": "/inventory/1",
+            "query_string": b"a=1",
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"x-tag", b"a"),
+                (b"x-tag", b"b"),
+            ],
+        }
+        environ = wsgi_environ(scope, b"{}")
+        self.assertEqual(environ["REQUEST_METHOD"], "PUT")
+        self.assertEqual(environ["PATH_INFO"], "/inventory/1")
+        self.assertEqual(environ["QUERY_STRING"], "a=1")
+        self.assertEqual(environ["CONTENT_TYPE"], "application/json")
+        self.assertEqual(environ["HTTP_X_TAG"], "a,b")
+        self.assertEqual(environ["SERVER_PORT"], "80")
+        self.assertEqual(environ["wsgi.input"].read(), b"{}")
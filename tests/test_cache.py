@@ -0,0 +1,105 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Read-through Cache
+"""
+
+import time
+from unittest import TestCase
+from flask import Flask
+from service.common.cache import Cache, LRUBackend, SharedBackend
+
+
+class FakeRedis:
+    """Local stand-in for a redis client"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        """Returns the value stored under key"""
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):  # pylint: disable=unused-argument
+        """Stores value under key"""
+        self.data[key] = value
+
+    def delete(self, *keys):
+        """Removes keys"""
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, pattern):
+        """Yields the keys that start with the pattern prefix"""
+        prefix = pattern.rstrip("*")
+        return [key for key in self.data if key.startswith(prefix)]
+
+
+######################################################################
+#  C A C H E   T E S T   C A S E S
+######################################################################
+class TestCache(TestCase):
+    """Test Cases for the Cache"""
+
+    def test_lru_eviction(self):
+        """It should evict the least recently used entry"""
+        backend = LRUBackend(max_size=2)
+        backend.set(1, "one")
+        backend.set(2, "two")
+        self.assertEqual(backend.get(1), "one")
+        backend.set(3, "three")
+        self.assertIsNone(backend.get(2))
+        self.assertEqual(backend.get(1), "one")
+        self.assertEqual(len(backend), 2)
+
+    def test_lru_expiry(self):
+        """It should expire entries after the ttl"""
+        backend = LRUBackend(ttl=0.01)
+        backend.set(1, "one")
+        time.sleep(0.02)
+        self.assertIsNone(backend.get(1))
+        self.assertEqual(len(backend), 0)
+
+    def test_hits_and_misses(self):
+        """It should count hits and misses"""
+        cache = Cache()
+        self.assertIsNone(cache.get(1))
+        cache.set(1, {"id": 1})
+        self.assertEqual(cache.get(1), {"id": 1})
+        cache.delete(1)
+        self.assertIsNone(cache.get(1))
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["backend"], "LRUBackend")
+
+    def test_shared_backend(self):
+        """It should store entries in a shared client"""
+        app = Flask(__name__)
+        app.config["CACHE_TTL"] = 5
+        client = FakeRedis()
+        cache = Cache()
+        cache.init_app(app, client)
+        self.assertIsInstance(cache.backend, SharedBackend)
+        cache.set(7, {"id": 7})
+        self.assertEqual(client.data["inventory:7"], '{"id": 7}')
+        self.assertEqual(cache.get(7), {"id": 7})
+        self.assertEqual(cache.stats()["size"], 1)
+        cache.clear()
+        self.assertIsNone(cache.get(7))
+        cache.clear()
+        self.assertEqual(client.data, {})
@@ -0,0 +1,134 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for Response Compression
+"""
+
+import gzip
+import json
+from unittest import TestCase, skipIf
+from flask import Flask, Response, jsonify
+from service.common import compression
+from service.common.compression import init_compression, COMPRESSED_RESPONSES
+
+ITEMS = [{"id": n, "name": "widget", "quantity": n} for n in range(200)]
+
+
+def create_app(**settings):
+    """Returns an app with a large, a small, a streamed and an event endpoint"""
+    app = Flask(__name__)
+    app.config.update(settings)
+
+    @app.route("/big")
+    def big():
+        response = jsonify(ITEMS)
+        response.set_etag("7")
+        return response
+
+    @app.route("/small")
+    def small():
+        return jsonify(ITEMS[0])
+
+    @app.route("/stream")
+    def stream():
+        return Response(
+            (json.dumps(item) + "\n" for item in ITEMS), mimetype="application/json"
+        )
+
+    @app.route("/events")
+    def events():
+        return Response("data: x\n\n" * 500, mimetype="text/event-stream")
+
+    init_compression(app)
+    return app
+
+
+######################################################################
+#  C O M P R E S S I O N   T E S T   C A S E S
+######################################################################
+class TestCompression(TestCase):
+    """Test Cases for Response Compression"""
+
+    def setUp(self):
+        self.client = create_app(COMPRESSION_MIN_SIZE=1024).test_client()
+
+    def test_gzip(self):
+        """It should gzip a large body for a client that accepts gzip"""
+        response = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(response.headers["ETag"], 'W/"7"')
+        self.assertLess(response.content_length, len(json.dumps(ITEMS)))
+        self.assertEqual(json.loads(gzip.decompress(response.data)), ITEMS)
+
+    def test_not_accepted(self):
+        """It should send the body as is when the client accepts no encoding"""
+        for accept in (None, "identity", "gzip;q=0", "deflate"):
+            headers = {"Accept-Encoding": accept} if accept else {}
+            response = self.client.get("/big", headers=headers)
+            self.assertNotIn("Content-Encoding", response.headers)
+            self.assertIn("Accept-Encoding", response.headers["Vary"])
+            self.assertEqual(response.headers["ETag"], '"7"')
+            self.assertEqual(response.get_json(), ITEMS)
+
+    def test_below_threshold(self):
+        """It should not compress a body smaller than COMPRESSION_MIN_SIZE"""
+        response = self.client.get("/small", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json(), ITEMS[0])
+
+    def test_stream(self):
+        """It should compress a streamed body chunk by chunk"""
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        lines = gzip.decompress(response.data).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], ITEMS)
+
+    def test_event_stream(self):
+        """It should never compress Server-Sent Events"""
+        response = self.client.get("/events", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_cached_body(self):
+        """It should compress an unchanged body with an ETag only once"""
+        misses = COMPRESSED_RESPONSES.samples().get(("gzip", "miss"), 0)
+        hits = COMPRESSED_RESPONSES.samples().get(("gzip", "hit"), 0)
+        first = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+        second = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(first.data, second.data)
+        samples = COMPRESSED_RESPONSES.samples()
+        self.assertEqual(samples[("gzip", "miss")], misses + 1)
+        self.assertEqual(samples[("gzip", "hit")], hits + 1)
+
+    def test_level_and_disabled(self):
+        """It should honor the configured level and COMPRESSION_ENABLED"""
+        fast = create_app(COMPRESSION_GZIP_LEVEL=1, COMPRESSION_CACHE_SIZE=0).test_client()
+        response = fast.get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(json.loads(gzip.decompress(response.data)), ITEMS)
+
+        app = create_app(COMPRESSION_ENABLED=False)
+        self.assertNotIn("compression", app.extensions)
+        response = app.test_client().get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli(self):  # pragma: no cover
+        """It should prefer brotli when the client accepts it"""
+        response = self.client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(json.loads(compression.brotli.decompress(response.data)), ITEMS)
@@ -0,0 +1,102 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Event Broker
+"""
+
+import asyncio
+from unittest import TestCase
+from service.common.events import AsyncSubscriber, EventBroker
+
+
+######################################################################
+#  E V E N T   B R O K E R   T E S T   C A S E S
+######################################################################
+class TestEventBroker(TestCase):
+    """Test Cases for the Event Broker"""
+
+    def test_fan_out(self):
+        """It should hand the same encoded frame to every subscriber"""
+        broker = EventBroker()
+        first, second = broker.subscribe(), broker.subscribe()
+        self.assertEqual(broker.subscriber_count, 2)
+        event_id = broker.publish("stock", {"id": 1, "quantity": 5})
+        frame = first.get(0)
+        self.assertEqual(frame, f'id: {event_id}\nevent: stock\ndata: {{"id":1,"quantity":5}}\n\n')
+        self.assertIs(second.get(0), frame)
+        self.assertIsNone(first.get(0.01))
+
+        broker.unsubscribe(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(broker.subscriber_count, 1)
+
+    def test_replay(self):
+        """It should replay the kept events after Last-Event-ID"""
+        broker = EventBroker(history=2)
+        ids = [broker.publish("stock", {"id": n}) for n in range(3)]
+        subscriber = broker.subscribe(ids[0])
+        self.assertIn(f"id: {ids[1]}\n", subscriber.get(0))
+        self.assertIn(f"id: {ids[2]}\n", subscriber.get(0))
+        self.assertIsNone(subscriber.get(0))
+        # only the last two events are kept
+        subscriber = broker.subscribe(0)
+        self.assertIn(f"id: {ids[1]}\n", subscriber.get(0))
+
+    def test_limit(self):
+        """It should refuse subscribers of a class past its limit"""
+        broker = EventBroker()
+        first = broker.subscribe(limit=1)
+        self.assertIsNotNone(first)
+        self.assertIsNone(broker.subscribe(limit=1))
+
+        async def run():
+            return broker.subscribe(subscriber_class=AsyncSubscriber, limit=1)
+
+        # subscribers on an event loop don't hold a thread and aren't counted
+        self.assertIsNotNone(asyncio.run(run()))
+        broker.unsubscribe(first)
+        self.assertIsNotNone(broker.subscribe(limit=1))
+
+    def test_drops_slow_subscribers(self):
+        """It should drop a subscriber that falls too far behind"""
+        broker = EventBroker(max_pending=2)
+        slow = broker.subscribe()
+        for n in range(3):
+            broker.publish("stock", {"id": n})
+        self.assertTrue(slow.closed)
+        self.assertEqual(broker.subscriber_count, 0)
+
+    def test_async_subscriber(self):
+        """It should deliver events to subscribers on an event loop"""
+        broker = EventBroker(max_pending=1)
+
+        async def run():
+            subscriber = broker.subscribe(subscriber_class=AsyncSubscriber)
+            broker.publish("alert", {"product_id": 1})
+            await asyncio.sleep(0)
+            frame = await subscriber.get(1)
+            timeout = await subscriber.get(0.01)
+            # a second pending frame is more than it may buffer
+            broker.publish("alert", {"product_id": 2})
+            broker.publish("alert", {"product_id": 3})
+            await asyncio.sleep(0)
+            return frame, timeout, subscriber
+
+        frame, timeout, subscriber = asyncio.run(run())
+        self.assertIn("event: alert\n", frame)
+        self.assertIsNone(timeout)
+        self.assertTrue(subscriber.closed)
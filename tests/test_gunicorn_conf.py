@@ -0,0 +1,158 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Gunicorn Configuration
+"""
+
+import os
+import json
+import tempfile
+import importlib.util
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from wsgi import app
+from service.asgi import AsyncInventoryApp
+from service.common.metrics import registry
+from service.models import db
+
+spec = importlib.util.spec_from_file_location(
+    "gunicorn_conf", os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+)
+conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(conf)
+
+
+def server_for(wsgi_app, preload_app=True):
+    """Returns a stand-in for the gunicorn arbiter passed to the hooks"""
+    return SimpleNamespace(
+        cfg=SimpleNamespace(preload_app=preload_app),
+        app=SimpleNamespace(wsgi=lambda: wsgi_app),
+    )
+
+
+######################################################################
+#  G U N I C O R N   C O N F I G U R A T I O N   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(TestCase):
+    """Test Cases for gunicorn.conf.py"""
+
+    def write(self, root, path, text):
+        """Writes a cgroup file under root"""
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+    def test_cpu_limit(self):
+        """It should read the CPU quota of cgroup v2 and v1"""
+        with tempfile.TemporaryDirectory() as root:
+            self.write(root, "cpu.max", "25000 100000\n")
+            self.assertEqual(conf.cpu_limit(root), 0.25)
+        with tempfile.TemporaryDirectory() as root:
+            self.write(root, "cpu/cpu.cfs_quota_us", "200000\n")
+            self.write(root, "cpu/cpu.cfs_period_us", "100000\n")
+            self.assertEqual(conf.cpu_limit(root), 2.0)
+        with tempfile.TemporaryDirectory() as root:
+            self.write(root, "cpu.max", "max 100000\n")
+            self.assertEqual(conf.cpu_limit(root), len(os.sched_getaffinity(0)))
+
+    def test_default_workers(self):
+        """It should run 2 x CPUs + 1 workers and a single one below a whole CPU"""
+        self.assertEqual(conf.default_workers(0.25), 1)
+        self.assertEqual(conf.default_workers(1), 3)
+        self.assertEqual(conf.default_workers(2.5), 6)
+        self.assertTrue(conf.preload_app)
+        self.assertGreater(conf.max_requests_jitter, 0)
+
+    def test_post_fork(self):
+        """It should give a forked worker fresh connection pools"""
+        with app.app_context():
+            pool = db.engine.pool
+        conf.post_fork(server_for(AsyncInventoryApp(app)), None)
+        with app.app_context():
+            self.assertIsNot(db.engine.pool, pool)
+            pool = db.engine.pool
+        # without preload the worker imports the app itself
+        conf.post_fork(server_for(app, preload_app=False), None)
+        with app.app_context():
+            self.assertIs(db.engine.pool, pool)
+
+    def test_worker_exit(self):
+        """It should let the tasks of an exiting worker finish and write its metrics"""
+        tasks = app.extensions["tasks"]
+        with patch.object(tasks, "stop") as stop, patch.object(registry, "flush") as flush:
+            conf.worker_exit(None, SimpleNamespace(wsgi=AsyncInventoryApp(app)))
+            stop.assert_called_once_with(app.config["TASK_STOP_TIMEOUT"])
+            flush.assert_called_once_with(force=True)
+            # a worker that never loaded the app has nothing to stop
+            conf.worker_exit(None, SimpleNamespace())
+            stop.assert_called_once()
+            self.assertEqual(flush.call_count, 2)
+
+    def test_on_starting(self):
+        """It should remove the metrics an earlier run left behind"""
+        directory = registry.directory
+        with tempfile.TemporaryDirectory() as root:
+            registry.directory = root
+            try:
+                for name in ("metrics_123.json", "metrics_124.json.tmp", "other.txt"):
+                    with open(os.path.join(root, name), "w", encoding="utf-8") as file:
+                        file.write("{}")
+                conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=1)))
+                self.assertEqual(os.listdir(root), ["other.txt"])
+            finally:
+                registry.directory = directory
+
+    def test_on_starting_metrics_dir(self):
+        """It should share the metrics of several workers on tmpfs by default"""
+        directory = registry.directory
+        registry.directory = None
+        with tempfile.TemporaryDirectory() as root, patch.dict(os.environ):
+            os.environ.pop("METRICS_DIR", None)
+            try:
+                # one worker has nothing to share
+                conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=1)))
+                self.assertIsNone(registry.directory)
+                self.assertNotIn("METRICS_DIR", os.environ)
+
+                shared = os.path.join(root, "inventory-metrics")
+                with patch.object(conf, "METRICS_TMPFS", shared):
+                    self.assertEqual(conf.default_metrics_dir(), shared)
+                    conf.on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=3)))
+                self.assertEqual(registry.directory, shared)
+                self.assertEqual(os.environ["METRICS_DIR"], shared)
+                self.assertTrue(os.path.isdir(shared))
+                with patch.object(conf, "METRICS_TMPFS", "/no/such/dir/metrics"):
+                    self.assertEqual(conf.default_metrics_dir(), os.path.join(tempfile.gettempdir(), "inventory-metrics"))
+            finally:
+                registry.directory = directory
+
+    def test_child_exit(self):
+        """It should drop the gauges of a worker that exited"""
+        directory = registry.directory
+        with tempfile.TemporaryDirectory() as root:
+            registry.directory = root
+            try:
+                path = os.path.join(root, "metrics_123.json")
+                with open(path, "w", encoding="utf-8") as file:
+                    json.dump({"http_requests_in_flight": {"[]": 1}}, file)
+                conf.child_exit(None, SimpleNamespace(pid=123))
+                with open(path, encoding="utf-8") as file:
+                    self.assertEqual(json.load(file), {})
+            finally:
+                registry.directory = directory
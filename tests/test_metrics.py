@@ -0,0 +1,254 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for Metrics and the Connection Pool
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+from unittest import TestCase
+from service.common import status
+from service.common.metrics import Registry
+from service.common.db_pool import (
+    POOL_CHECKOUT_SECONDS,
+    TimedAsyncQueuePool,
+    TimedNullPool,
+    TimedQueuePool,
+    async_engine_options,
+    engine_options,
+)
+
+POOL_CONFIG = {
+    "SQLALCHEMY_DATABASE_URI": "postgresql+psycopg://postgres@postgres:5432/postgres",
+    "DB_POOL_SIZE": 3,
+    "DB_MAX_OVERFLOW": 2,
+    "DB_POOL_TIMEOUT": 10,
+    "DB_POOL_RECYCLE": 600,
+    "DB_POOL_PRE_PING": True,
+    "DB_STATEMENT_TIMEOUT": 0,
+    "DB_EXTERNAL_POOLER": False,
+}
+
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """Test Cases for the Metrics Registry"""
+
+    def test_render_counter_and_gauge(self):
+        """It should render counters and gauges with labels"""
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests", ["code"])
+        counter.inc(code=200)
+        counter.inc(2, code=200)
+        gauge = registry.gauge("in_flight", "In flight")
+        gauge.inc()
+        gauge.dec()
+        gauge.set(4)
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{code="200"} 3', text)
+        self.assertIn("in_flight 4", text)
+
+    def test_render_histogram(self):
+        """It should render cumulative histogram buckets"""
+        registry = Registry()
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        text = registry.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("latency_seconds_count 3", text)
+        self.assertIn("latency_seconds_sum 5.55", text)
+
+    def test_register_returns_existing(self):
+        """It should return the metric already registered under a name"""
+        registry = Registry()
+        first = registry.counter("things_total", "Things")
+        self.assertIs(registry.counter("things_total", "Things"), first)
+
+    def test_metrics_endpoint(self):
+        """It should serve the metrics in the text format"""
+        # pylint: disable=import-outside-toplevel
+        from wsgi import app
+
+        response = app.test_client().get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        self.assertIn(b"db_pool_checkout_seconds", response.data)
+
+    def test_multi_process_render(self):
+        """It should sum the snapshots written by every process"""
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory)
+            counter = registry.counter("requests_total", "Requests", ["code"])
+            gauge = registry.gauge("in_flight", "In flight")
+            histogram = registry.histogram("latency_seconds", "Latency", buckets=(1.0,))
+            counter.inc(code=200)
+            gauge.set(1)
+            histogram.observe(0.5)
+
+            # another worker that has already written its snapshot
+            other = {
+                "requests_total": {'["200"]': 2, '["404"]': 1},
+                "in_flight": {"[]": 3},
+                "latency_seconds": {"[]": [1, 2, 2.5]},
+            }
+            with open(
+                os.path.join(directory, "metrics_1.json"), "w", encoding="utf-8"
+            ) as file:
+                json.dump(other, file)
+
+            text = registry.render()
+            self.assertIn('requests_total{code="200"} 3', text)
+            self.assertIn('requests_total{code="404"} 1', text)
+            self.assertIn("in_flight 4", text)
+            self.assertIn('latency_seconds_bucket{le="1.0"} 2', text)
+            self.assertIn("latency_seconds_count 3", text)
+
+            # a dead worker keeps its counters but not its gauges
+            registry.mark_process_dead(1)
+            registry.mark_process_dead(2)
+            text = registry.render()
+            self.assertIn('requests_total{code="200"} 3', text)
+            self.assertIn("in_flight 1", text)
+
+    def test_flush_thread(self):
+        """It should write the snapshot in the background until stopped"""
+        Registry().start()  # nothing to write without a directory
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory, flush_interval=0.01)
+            counter = registry.counter("requests_total", "Requests")
+            registry.start()
+            registry.start()
+            path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+            for _ in range(500):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(path))
+            counter.inc()
+            registry.stop()
+            self.assertIsNone(registry._flusher)  # pylint: disable=protected-access
+            with open(path, encoding="utf-8") as file:
+                self.assertEqual(json.load(file), {"requests_total": {"[]": 1}})
+
+    def test_multi_process_gauge_modes(self):
+        """It should combine the gauges of every process by their mode"""
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory)
+            modes = ("sum", "max", "min", "all")
+            for mode in modes:
+                registry.gauge(f"{mode}_gauge", mode, ["check"], multiprocess_mode=mode).set(2, check="db")
+            other = {f"{mode}_gauge": {'["db"]': 5} for mode in modes}
+            with open(os.path.join(directory, "metrics_1.json"), "w", encoding="utf-8") as file:
+                json.dump(other, file)
+
+            text = registry.render()
+            self.assertIn('sum_gauge{check="db"} 7', text)
+            self.assertIn('max_gauge{check="db"} 5', text)
+            self.assertIn('min_gauge{check="db"} 2', text)
+            self.assertIn('all_gauge{check="db",pid="1"} 5', text)
+            self.assertIn(f'all_gauge{{check="db",pid="{os.getpid()}"}} 2', text)
+            self.assertRaises(ValueError, registry.gauge, "bad_gauge", "bad", multiprocess_mode="avg")
+
+            registry.clear()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_request_instrumentation(self):
+        """It should record the latency, status and db work of requests"""
+        # pylint: disable=import-outside-toplevel
+        from wsgi import app
+
+        client = app.test_client()
+        client.get("/inventory")
+        client.get("/inventory/0")
+        text = client.get("/metrics").get_data(as_text=True)
+        self.assertIn(
+            'http_requests_total{method="GET",endpoint="list_inventory",status="200"}',
+            text,
+        )
+        self.assertIn(
+            'http_requests_total{method="GET",endpoint="get_inventory",status="404"}',
+            text,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",endpoint="list_inventory"}',
+            text,
+        )
+        self.assertIn('http_request_db_queries_count{endpoint="list_inventory"}', text)
+        self.assertIn("json_serialization_seconds_count", text)
+        self.assertIn("http_requests_in_flight 1", text)
+
+
+######################################################################
+#  P O O L   T E S T   C A S E S
+######################################################################
+class TestPool(TestCase):
+    """Test Cases for the Connection Pool options"""
+
+    def test_sqlite_options(self):
+        """It should keep the default pool for SQLite"""
+        config = dict(POOL_CONFIG, SQLALCHEMY_DATABASE_URI="sqlite:///test.db")
+        self.assertEqual(engine_options(config), {"pool_pre_ping": True})
+
+    def test_queue_pool_options(self):
+        """It should size a timed QueuePool from the configuration"""
+        options = engine_options(dict(POOL_CONFIG, DB_STATEMENT_TIMEOUT=5000))
+        self.assertIs(options["poolclass"], TimedQueuePool)
+        self.assertEqual(options["pool_size"], 3)
+        self.assertEqual(options["max_overflow"], 2)
+        self.assertEqual(options["pool_recycle"], 600)
+        self.assertEqual(
+            options["connect_args"], {"options": "-c statement_timeout=5000"}
+        )
+
+    def test_external_pooler_options(self):
+        """It should not pool on the client behind an external pooler"""
+        options = engine_options(dict(POOL_CONFIG, DB_EXTERNAL_POOLER=True))
+        self.assertIs(options["poolclass"], TimedNullPool)
+        self.assertNotIn("pool_size", options)
+        self.assertNotIn("connect_args", options)
+
+    def test_async_options(self):
+        """It should size the async pool from the same configuration"""
+        config = dict(POOL_CONFIG, DB_STATEMENT_TIMEOUT=5000)
+        options = async_engine_options(config, "postgresql+psycopg://postgres@postgres/postgres")
+        self.assertIs(options["poolclass"], TimedAsyncQueuePool)
+        self.assertEqual((options["pool_size"], options["max_overflow"]), (3, 2))
+        self.assertEqual(options["connect_args"], {"options": "-c statement_timeout=5000"})
+        options = async_engine_options(config, "postgresql+asyncpg://postgres@postgres/postgres")
+        self.assertEqual(options["connect_args"], {"server_settings": {"statement_timeout": "5000"}})
+        pooler = dict(config, DB_EXTERNAL_POOLER=True)
+        options = async_engine_options(pooler, "postgresql+asyncpg://postgres@postgres/postgres")
+        self.assertIs(options["poolclass"], TimedNullPool)
+        self.assertEqual(async_engine_options(config, "sqlite+aiosqlite:///test.db"), {"pool_pre_ping": True})
+
+    def test_checkout_is_timed(self):
+        """It should record the checkout wait of every connection"""
+        before = sum(counts[-2] for counts in POOL_CHECKOUT_SECONDS.samples().values())
+        pool = TimedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=1)
+        pool.connect().close()
+        after = sum(counts[-2] for counts in POOL_CHECKOUT_SECONDS.samples().values())
+        self.assertEqual(after, before + 1)
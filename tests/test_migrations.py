@@ -0,0 +1,92 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Schema Migrations
+"""
+
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+import sqlalchemy as sa
+from flask import Flask
+from service import config
+from service.models import db, Inventory, Alert
+from service.common.migrations import upgrade
+
+# The tables as the first release created them
+ORIGINAL_SCHEMA = (
+    "CREATE TABLE inventory (id INTEGER PRIMARY KEY, name VARCHAR(63), quantity INTEGER,"
+    " condition VARCHAR(24), restock_level INTEGER NOT NULL)",
+    "CREATE TABLE alert (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL REFERENCES inventory (id),"
+    " message VARCHAR(256) NOT NULL, created_at DATETIME NOT NULL)",
+    "INSERT INTO inventory VALUES (1, 'widget', 2, 'new', 5)",
+    "INSERT INTO alert VALUES (1, 1, 'Low Stock Alert', '2024-01-01 00:00:00')",
+    "INSERT INTO alert VALUES (2, 1, 'Low Stock Alert', '2024-01-02 00:00:00')",
+)
+
+
+######################################################################
+#  M I G R A T I O N   T E S T   C A S E S
+######################################################################
+class TestMigrations(TestCase):
+    """Test Cases for the Schema Migrations"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.app = Flask(__name__)
+        self.app.config.from_object(config)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.directory.name}/old.db"
+        db.init_app(self.app)
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                for statement in ORIGINAL_SCHEMA:
+                    connection.execute(sa.text(statement))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.directory.cleanup()
+
+    def test_upgrade(self):
+        """It should add the new columns, tables and indexes to an existing database"""
+        with self.app.app_context():
+            changes = upgrade()
+            self.assertIn("inventory.revision", changes)
+            self.assertIn("alert.last_seen_at", changes)
+            self.assertIn("ix_inventory_revision", changes)
+            self.assertIn("resolved 1 duplicate open alerts", changes)
+            self.assertIn("ix_alert_open_product", changes)
+
+            inventory = Inventory.find(1)
+            self.assertEqual(inventory.revision, 1)
+            self.assertIsNotNone(inventory.updated_at)
+            self.assertEqual(Inventory.latest_revision(), 1)
+            alert = db.session.get(Alert, 2)
+            self.assertEqual(alert.occurrences, 1)
+            self.assertEqual(alert.last_seen_at, alert.created_at)
+            self.assertIsNone(alert.resolved_at)
+            self.assertEqual(db.session.get(Alert, 1).resolved_at, datetime(2024, 1, 1))
+
+            # writes work on the upgraded tables
+            inventory.quantity = 3
+            inventory.update()
+            self.assertEqual(inventory.revision, 2)
+            db.session.remove()
+
+            # a second run has nothing left to do
+            self.assertEqual(upgrade(), [])
@@ -20,10 +20,16 @@ Test cases for Inventory Model
 
 # pylint: disable=duplicate-code
 import os
+import time
 import logging
+import threading
 from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from wsgi import app
-from service.models import Inventory, DataValidationError, db, Alert
+from service.common.cache import cache
+from service.models import Inventory, DataValidationError, ConflictError, db, Alert, next_revision
 from .factories import InventoryFactory
 
 DATABASE_URI = os.getenv(
@@ -57,6 +63,7 @@ class TestInventory(TestCase):
         db.session.query(Alert).delete()  # clean up alerts first due to foreign key
         db.session.query(Inventory).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -100,6 +107,112 @@ class TestInventory(TestCase):
         self.assertEqual(inventory[0].id, original_id)
         self.assertEqual(inventory[0].category, "k9")
 
+    def test_update_if_revision(self):
+        """It should only update an Inventory that is still at the given revision"""
+        inventory = InventoryFactory(quantity=5)
+        inventory.create()
+        revision = inventory.revision
+        inventory.quantity = 6
+        inventory.update(revision)
+        self.assertEqual(inventory.quantity, 6)
+        self.assertGreater(inventory.revision, revision)
+        self.assertEqual(Inventory.latest_revision(), inventory.revision)
+
+        inventory.quantity = 7
+        self.assertRaises(ConflictError, inventory.update, revision)
+        self.assertEqual(Inventory.find(inventory.id).quantity, 6)
+
+    def test_summarize(self):
+        """It should summarize Inventory with one aggregate query"""
+        InventoryFactory(condition="new", quantity=2, restock_level=3).create()
+        InventoryFactory(condition="used", quantity=8, restock_level=3).create()
+        (summary,) = Inventory.summarize()
+        self.assertEqual((summary.count, summary.total_quantity, summary.low_stock_count), (2, 10, 1))
+        groups = Inventory.summarize("condition")
+        self.assertEqual([(group.condition, group.max_quantity) for group in groups], [("new", 2), ("used", 8)])
+        self.assertRaises(DataValidationError, Inventory.summarize, "name")
+
+    def test_writes_advance_revision(self):
+        """It should give every write a higher revision and keep a tombstone on delete"""
+        inventory = InventoryFactory()
+        inventory.create()
+        created = inventory.revision
+        self.assertIsNotNone(inventory.updated_at)
+        inventory.quantity = 1
+        inventory.update()
+        self.assertGreater(inventory.revision, created)
+        updated = inventory.revision
+        Inventory.bulk_update([dict(inventory.columns(), id=inventory.id, quantity=2)])
+        self.assertGreater(Inventory.find(inventory.id).revision, updated)
+
+        inventory_id = inventory.id
+        Inventory.find(inventory_id).delete()
+        changes = Inventory.find_changes(created)
+        self.assertEqual(len(changes), 1)
+        deleted, row = changes[0]
+        self.assertTrue(deleted)
+        self.assertEqual(row.id, inventory_id)
+
+    def test_next_revision_reads_indexes(self):
+        """It should take the next revision from the ends of the revision indexes"""
+        if db.engine.dialect.name != "sqlite":
+            self.skipTest("PostgreSQL takes revisions from a counter")
+        InventoryFactory().create()
+        statement = db.select(next_revision())
+        sql = str(statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+        plan = [row[-1] for row in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}"))]
+        self.assertEqual([step for step in plan if step.startswith("SCAN inventory")], [])
+        self.assertEqual(db.session.execute(statement).scalar_one(), Inventory.latest_revision() + 1)
+
+    def test_revisions_follow_commit_order(self):
+        """It should not let a later transaction commit a higher revision first"""
+        engine = db.engine
+        first = Session(engine)
+        early = InventoryFactory(id=None)
+        first.add(early)
+        first.flush()
+        late = {}
+
+        def write():
+            with Session(engine) as second:
+                inventory = InventoryFactory(id=None)
+                second.add(inventory)
+                second.commit()
+                late["revision"] = inventory.revision
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        time.sleep(0.2)
+        # the second writer waits for the first to end its transaction
+        self.assertTrue(thread.is_alive())
+        seen = Inventory.latest_revision()
+        db.session.commit()
+        first.commit()
+        thread.join()
+        self.assertGreater(late["revision"], early.revision)
+        self.assertGreater(early.revision, seen)
+        first.close()
+
+    def test_record_low_stock(self):
+        """It should keep one open Alert per product and roll it up"""
+        inventory = InventoryFactory(quantity=1, restock_level=5)
+        inventory.create()
+        self.assertTrue(Alert.record_low_stock(inventory.id, inventory.name, 2, 5))
+        self.assertFalse(Alert.record_low_stock(inventory.id, inventory.name, 1, 5))
+        db.session.commit()
+        alert = Alert.query.filter_by(product_id=inventory.id).one()
+        self.assertEqual(alert.occurrences, 2)
+        self.assertIn("has quantity 1", alert.message)
+        # the unique index refuses a second open Alert
+        db.session.add(Alert(product_id=inventory.id, message="duplicate"))
+        self.assertRaises(IntegrityError, db.session.commit)
+        db.session.rollback()
+        # but not one next to a resolved Alert
+        Alert.resolve(inventory.id)
+        self.assertTrue(Alert.record_low_stock(inventory.id, inventory.name, 0, 5))
+        db.session.commit()
+        self.assertEqual(Alert.query.filter_by(product_id=inventory.id).count(), 2)
+
     def test_update_no_id(self):
         """It should not Update a Inventory with no id"""
         inventory = InventoryFactory()
@@ -147,3 +260,18 @@ class TestInventory(TestCase):
         """It should return a string representation"""
         inventory = InventoryFactory()
         self.assertTrue(str(inventory).startswith("<Inventory"))
+
+    def test_bulk_create_inventory(self):
+        """It should create many Inventory in one transaction"""
+        rows = [InventoryFactory().columns() for _ in range(3)]
+        ids = Inventory.bulk_create(rows)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(Inventory.find(ids[1]).name, rows[1]["name"])
+        self.assertEqual(Inventory.bulk_create([]), [])
+
+    def test_bulk_create_rolls_back(self):
+        """It should not create any Inventory when one row is invalid"""
+        rows = [InventoryFactory().columns() for _ in range(2)]
+        with patch("service.models.db.session.commit", side_effect=Exception("boom")):
+            self.assertRaises(DataValidationError, Inventory.bulk_create, rows)
+        self.assertEqual(len(Inventory.all()), 0)
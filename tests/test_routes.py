@@ -20,13 +20,20 @@ TestInventory API Service Test Suite
 
 # pylint: disable=duplicate-code
 import os
+import gzip
+import json
 import logging
 import unittest
 from unittest import TestCase
+from unittest.mock import patch
 from wsgi import app
 from service.common import status
-from service.models import db, Inventory, Alert
+from service.common.cache import cache, SharedBackend
+from service.common.compression import COMPRESSED_RESPONSES
+from service.common.events import broker
+from service.models import db, Inventory, Alert, ConflictError
 from .factories import InventoryFactory
+from .test_cache import FakeRedis
 import pytest
 
 
@@ -59,6 +66,9 @@ class TestYourResourceService(TestCase):
     def setUpClass(cls):
         """Run once before all tests"""
         app.config["TESTING"] = True
+        app.config["TASK_EAGER"] = True
+        app.config["HEALTH_CHECK_INTERVAL"] = 0
+        app.config["DB_QUERY_BUDGET_ENFORCE"] = True
         app.config["DEBUG"] = False
         # Set up the test database
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
@@ -77,6 +87,7 @@ class TestYourResourceService(TestCase):
         db.session.query(Alert).delete()  # clean up alerts first due to foreign key
         db.session.query(Inventory).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -173,6 +184,58 @@ class TestYourResourceService(TestCase):
         updated_inventory = response.get_json()
         self.assertEqual(updated_inventory["name"], "unknown")
 
+    def test_update_inventory_if_match(self):
+        """It should only Update an Inventory whose ETag matches If-Match"""
+        test_inventory = self._create_inventory(1)[0]
+        url = f"{BASE_URL}/{test_inventory.id}"
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        data = response.get_json()
+
+        data["quantity"] = 1
+        response = self.client.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        # the first update moved the Inventory on, so the old ETag is stale
+        data["quantity"] = 2
+        response = self.client.put(url, json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.get(url).get_json()["quantity"], 1)
+
+        # If-Match compares strongly, and compression leaves the ETag strong
+        compressor = app.extensions["compression"]
+        min_size, compressor.min_size = compressor.min_size, 0
+        try:
+            response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        finally:
+            compressor.min_size = min_size
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        etag = response.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        response = self.client.put(url, json=data, headers={"If-Match": f"W/{etag}"})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.put(url, json=data, headers={"If-Match": f'"x", {etag}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(url, json=data, headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # a missing Inventory is 404 whatever the If-Match
+        response = self.client.put(f"{BASE_URL}/0", json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.put(f"{BASE_URL}/0", json=data)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_inventory_changed_concurrently(self):
+        """It should return 412 when the Inventory changes between the check and the write"""
+        test_inventory = self._create_inventory(1)[0]
+        url = f"{BASE_URL}/{test_inventory.id}"
+        data = self.client.get(url).get_json()
+        with patch.object(Inventory, "update_columns", side_effect=ConflictError("changed")):
+            response = self.client.put(url, json=data, headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertIn("changed", response.get_json()["message"])
+
     # Read Inventory Test (Sina)
 
     def test_get_inventory(self):
@@ -184,6 +247,23 @@ class TestYourResourceService(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_inventory.name)
 
+    def test_get_inventory_not_modified(self):
+        """It should return 304 for an Inventory that has not changed"""
+        test_inventory = self._create_inventory(1)[0]
+        url = f"{BASE_URL}/{test_inventory.id}"
+        etag = self.client.get(url).headers["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+        # If-None-Match compares weakly
+        response = self.client.get(url, headers={"If-None-Match": f"W/{etag}"})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.put(f"{url}/restock_check", json={"quantity": 1000})
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["quantity"], 1000)
+
     def test_get_inventory_not_found(self):
         """It should not Get a Inventory thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -192,6 +272,31 @@ class TestYourResourceService(TestCase):
         logging.debug("Response data = %s", data)
         self.assertIn("was not found", data["message"])
 
+    def test_get_inventory_cached(self):
+        """It should serve a repeated Get from a shared cache until the item changes"""
+        test_inventory = self._create_inventory(1)[0]
+        url = f"{BASE_URL}/{test_inventory.id}"
+        # other workers' writes don't clear an in-process cache, so it isn't read
+        hits, misses = cache.hits, cache.misses
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual((cache.hits, cache.misses), (hits, misses))
+
+        backend, cache.backend = cache.backend, SharedBackend(FakeRedis())
+        try:
+            self.client.get(url)
+            response = self.client.get(url)
+            self.assertEqual(response.get_json()["name"], test_inventory.name)
+            stats = self.client.get("/cache/stats").get_json()
+            self.assertEqual(stats["hits"], hits + 1)
+
+            response = self.client.put(f"{url}/mark_damaged")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(url)
+            self.assertEqual(response.get_json()["condition"], "damaged")
+        finally:
+            cache.backend = backend
+
     # Delete Inventory Test (Teresa)
     def test_delete_inventory(self):
         """It should Delete a Inventory"""
@@ -220,6 +325,211 @@ class TestYourResourceService(TestCase):
         data = response.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_get_inventory_list_not_modified(self):
+        """It should return 304 for a list of Inventory until any Inventory changes"""
+        self._create_inventory(2)
+        response = self.client.get(f"{BASE_URL}?limit=1")
+        etag = response.headers["ETag"]
+        self.assertIn("Link", response.headers)
+        for url in (BASE_URL, f"{BASE_URL}?limit=1", f"{BASE_URL}?stream=true"):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self._create_inventory(1)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 3)
+        response = self.client.get(f"{BASE_URL}?stream=true")
+        self.assertEqual(response.headers["ETag"], self.client.get(BASE_URL).headers["ETag"])
+
+    def test_get_inventory_list_fields(self):
+        """It should only return the requested fields of every Inventory"""
+        items = self._create_inventory(3)
+        for url in (
+            f"{BASE_URL}?fields=quantity,id",
+            f"{BASE_URL}?fields=id,quantity&limit=2",
+            f"{BASE_URL}?fields=id,quantity&stream=true",
+            f"{BASE_URL}?fields=id,,quantity,",
+        ):
+            data = self.client.get(url).get_json()
+            self.assertEqual(data[0], {"id": items[0].id, "quantity": items[0].quantity})
+
+        response = self.client.get(f"{BASE_URL}?fields=name&limit=2")
+        self.assertEqual(response.get_json(), [{"name": item.name} for item in items[:2]])
+        self.assertIn(f"after={items[1].id}", response.headers["Link"])
+
+        response = self.client.get(f"{BASE_URL}?fields=id,price")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("price", response.get_json()["message"])
+
+    def test_get_inventory_page(self):
+        """It should page through Inventory with a keyset cursor"""
+        self._create_inventory(5)
+        response = self.client.get(f"{BASE_URL}?limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 2)
+        cursor = response.headers.get("X-Next-Cursor")
+        self.assertEqual(cursor, str(data[-1]["id"]))
+        self.assertIn('rel="next"', response.headers.get("Link"))
+
+        seen = [item["id"] for item in data]
+        while cursor:
+            response = self.client.get(f"{BASE_URL}?limit=2&after={cursor}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item["id"] for item in response.get_json())
+            cursor = response.headers.get("X-Next-Cursor")
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_get_inventory_page_bad_limit(self):
+        """It should not accept a limit less than one"""
+        response = self.client.get(f"{BASE_URL}?limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_inventory_list(self):
+        """It should stream the Inventory list as a JSON array"""
+        items = self._create_inventory(3)
+        response = self.client.get(f"{BASE_URL}?stream=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_streamed)
+        data = response.get_json()
+        self.assertEqual([item["id"] for item in data], sorted(i.id for i in items))
+
+    def test_stream_inventory_list_empty(self):
+        """It should stream an empty JSON array when there is no Inventory"""
+        response = self.client.get(f"{BASE_URL}?stream=true&condition=new")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), [])
+
+    # ----------------------------------------------------------
+    # TEST BULK
+    # ----------------------------------------------------------
+    def test_bulk_create_inventory(self):
+        """It should Create a batch of Inventory in one request"""
+        items = [InventoryFactory().serialize() for _ in range(3)]
+        items.insert(1, {"name": "missing fields"})
+        response = self.client.post(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.get_json()
+        self.assertEqual([r["index"] for r in results], [0, 1, 2, 3])
+        self.assertEqual(
+            [r["status"] for r in results],
+            [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST, status.HTTP_201_CREATED, status.HTTP_201_CREATED],
+        )
+        self.assertEqual(Inventory.query.count(), 3)
+        found = Inventory.find(results[2]["id"])
+        self.assertEqual(found.name, items[2]["name"])
+
+    def test_bulk_create_not_array(self):
+        """It should not Create a batch that is not a JSON array"""
+        response = self.client.post(f"{BASE_URL}/bulk", json={"name": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_too_large(self):
+        """It should not Create a batch larger than the configured maximum"""
+        app.config["INVENTORY_BULK_MAX"] = 1
+        try:
+            items = [InventoryFactory().serialize() for _ in range(2)]
+            response = self.client.post(f"{BASE_URL}/bulk", json=items)
+        finally:
+            app.config["INVENTORY_BULK_MAX"] = 50000
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_bulk_update_inventory(self):
+        """It should Update a batch of Inventory in one request"""
+        items = [item.serialize() for item in self._create_inventory(2)]
+        for item in items:
+            item["quantity"] = 7
+        items.append({**items[0], "id": 0})
+        items.append({"name": "no id"})
+        response = self.client.patch(f"{BASE_URL}/bulk", json=items)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.get_json()
+        self.assertEqual(
+            [r["status"] for r in results],
+            [status.HTTP_200_OK, status.HTTP_200_OK, status.HTTP_404_NOT_FOUND, status.HTTP_400_BAD_REQUEST],
+        )
+        for item in items[:2]:
+            self.assertEqual(Inventory.find(item["id"]).quantity, 7)
+
+    def test_bulk_delete_inventory(self):
+        """It should Delete a batch of Inventory in one request"""
+        items = self._create_inventory(3)
+        ids = [items[0].id, items[1].id, 0]
+        response = self.client.delete(f"{BASE_URL}/bulk", json=ids)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.get_json()
+        self.assertEqual(
+            [r["status"] for r in results],
+            [status.HTTP_204_NO_CONTENT, status.HTTP_204_NO_CONTENT, status.HTTP_404_NOT_FOUND],
+        )
+        self.assertEqual([item.id for item in Inventory.all()], [items[2].id])
+
+    def test_bulk_delete_bad_ids(self):
+        """It should not Delete a batch that is not an array of ids"""
+        response = self.client.delete(f"{BASE_URL}/bulk", json=["one"])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # ----------------------------------------------------------
+    # TEST ADJUST
+    # ----------------------------------------------------------
+    def test_adjust_stock(self):
+        """It should atomically adjust the quantity by a delta"""
+        item = InventoryFactory(quantity=10, restock_level=5)
+        created = self.client.post(BASE_URL, json=item.serialize()).get_json()
+        url = f"{BASE_URL}/{created['id']}/adjust"
+
+        response = self.client.post(url, json={"delta": -3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["quantity"], 7)
+        self.assertGreater(data["revision"], created["revision"])
+        self.assertEqual(response.headers["ETag"], f'"{data["revision"]}"')
+        self.assertEqual(Alert.query.count(), 0)
+
+        # dropping below the restock level writes an alert
+        response = self.client.post(url, json={"delta": -4}, headers={"If-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["quantity"], 3)
+        alerts = Alert.query.all()
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0].product_id, created["id"])
+
+    def test_adjust_stock_conflicts(self):
+        """It should not adjust a stale revision or below zero"""
+        item = InventoryFactory(quantity=2)
+        created = self.client.post(BASE_URL, json=item.serialize()).get_json()
+        url = f"{BASE_URL}/{created['id']}/adjust"
+
+        stale = f'"{created["revision"] - 1}"'
+        response = self.client.post(url, json={"delta": 1}, headers={"If-Match": stale})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertIn("revision", response.get_json()["message"])
+        # If-Match compares strongly, like PUT
+        weak = f'W/"{created["revision"]}"'
+        response = self.client.post(url, json={"delta": 1}, headers={"If-Match": weak})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        response = self.client.post(url, json={"delta": -3})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Inventory.find(created["id"]).quantity, 2)
+
+    def test_adjust_stock_bad_request(self):
+        """It should not adjust missing Inventory or without an integer delta"""
+        response = self.client.post(f"{BASE_URL}/0/adjust", json={"delta": 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(f"{BASE_URL}/0/adjust", json={"delta": "1"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/0/adjust", json=[1])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/0/adjust", json={"delta": True})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/0/adjust", json={"delta": 1, "version": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/0/adjust", json={"delta": 1}, headers={"If-Match": '"1"'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     # Tests
 
     def test_no_content_type(self):
@@ -251,6 +561,47 @@ class TestYourResourceService(TestCase):
         for item in data:
             self.assertEqual(item["condition"], "new")
 
+    def test_query_inventory_by_combined_filters(self):
+        """It should apply name, condition and quantity filters together"""
+        for cond, quantity in (("new", 5), ("new", 50), ("used", 5)):
+            inv = InventoryFactory(name="widget", condition=cond, quantity=quantity)
+            self.client.post(BASE_URL, json=inv.serialize())
+        self.client.post(BASE_URL, json=InventoryFactory(name="gadget", condition="new", quantity=5).serialize())
+
+        response = self.client.get(f"{BASE_URL}?name=widget&condition=new&max_quantity=10")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["quantity"], 5)
+
+        response = self.client.get(f"{BASE_URL}?name=widget&min_quantity=10")
+        self.assertEqual([item["quantity"] for item in response.get_json()], [50])
+
+    def test_query_inventory_low_stock_filter(self):
+        """It should filter inventory below its restock level"""
+        self.client.post(BASE_URL, json=InventoryFactory(quantity=1, restock_level=5).serialize())
+        self.client.post(BASE_URL, json=InventoryFactory(quantity=9, restock_level=5).serialize())
+        response = self.client.get(f"{BASE_URL}?low_stock=true")
+        data = response.get_json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["quantity"], 1)
+
+    def test_query_inventory_sorted(self):
+        """It should sort inventory by the requested column"""
+        for quantity in (3, 1, 2):
+            self.client.post(BASE_URL, json=InventoryFactory(quantity=quantity).serialize())
+        response = self.client.get(f"{BASE_URL}?sort=-quantity")
+        self.assertEqual([item["quantity"] for item in response.get_json()], [3, 2, 1])
+        response = self.client.get(f"{BASE_URL}?sort=quantity")
+        self.assertEqual([item["quantity"] for item in response.get_json()], [1, 2, 3])
+
+    def test_query_inventory_bad_sort(self):
+        """It should not sort by an unknown column or together with a cursor"""
+        response = self.client.get(f"{BASE_URL}?sort=secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}?sort=name&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_mark_inventory_as_damaged(self):
         """It should mark an Inventory item as damaged"""
         # First create an item
@@ -302,6 +653,78 @@ class TestYourResourceService(TestCase):
             self.assertIn("product_id", item)
             self.assertIn("quantity", item)
 
+    def test_get_stock_levels_not_modified(self):
+        """It should return 304 for an unchanged stock snapshot"""
+        items = self._create_inventory(3)
+        response = self.client.get(f"{BASE_URL}/stock")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([item["product_id"] for item in data], sorted(i.id for i in items))
+        etag = response.headers["ETag"]
+
+        response = self.client.get(f"{BASE_URL}/stock", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.data, b"")
+
+        # a stock change produces a new snapshot
+        self.client.put(f"{BASE_URL}/{items[0].id}/restock_check", json={"quantity": 1000})
+        response = self.client.get(f"{BASE_URL}/stock", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_stock_levels_compressed(self):
+        """It should only compress a large stock snapshot, and only once"""
+        response = self.client.get(f"{BASE_URL}/stock", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+        self._create_inventory(60)
+        hits = COMPRESSED_RESPONSES.samples().get(("gzip", "hit"), 0)
+        first = self.client.get(f"{BASE_URL}/stock", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(first.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(first.data))), 60)
+        second = self.client.get(f"{BASE_URL}/stock", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(COMPRESSED_RESPONSES.samples()[("gzip", "hit")], hits + 1)
+
+    def test_get_inventory_summary(self):
+        """It should summarize Inventory in the database and cache it until a write"""
+        InventoryFactory(condition="new", quantity=5, restock_level=10).create()
+        InventoryFactory(condition="new", quantity=20, restock_level=10).create()
+        InventoryFactory(condition="used", quantity=1, restock_level=0).create()
+
+        response = self.client.get(f"{BASE_URL}/summary")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.get_json(),
+            {"count": 3, "total_quantity": 26, "min_quantity": 1, "max_quantity": 20, "low_stock_count": 1},
+        )
+        etag = response.headers["ETag"]
+        response = self.client.get(f"{BASE_URL}/summary", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(f"{BASE_URL}/summary?group_by=condition")
+        data = response.get_json()
+        self.assertEqual([group["condition"] for group in data], ["new", "used"])
+        self.assertEqual(data[0]["total_quantity"], 25)
+        self.assertEqual(data[0]["low_stock_count"], 1)
+
+        # a write moves the revision on, so the cached summary isn't reused
+        InventoryFactory(condition="used", quantity=4, restock_level=0).create()
+        data = self.client.get(f"{BASE_URL}/summary?group_by=condition").get_json()
+        self.assertEqual(data[1]["count"], 2)
+
+    def test_get_inventory_summary_bad_group(self):
+        """It should not summarize by a column that isn't groupable"""
+        response = self.client.get(f"{BASE_URL}/summary?group_by=name")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_inventory_summary_empty(self):
+        """It should summarize an empty inventory"""
+        data = self.client.get(f"{BASE_URL}/summary").get_json()
+        self.assertEqual(data["count"], 0)
+        self.assertEqual(data["total_quantity"], 0)
+        self.assertIsNone(data["max_quantity"])
+
     def test_get_stock_levels_empty(self):
         """It should return an empty list when no inventory exists"""
         response = self.client.get(f"{BASE_URL}/stock")
@@ -323,6 +746,24 @@ class TestYourResourceService(TestCase):
         self.assertEqual(data[0]["product_id"], item1.id)
         self.assertEqual(data[0]["alert_status"], "Alert! Product is Low Stock")
 
+    def test_get_low_stock_alerts_paged(self):
+        """It should page through low-stock alerts with a keyset cursor"""
+        for quantity in (1, 9, 2, 3):
+            item = InventoryFactory(quantity=quantity, restock_level=5)
+            self.client.post(BASE_URL, json=item.serialize())
+
+        response = self.client.get(f"{BASE_URL}/low-stock?limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([item["quantity"] for item in data], [1, 2])
+        cursor = response.headers.get("X-Next-Cursor")
+        self.assertEqual(cursor, str(data[-1]["product_id"]))
+
+        response = self.client.get(f"{BASE_URL}/low-stock?limit=2&after={cursor}")
+        data = response.get_json()
+        self.assertEqual([item["quantity"] for item in data], [3])
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
     # test case for inventory low stock
     def test_get_low_stock_alerts_empty(self):
         """It should return empty list when all stock levels are healthy"""
@@ -335,6 +776,209 @@ class TestYourResourceService(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.get_json(), [])
 
+    # ----------------------------------------------------------
+    # TEST CHANGES
+    # ----------------------------------------------------------
+    def test_list_inventory_changes(self):
+        """It should return only the rows changed since a revision"""
+        response = self.client.get(f"{BASE_URL}/changes")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        since = response.headers["X-Revision"]
+        self.assertEqual(self.client.get(f"{BASE_URL}/changes?since={since}").get_json(), [])
+
+        items = self._create_inventory(3)
+        self.client.put(f"{BASE_URL}/{items[0].id}/restock_check", json={"quantity": 1})
+        self.client.delete(f"{BASE_URL}/{items[1].id}")
+        response = self.client.get(f"{BASE_URL}/changes?since={since}")
+        changes = response.get_json()
+        self.assertEqual([change["id"] for change in changes], [items[2].id, items[0].id, items[1].id])
+        self.assertEqual(changes[1]["quantity"], 1)
+        self.assertTrue(changes[2]["deleted"])
+        self.assertNotIn("deleted", changes[0])
+        revisions = [change["revision"] for change in changes]
+        self.assertEqual(revisions, sorted(revisions))
+        self.assertEqual(response.headers["X-Revision"], str(revisions[-1]))
+
+        # nothing changed since the last poll
+        response = self.client.get(f"{BASE_URL}/changes?since={revisions[-1]}")
+        self.assertEqual(response.get_json(), [])
+        self.assertEqual(response.headers["X-Revision"], str(revisions[-1]))
+
+    def test_list_inventory_changes_paged(self):
+        """It should page through changes with the Link header"""
+        since = self.client.get(f"{BASE_URL}/changes").headers["X-Revision"]
+        self.client.post(f"{BASE_URL}/bulk", json=[InventoryFactory().serialize() for _ in range(3)])
+
+        response = self.client.get(f"{BASE_URL}/changes?since={since}&limit=2")
+        first = response.get_json()
+        self.assertEqual(len(first), 2)
+        self.assertNotIn("X-Revision", response.headers)
+        next_url = response.headers["Link"].split(";")[0].strip("<>")
+        response = self.client.get(next_url)
+        second = response.get_json()
+        self.assertEqual(len(second), 1)
+        self.assertNotIn("Link", response.headers)
+        self.assertEqual(len({change["id"] for change in first + second}), 3)
+
+    # ----------------------------------------------------------
+    # TEST EVENTS
+    # ----------------------------------------------------------
+    def test_inventory_events(self):
+        """It should stream stock and alert events as Server-Sent Events"""
+        app.config["EVENTS_KEEPALIVE"] = 0.01
+        start = broker.publish("test", {})
+        item = self._create_inventory()[0]
+        self.client.put(f"{BASE_URL}/{item.id}/restock_check", json={"quantity": 0})
+        self.client.delete(f"{BASE_URL}/{item.id}")
+
+        response = self.client.get(f"{BASE_URL}/events", headers={"Last-Event-ID": str(start)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        frames = (frame.decode() for frame in response.response)
+        self.assertEqual(next(frames), "retry: 3000\n\n")
+        events = [next(frames) for _ in range(4)]
+        # TASK_EAGER runs the alert check as the new quantity commits
+        self.assertEqual(
+            [frame.split("\n")[1] for frame in events],
+            ["event: stock", "event: alert", "event: stock", "event: deleted"],
+        )
+        self.assertEqual(next(frames), ": keepalive\n\n")
+        self.assertIn(f'"product_id":{item.id}', events[1])
+        self.assertEqual(broker.subscriber_count, 1)
+        response.close()
+        self.assertEqual(broker.subscriber_count, 0)
+        app.config["EVENTS_KEEPALIVE"] = 15
+
+    def test_inventory_events_limit(self):
+        """It should refuse event subscribers past the threads they may hold"""
+        # a second dashboard is served by default
+        responses = [self.client.get(f"{BASE_URL}/events") for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * 2)
+        for response in responses:
+            response.close()
+
+        threads = app.config["EVENTS_MAX_THREADS"]
+        app.config["EVENTS_MAX_THREADS"] = 1
+        try:
+            first = self.client.get(f"{BASE_URL}/events")
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            second = self.client.get(f"{BASE_URL}/events")
+            self.assertEqual(second.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(second.headers["Retry-After"], "30")
+            first.close()
+            self.assertEqual(self.client.get(f"{BASE_URL}/events").status_code, status.HTTP_200_OK)
+        finally:
+            app.config["EVENTS_MAX_THREADS"] = threads
+        self.assertEqual(broker.subscriber_count, 0)
+
+    def test_bulk_events(self):
+        """It should publish events for bulk creates, updates and deletes"""
+        subscriber = broker.subscribe()
+        try:
+            items = [InventoryFactory().serialize() for _ in range(2)]
+            results = self.client.post(f"{BASE_URL}/bulk", json=items).get_json()
+            ids = [result["id"] for result in results]
+            updates = [dict(item, id=new_id, quantity=7) for item, new_id in zip(items, ids)]
+            self.client.patch(f"{BASE_URL}/bulk", json=updates)
+            self.client.delete(f"{BASE_URL}/bulk", json=ids)
+            frames = [subscriber.get(0) for _ in range(6)]
+            self.assertEqual(
+                [frame.split("\n")[1] for frame in frames],
+                ["event: stock"] * 4 + ["event: deleted"] * 2,
+            )
+            self.assertIn('"quantity":7', frames[2])
+
+            app.config["EVENTS_BULK_MAX"] = 1
+            self.client.post(f"{BASE_URL}/bulk", json=items)
+            self.assertIn('event: reload\ndata: {"count":2}', subscriber.get(0))
+            self.assertIsNone(subscriber.get(0))
+        finally:
+            app.config["EVENTS_BULK_MAX"] = 100
+            broker.unsubscribe(subscriber)
+
+    # ----------------------------------------------------------
+    # TEST ALERTS
+    # ----------------------------------------------------------
+    def test_low_stock_alert_is_rolled_up(self):
+        """It should keep one open alert per product and resolve it on restock"""
+        item = InventoryFactory(quantity=10, restock_level=5)
+        created = self.client.post(BASE_URL, json=item.serialize()).get_json()
+        url = f"{BASE_URL}/{created['id']}/restock_check"
+
+        self.client.put(url, json={"quantity": 3})
+        self.client.put(url, json={"quantity": 2})
+        alerts = self.client.get(f"/alerts?product_id={created['id']}").get_json()
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]["occurrences"], 2)
+        self.assertIn("has quantity 2", alerts[0]["message"])
+        self.assertIsNone(alerts[0]["resolved_at"])
+
+        # restocking resolves it, and the next shortage opens a new one
+        self.client.put(url, json={"quantity": 8})
+        self.client.post(f"{url[:-len('restock_check')]}adjust", json={"delta": -7})
+        alerts = self.client.get(f"/alerts?product_id={created['id']}").get_json()
+        self.assertEqual(len(alerts), 2)
+        self.assertIsNotNone(alerts[0]["resolved_at"])
+        self.assertIsNone(alerts[1]["resolved_at"])
+        self.assertEqual(len(self.client.get("/alerts?open=true").get_json()), 1)
+        self.assertEqual(len(self.client.get("/alerts?open=false").get_json()), 1)
+
+    def test_list_alerts_paged(self):
+        """It should page through alerts and filter them by time"""
+        for _ in range(3):
+            item = InventoryFactory(quantity=10, restock_level=5)
+            created = self.client.post(BASE_URL, json=item.serialize()).get_json()
+            self.client.put(
+                f"{BASE_URL}/{created['id']}/restock_check", json={"quantity": 1}
+            )
+
+        response = self.client.get("/alerts?limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 2)
+        cursor = response.headers.get("X-Next-Cursor")
+        self.assertEqual(cursor, str(data[-1]["id"]))
+        response = self.client.get(f"/alerts?limit=2&after={cursor}")
+        self.assertEqual(len(response.get_json()), 1)
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+        created_at = data[1]["created_at"]
+        since = self.client.get(f"/alerts?since={created_at}").get_json()
+        self.assertEqual([alert["id"] for alert in since][0], data[1]["id"])
+        until = self.client.get(f"/alerts?until={created_at}").get_json()
+        self.assertEqual([alert["id"] for alert in until], [data[0]["id"]])
+
+    # ----------------------------------------------------------
+    # TEST READINESS
+    # ----------------------------------------------------------
+    def test_ready(self):
+        """It should be ready once the schema can be read"""
+        response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["status"], "READY")
+        self.assertTrue(data["checks"]["database"]["ok"])
+        self.assertTrue(data["checks"]["pool"]["ok"])
+
+    def test_not_ready(self):
+        """It should not be ready while the database can't be read"""
+        with patch.object(Inventory, "latest_revision_query", side_effect=Exception("no such table")):
+            response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        data = response.get_json()
+        self.assertEqual(data["status"], "NOT READY")
+        self.assertEqual(data["checks"]["database"], {"ok": False, "error": "no such table"})
+        # the liveness checks only say the process is up
+        self.assertEqual(self.client.get("/health").status_code, status.HTTP_200_OK)
+        response = self.client.get("/health/live")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"status": "OK"})
+
+    def test_list_alerts_bad_time(self):
+        """It should not list alerts with a malformed time filter"""
+        response = self.client.get("/alerts?since=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,148 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the JSON Serializers
+"""
+
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import TestCase
+from flask import Flask
+from sqlalchemy import Boolean, Column, Date, DateTime, Integer, Numeric, String
+from service.common.serializers import JSONProvider, RowSerializer
+from service.models import Alert, Inventory, INVENTORY_JSON, ALERT_JSON
+from .factories import InventoryFactory
+
+
+class Row:  # pylint: disable=too-few-public-methods
+    """Stand-in for a result row"""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+######################################################################
+#  S E R I A L I Z E R   T E S T   C A S E S
+######################################################################
+class TestJSONProvider(TestCase):
+    """Test Cases for the JSON provider"""
+
+    def test_encoders_agree(self):
+        """It should encode the same JSON with orjson and the stdlib"""
+        data = {
+            "name": "café",
+            "count": 3,
+            "when": datetime(2024, 1, 2, 3, 4, 5),
+            "price": Decimal("1.50"),
+            1: [True, None],
+        }
+        fast = JSONProvider(Flask(__name__), "orjson")
+        slow = JSONProvider(Flask(__name__), "stdlib")
+        self.assertFalse(slow.use_orjson)
+        self.assertEqual(fast.loads(fast.dumps(data)), slow.loads(slow.dumps(data)))
+        self.assertEqual(
+            fast.loads(fast.dumps(data, indent=2)), json.loads(slow.dumps(data))
+        )
+        self.assertEqual(fast.loads(b"[1]", parse_int=str), ["1"])
+
+    def test_jsonify(self):
+        """It should be used by jsonify()"""
+        app = Flask(__name__)
+        app.json = JSONProvider(app)
+        with app.app_context():
+            response = app.json.response({"b": 1, "a": 2})
+        self.assertEqual(response.get_data(as_text=True), '{"b":1,"a":2}\n')
+
+    def test_unknown_encoder(self):
+        """It should reject an unknown JSON_ENCODER"""
+        self.assertRaises(ValueError, JSONProvider, Flask(__name__), "simplejson")
+
+
+class TestRowSerializer(TestCase):
+    """Test Cases for the compiled row serializers"""
+
+    def test_inventory_matches_serialize(self):
+        """It should encode an Inventory exactly like serialize()"""
+        inventory = InventoryFactory(name='Say "hi" \\ 100%', revision=3)
+        self.assertEqual(json.loads(INVENTORY_JSON(inventory)), inventory.serialize())
+        items = InventoryFactory.build_batch(3)
+        self.assertEqual(
+            json.loads(INVENTORY_JSON.many(items)), [item.serialize() for item in items]
+        )
+        self.assertEqual(INVENTORY_JSON.many([]), b"[]")
+
+    def test_encoders_agree(self):
+        """It should encode the same arrays with orjson and the template"""
+        fast = RowSerializer.for_model(Inventory, exclude=("updated_at",))
+        slow = RowSerializer.for_model(Inventory, exclude=("updated_at",), use_orjson=False)
+        self.assertTrue(fast.use_orjson)
+        items = InventoryFactory.build_batch(3, name="café")
+        self.assertEqual(fast.many(items), slow.many(items).decode("unicode_escape").encode())
+        rows = [
+            namedtuple("Row", fast.names)(*(getattr(item, name) for name in fast.names))
+            for item in items
+        ]
+        rows[0] = rows[0]._replace(name="x")
+        self.assertEqual(json.loads(fast.many(rows)), json.loads(slow.many(rows)))
+        self.assertEqual(json.loads(fast.many(rows)), [fast.values(item) for item in rows])
+        mixed = [(fast, rows[0]), (ALERT_JSON, Alert(id=1, product_id=2, message="Low"))]
+        self.assertEqual(
+            json.loads(RowSerializer.mixed(mixed)),
+            [fast.values(rows[0]), ALERT_JSON.values(mixed[1][1])],
+        )
+        self.assertEqual(json.loads(RowSerializer.mixed([(slow, rows[0])])), [slow.values(rows[0])])
+
+    def test_alert_matches_serialize(self):
+        """It should encode an Alert exactly like serialize()"""
+        alert = Alert(
+            id=1, product_id=2, message="Low", created_at=datetime(2024, 5, 6, 7, 8)
+        )
+        self.assertEqual(json.loads(ALERT_JSON(alert)), alert.serialize())
+
+    def test_column_types(self):
+        """It should encode every kind of column, including nulls"""
+        serializer = RowSerializer(
+            [
+                Column("flag", Boolean),
+                Column("day", Date),
+                Column("price", Numeric),
+                Column("count", Integer),
+                Column("text", String),
+            ]
+        )
+        row = Row(flag=False, day=date(2024, 1, 2), price=None, count=None, text="é")
+        self.assertEqual(
+            json.loads(serializer(row)),
+            {
+                "flag": False,
+                "day": "2024-01-02",
+                "price": None,
+                "count": None,
+                "text": "é",
+            },
+        )
+        row = Row(flag=True, day=None, price=2, count=7, text=None)
+        self.assertEqual(
+            json.loads(serializer(row)),
+            {"flag": True, "day": None, "price": 2, "count": 7, "text": None},
+        )
+        self.assertEqual(RowSerializer([Column("id", Integer)])(Row(id=4)), '{"id":4}')
+        self.assertEqual(
+            RowSerializer([Column("at", DateTime)])(Row(at=None)), '{"at":null}'
+        )